@@ -1,3 +1,33 @@
 from django.contrib import admin
 
-# Register your models here.
+from products.pagination import EstimatedCountPaginator
+from .middleware import tracked_views
+from .models import Event
+
+
+class NameFilter(admin.SimpleListFilter):
+    # fixed choices: listing the names in the table would be a DISTINCT over all events
+    title = 'event'
+    parameter_name = 'name'
+
+    def lookups(self, request, model_admin):
+        return [(name, name) for name in sorted({*tracked_views().values(), 'search'})]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(name=self.value()) if self.value() else queryset
+
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'created_at', 'user_id', 'visitor', 'path')
+    list_filter = (NameFilter,)
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
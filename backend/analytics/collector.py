@@ -0,0 +1,232 @@
+"""
+In-process analytics event collector.
+
+``track()`` (and AnalyticsMiddleware, which calls it) only appends the event
+to an in-memory buffer; a background thread per worker process writes the
+buffer out in batches of ANALYTICS_BATCH_SIZE, as soon as a batch is full or
+every ANALYTICS_FLUSH_SECONDS, to the ANALYTICS_SINK:
+
+- "db": Event rows with one bulk_create per batch;
+- "file": JSON Lines appended to one file per day in ANALYTICS_FILE_DIR;
+- "off": nothing is collected.
+
+Analytics must never slow a request down, so there is backpressure instead
+of blocking: when the buffer holds ANALYTICS_BUFFER_SIZE events (the sink is
+slow or down), new events are dropped and counted. A batch the sink fails to
+write is dropped and counted as well. The counters (analytics.tracked,
+.dropped, .flushed, .flush_errors) are in bookbazaar.metrics.
+
+Events still buffered when a process exits are flushed from an atexit hook;
+a killed process loses at most its current buffer.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import empty
+
+from bookbazaar import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ---- sinks ----
+
+class DatabaseSink:
+    def write(self, events):
+        from .models import Event
+        close_old_connections()
+        Event.objects.bulk_create([Event(**event) for event in events])
+
+
+class FileSink:
+    """Appends each batch to <directory>/events-YYYY-MM-DD.jsonl (by event date, UTC)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, events):
+        os.makedirs(self.directory, exist_ok=True)
+        by_day = {}
+        for event in events:
+            by_day.setdefault(event['created_at'].date(), []).append(event)
+        for day, batch in by_day.items():
+            lines = ''.join(json.dumps(event, cls=DjangoJSONEncoder) + '\n' for event in batch)
+            # one write per batch, so concurrent workers' lines don't interleave
+            with open(os.path.join(self.directory, f'events-{day:%Y-%m-%d}.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+
+def build_sink(kind=None):
+    kind = kind or _setting('ANALYTICS_SINK', 'db')
+    if kind == 'db':
+        return DatabaseSink()
+    if kind == 'file':
+        return FileSink(str(_setting('ANALYTICS_FILE_DIR', 'analytics_events')))
+    return None
+
+
+# ---- collector ----
+
+class Collector:
+    def __init__(self, sink, buffer_size=10000, batch_size=500, flush_seconds=2.0):
+        self.sink = sink
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, event):
+        """Buffer one event; returns False (and counts it) if the buffer is full."""
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                dropped = True
+            else:
+                self._buffer.append(event)
+                dropped = False
+                full_batch = len(self._buffer) >= self.batch_size
+                if self._thread is None:
+                    self._start()
+        if dropped:
+            metrics.incr('analytics.dropped')
+            return False
+        metrics.incr('analytics.tracked')
+        if full_batch:
+            self._wake.set()
+        return True
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+    def flush(self):
+        """Write out everything buffered so far; returns the number of events written."""
+        written = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                return written
+            start = time.perf_counter()
+            try:
+                self.sink.write(batch)
+            except Exception:
+                metrics.incr('analytics.flush_errors')
+                metrics.incr('analytics.dropped', len(batch))
+                logger.warning("Dropped %d analytics events: the sink failed", len(batch), exc_info=True)
+                continue
+            finally:
+                metrics.observe('analytics.flush', time.perf_counter() - start)
+            metrics.incr('analytics.flushed', len(batch))
+            written += len(batch)
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def close(self, timeout=5.0):
+        """Stop the flusher thread and flush what is left."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+
+_collector_lock = threading.Lock()
+_collector = None
+_collector_pid = None
+
+
+def get_collector():
+    """The process-wide collector (a new one after a fork: the flusher thread doesn't survive it); None when off."""
+    global _collector, _collector_pid
+    pid = os.getpid()
+    if _collector_pid != pid:
+        with _collector_lock:
+            if _collector_pid != pid:
+                sink = build_sink()
+                _collector = sink and Collector(
+                    sink,
+                    buffer_size=_setting('ANALYTICS_BUFFER_SIZE', 10000),
+                    batch_size=_setting('ANALYTICS_BATCH_SIZE', 500),
+                    flush_seconds=_setting('ANALYTICS_FLUSH_SECONDS', 2.0),
+                )
+                _collector_pid = pid
+    return _collector
+
+
+def reset_collector():
+    """Flush and discard this process's collector (settings changed, tests)."""
+    global _collector, _collector_pid
+    with _collector_lock:
+        if _collector is not None and _collector_pid == os.getpid():
+            _collector.close()
+        _collector = _collector_pid = None
+
+
+atexit.register(reset_collector)
+
+
+@receiver(setting_changed)
+def _settings_changed(setting, **kwargs):
+    if setting.startswith('ANALYTICS_'):
+        reset_collector()
+
+
+def track(name, request=None, **properties):
+    """
+    Record event ``name`` with JSON-serializable ``properties``; cheap and
+    never blocks or raises. With ``request`` the path, user and visitor are
+    taken from it without touching the session or user tables.
+    """
+    collector = get_collector()
+    if collector is None:
+        return False
+    event = {'name': name[:50], 'created_at': timezone.now(), 'user_id': None, 'visitor': '', 'path': '',
+             'properties': properties}
+    if request is not None:
+        event.update(path=request.path[:300], user_id=_user_id(request), visitor=_visitor(request))
+    return collector.add(event)
+
+
+def _user_id(request):
+    # only if authentication already ran for this request: loading the user here would cost queries
+    user = getattr(request, 'user', None)
+    user = getattr(user, '_wrapped', user)
+    if user is None or user is empty or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def _visitor(request):
+    key = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16] if key else ''
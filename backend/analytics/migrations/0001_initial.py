@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('visitor', models.CharField(blank=True, default='', max_length=16)),
+                ('path', models.CharField(blank=True, default='', max_length=300)),
+                ('properties', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'created_at'], name='analytics_event_name_idx'), models.Index(fields=['created_at'], name='analytics_event_created_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,24 @@
 from django.db import models
 
-# Create your models here.
+
+class Event(models.Model):
+    """
+    One analytics event (product view, search, add to cart, checkout...).
+    Written in batches by analytics.collector, never during a request.
+    """
+    name = models.CharField(max_length=50)
+    created_at = models.DateTimeField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    # a hash of the session cookie, so anonymous visits can be grouped
+    visitor = models.CharField(max_length=16, blank=True, default='')
+    path = models.CharField(max_length=300, blank=True, default='')
+    properties = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'created_at'], name='analytics_event_name_idx'),
+            models.Index(fields=['created_at'], name='analytics_event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} at {self.created_at:%Y-%m-%d %H:%M:%S}"
@@ -1,3 +1,72 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from products.models import Book
+from . import collector
+
+
+class ListSink:
+    def __init__(self):
+        self.events = []
+
+    def write(self, events):
+        self.events += events
+
+
+class MiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.create(title='Dune', slug='dune', price=399, stock=5)
+
+    def setUp(self):
+        self.sink = ListSink()
+        patcher = mock.patch.object(collector, 'build_sink', return_value=self.sink)
+        patcher.start()
+        collector.reset_collector()
+        self.addCleanup(collector.reset_collector)
+        self.addCleanup(patcher.stop)
+
+    def events(self):
+        collector.get_collector().flush()
+        return [(e['name'], e['properties']) for e in self.sink.events]
+
+    def test_list_and_search_tracked_under_every_route(self):
+        for namespace in ('products', 'products_api'):
+            url = reverse(f'{namespace}:api-book-list')
+            self.client.get(url)
+            self.client.get(url, {'q': 'dune'})
+        self.client.get(reverse('products:product-list'), {'q': 'dune'})
+        self.assertEqual(self.events(), [
+            ('product_list', {}), ('search', {'q': 'dune'}),
+            ('product_list', {}), ('search', {'q': 'dune'}),
+            ('search', {'q': 'dune'}),
+        ])
+
+    def test_detail_and_add_to_cart(self):
+        self.client.get(reverse('products:product-detail', args=['dune']))
+        self.client.post(reverse('product_cart:add_to_cart'), {'slug': 'dune'})
+        self.client.get(reverse('products:product-detail', args=['missing']))
+        self.assertEqual(self.events(), [('product_view', {'slug': 'dune'}), ('add_to_cart', {'slug': 'dune'})])
+
+
+class CollectorTests(TestCase):
+    def test_full_buffer_drops_instead_of_blocking(self):
+        buffer = collector.Collector(ListSink(), buffer_size=3, batch_size=10, flush_seconds=60)
+        accepted = [buffer.add({'name': 'x'}) for _ in range(5)]
+        self.assertEqual(accepted, [True, True, True, False, False])
+        buffer.close()
+
+    def test_failed_batch_is_dropped(self):
+        class Broken:
+            def write(self, events):
+                raise RuntimeError('sink down')
 
-# Create your tests here.
+        buffer = collector.Collector(Broken(), batch_size=10, flush_seconds=60)
+        for _ in range(3):
+            buffer.add({'name': 'x'})
+        with self.assertLogs('analytics.collector', 'WARNING'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(), 0)
+        buffer.close()
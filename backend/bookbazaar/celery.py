@@ -0,0 +1,16 @@
+"""
+Celery app, used when PAYMENT_QUEUE_BACKEND = "celery".
+
+    celery -A bookbazaar worker
+
+celery is not in requirements.txt; install it (with redis) where this backend is used.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookbazaar.settings')
+
+app = Celery('bookbazaar')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks(['payments'])
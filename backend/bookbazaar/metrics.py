@@ -0,0 +1,56 @@
+"""
+Minimal in-process metrics: counters and timers.
+
+Values are per worker process (gunicorn runs several); the /metrics/ view
+reports the process that served it along with its pid.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Record one duration (in seconds) for timer ``name``."""
+    with _lock:
+        stats = _timers.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    with _lock:
+        timers = {
+            name: {
+                'count': s['count'],
+                'avg_ms': round(s['total'] / s['count'] * 1000, 3) if s['count'] else 0.0,
+                'max_ms': round(s['max'] * 1000, 3),
+            }
+            for name, s in _timers.items()
+        }
+        return {'pid': os.getpid(), 'counters': dict(_counters), 'timers': timers}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
@@ -0,0 +1,110 @@
+"""
+SQL query budgets.
+
+Views declare how many queries a request may run, either with the
+``@query_budget(n)`` decorator (function views) or a ``query_budget = n``
+class attribute (class-based / DRF views). Views without a declaration get
+QUERY_BUDGET_DEFAULT, which covers the admin.
+
+QueryBudgetMiddleware only runs with DEBUG on. QUERY_BUDGET_MODE selects what
+happens when a request goes over budget: "warn" logs it, "raise" raises
+QueryBudgetExceeded, "off" disables the middleware. Every checked response
+gets an X-Query-Count header.
+
+In tests, wrap the code under test in ``assert_max_queries(n)``.
+"""
+import functools
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Declare the maximum number of SQL queries a function view may run."""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+def get_view_budget(view_func):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        # admin views are wrapped by the site; look through the wrappers
+        wrapped = getattr(view_func, '__wrapped__', None)
+        if wrapped is not None:
+            return get_view_budget(wrapped)
+    return budget
+
+
+@contextmanager
+def assert_max_queries(limit, using=None):
+    """
+    Fail if the block runs more than ``limit`` queries on ``using`` (or on any
+    configured database when omitted). Intended for tests.
+    """
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[a])) for a in aliases]
+        yield
+    executed = [q['sql'] for ctx in contexts for q in ctx.captured_queries]
+    if len(executed) > limit:
+        listing = '\n'.join(f'{i}. {sql}' for i, sql in enumerate(executed, 1))
+        raise QueryBudgetExceeded(f"{len(executed)} queries executed, budget is {limit}:\n{listing}")
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+        if not settings.DEBUG or self.mode == 'off':
+            raise MiddlewareNotUsed()
+        self.default = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        request._query_budget = self.default
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(counter.count)
+        budget = request._query_budget
+        if budget is not None and counter.count > budget:
+            message = f"{request.method} {request.path} ran {counter.count} SQL queries (budget {budget})"
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = get_view_budget(view_func)
+        if budget is not None:
+            request._query_budget = budget
+        return None
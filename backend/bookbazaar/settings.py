@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "bookbazaar.querybudget.QueryBudgetMiddleware",     # DEBUG only; counts SQL per request
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -49,6 +50,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "products.cart.CartMiddleware",                     # request.cart (see CART_STORE_BACKEND)
+    "analytics.middleware.AnalyticsMiddleware",         # buffered events (see ANALYTICS_SINK)
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -132,16 +135,110 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Listing result counts: "exact" runs COUNT(*); "estimate" is exact below the
+# threshold and uses the query planner's estimate above it (cached per query)
+RESULT_COUNT_STRATEGY = os.getenv("RESULT_COUNT_STRATEGY", "exact")
+RESULT_COUNT_EXACT_THRESHOLD = int(os.getenv("RESULT_COUNT_EXACT_THRESHOLD", "1000"))
+RESULT_COUNT_CACHE_TTL = int(os.getenv("RESULT_COUNT_CACHE_TTL", "300"))
+
+# Rendered product list fragments are cached under the catalog version
+# (bumped on any Book/Category change); the TTL only bounds memory use
+CATALOG_PAGE_CACHE_TTL = int(os.getenv("CATALOG_PAGE_CACHE_TTL", "600"))
+# Cache-Control max-age for the product list page (0 = no header); it renders
+# identically for every visitor, so shared caches/CDNs may store it
+CATALOG_PAGE_MAX_AGE = int(os.getenv("CATALOG_PAGE_MAX_AGE", "0"))
+
+# Book objects for the detail page/API: per-process LRU in front of the cache
+BOOK_CACHE_LRU_SIZE = int(os.getenv("BOOK_CACHE_LRU_SIZE", "512"))
+BOOK_CACHE_TTL = int(os.getenv("BOOK_CACHE_TTL", "300"))
+BOOK_NEGATIVE_CACHE_TTL = int(os.getenv("BOOK_NEGATIVE_CACHE_TTL", "60"))
+
+# Typeahead suggestions (in-memory prefix index per worker process)
+AUTOCOMPLETE_RESULTS = int(os.getenv("AUTOCOMPLETE_RESULTS", "10"))
+AUTOCOMPLETE_REFRESH_SECONDS = int(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", "900"))
+
+# Cart storage: "db" (Cart/CartItem tables), "kv" (Redis hash per cart, or an
+# in-memory stand-in when CART_REDIS_URL is empty) or "session" (legacy)
+CART_STORE_BACKEND = os.getenv("CART_STORE_BACKEND", "db")
+CART_REDIS_URL = os.getenv("CART_REDIS_URL", "")
+CART_COOKIE_NAME = "cart_id"
+CART_SUMMARY_COOKIE_NAME = "cart_summary"
+CART_TTL = int(os.getenv("CART_TTL", str(60 * 60 * 24 * 30)))
+# Priced carts are cached per cart contents + catalog version
+CART_PRICE_CACHE_TTL = int(os.getenv("CART_PRICE_CACHE_TTL", "300"))
+
+# Stock is held for unpaid orders this long before release_expired_holds frees it
+STOCK_HOLD_SECONDS = int(os.getenv("STOCK_HOLD_SECONDS", "900"))
+
+# Shortest word MySQL's full-text index holds (innodb_ft_min_token_size, or
+# ft_min_word_len for MyISAM); shorter search terms are ignored there
+SEARCH_MYSQL_MIN_TOKEN_SIZE = int(os.getenv("SEARCH_MYSQL_MIN_TOKEN_SIZE", "3"))
+
+# Repeated create_order submissions within this many seconds return the first
+# order (orders.idempotency); a duplicate arriving while the first is still
+# running waits only CHECKOUT_IDEMPOTENCY_WAIT seconds (keep it well under one:
+# the worker is blocked meanwhile) before getting a page that polls for it
+CHECKOUT_IDEMPOTENCY_TTL = int(os.getenv("CHECKOUT_IDEMPOTENCY_TTL", "900"))
+CHECKOUT_IDEMPOTENCY_WAIT = float(os.getenv("CHECKOUT_IDEMPOTENCY_WAIT", "0.3"))
+
+# Longest date range (days) one /orders/export/ download may cover; a streaming
+# download holds a web worker, so bigger exports go through `manage.py export_orders`
+ORDER_EXPORT_MAX_DAYS = int(os.getenv("ORDER_EXPORT_MAX_DAYS", "31"))
+
+# Shipped/cancelled orders older than this many days are moved to the archive
+# tables by `manage.py archive_orders` (orders.archive)
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "365"))
+
+# Analytics events (analytics.collector) are buffered in memory and written by a
+# background thread in batches of ANALYTICS_BATCH_SIZE, or every
+# ANALYTICS_FLUSH_SECONDS. ANALYTICS_SINK: "db" (Event rows), "file" (JSON Lines
+# per day in ANALYTICS_FILE_DIR) or "off". Events past ANALYTICS_BUFFER_SIZE are dropped.
+ANALYTICS_SINK = os.getenv("ANALYTICS_SINK", "db")
+ANALYTICS_FILE_DIR = os.getenv("ANALYTICS_FILE_DIR", str(BASE_DIR / "analytics_events"))
+ANALYTICS_BUFFER_SIZE = int(os.getenv("ANALYTICS_BUFFER_SIZE", "10000"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "2"))
+
+# Per-view SQL query budgets (DEBUG only): "warn", "raise" or "off".
+# Views without their own budget (including the admin) get the default.
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn")
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "50"))
+
 # CORS - allow local dev origins
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Razorpay keys — available for views
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
+# Gateway API root; point it at `manage.py fake_payment_gateway` for offline load tests
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL", "https://api.razorpay.com")
+
+# Payment gateway client (payments.gateway): timeouts in seconds, retries per call,
+# keep-alive pool size per worker, and the circuit breaker (consecutive failures to
+# open it, seconds before a trial call is let through)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_CONNECT_TIMEOUT", "3.05"))
+PAYMENT_GATEWAY_READ_TIMEOUT = float(os.getenv("PAYMENT_GATEWAY_READ_TIMEOUT", "10"))
+PAYMENT_GATEWAY_MAX_RETRIES = int(os.getenv("PAYMENT_GATEWAY_MAX_RETRIES", "2"))
+PAYMENT_GATEWAY_BACKOFF = float(os.getenv("PAYMENT_GATEWAY_BACKOFF", "0.2"))
+PAYMENT_GATEWAY_POOL_SIZE = int(os.getenv("PAYMENT_GATEWAY_POOL_SIZE", "10"))
+PAYMENT_GATEWAY_BREAKER_FAILURES = int(os.getenv("PAYMENT_GATEWAY_BREAKER_FAILURES", "5"))
+PAYMENT_GATEWAY_BREAKER_RESET_SECONDS = float(os.getenv("PAYMENT_GATEWAY_BREAKER_RESET_SECONDS", "30"))
 
 # Celery / Redis (used by celery config later)
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
 
+# Secret configured for the gateway webhook (payments/webhook/)
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
+
+# Payment capture queue (payments.jobs): "db" (run_payment_worker polls the
+# CaptureJob table) or "celery" (jobs are also sent to CELERY_BROKER_URL).
+# Failed captures are retried with exponential backoff from PAYMENT_JOB_RETRY_SECONDS;
+# a claimed job is leased to its worker for PAYMENT_JOB_LEASE_SECONDS
+PAYMENT_QUEUE_BACKEND = os.getenv("PAYMENT_QUEUE_BACKEND", "db")
+PAYMENT_JOB_MAX_ATTEMPTS = int(os.getenv("PAYMENT_JOB_MAX_ATTEMPTS", "8"))
+PAYMENT_JOB_RETRY_SECONDS = int(os.getenv("PAYMENT_JOB_RETRY_SECONDS", "10"))
+PAYMENT_JOB_LEASE_SECONDS = int(os.getenv("PAYMENT_JOB_LEASE_SECONDS", "120"))
+
 # Logging (simple dev logging)
 LOGGING = {
     "version": 1,
@@ -2,11 +2,12 @@
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import index
+from .views import index, metrics_view
 
 urlpatterns = [
     path('', index, name='home'),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
 
     # frontend product pages
     path('books/', include(('products.urls', 'products'), namespace='products')),
@@ -19,6 +20,9 @@ urlpatterns = [
 
     # orders (checkout flow)
     path('orders/', include(('orders.urls', 'orders'), namespace='orders')),
+
+    # payment gateway webhook
+    path('payments/', include(('payments.urls', 'payments'), namespace='payments')),
 ]
 
 # Serve static and media files in development
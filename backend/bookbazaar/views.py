@@ -1,4 +1,14 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import metrics
+
+
 def index(request):
     return render(request, "home.html")
+
+
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
@@ -1,13 +1,163 @@
-﻿from django.contrib import admin
-from .models import Order, OrderItem
+﻿import datetime
+
+from django.contrib import admin, messages
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.utils import timezone
+from products.pagination import EstimatedCountPaginator
+from . import inventory, states
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, OrderStatusLog, StockHold
+
+# order lines shown on the order page; the list shows how many there are in all
+INLINE_ITEMS = 50
+
+class OrderItemFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        if not hasattr(self, '_limited'):
+            self._limited = super().get_queryset()[:INLINE_ITEMS]
+        return self._limited
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
+    formset = OrderItemFormSet
     readonly_fields = ('title','price','quantity','subtotal')
     extra = 0
 
+class OrderStatusLogInline(admin.TabularInline):
+    model = OrderStatusLog
+    readonly_fields = ('from_status','to_status','reason','created_at')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+def _move(modeladmin, request, queryset, target, reason, then=None):
+    moved = skipped = 0
+    for order in queryset.only('id', 'status'):
+        try:
+            if states.transition(order, target, reason):
+                moved += 1
+                if then is not None:
+                    then(order)
+        except states.InvalidTransition:
+            skipped += 1
+    modeladmin.message_user(request, f"{moved} orders marked {target}.")
+    if skipped:
+        modeladmin.message_user(request, f"{skipped} orders skipped: they can't become {target}.", messages.WARNING)
+
+@admin.action(description="Mark selected orders as shipped")
+def mark_shipped(modeladmin, request, queryset):
+    _move(modeladmin, request, queryset, Order.SHIPPED, f'shipped by {request.user}')
+
+@admin.action(description="Cancel selected orders (gives back held stock; refund paid ones at the gateway)")
+def cancel_orders(modeladmin, request, queryset):
+    queryset = queryset.exclude(status__in=[Order.SHIPPED, Order.CANCELLED])
+    _move(modeladmin, request, queryset, Order.CANCELLED, f'cancelled by {request.user}', then=inventory.release)
+
+def _month_start(year, month):
+    return timezone.make_aware(datetime.datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1))
+
+class CreatedFilter(admin.SimpleListFilter):
+    """
+    Year -> month drill-down on created_at. Unlike date_hierarchy it never
+    runs SELECT DISTINCT over the table: the choices come from the first and
+    last order (two single-row index reads) and each choice is a created_at range.
+    """
+    title = 'created'
+    parameter_name = 'created'
+
+    def _span(self):
+        value = self.value() or ''
+        try:
+            parts = [int(p) for p in value.split('-')]
+            if len(parts) == 1:
+                return _month_start(parts[0], 1), _month_start(parts[0] + 1, 1)
+            if len(parts) == 2 and 1 <= parts[1] <= 12:
+                return _month_start(*parts), _month_start(parts[0], parts[1] + 1)
+        except (ValueError, OverflowError):
+            pass
+        return None
+
+    def lookups(self, request, model_admin):
+        dates = model_admin.model._default_manager.values_list('created_at', flat=True)
+        first, last = dates.order_by('created_at').first(), dates.order_by('-created_at').first()
+        if first is None:
+            return []
+        first, last = timezone.localtime(first), timezone.localtime(last)
+        choices = [(str(y), str(y)) for y in range(last.year, first.year - 1, -1)]
+        year = (self.value() or '').split('-')[0]
+        if year.isdigit() and first.year <= int(year) <= last.year:
+            year = int(year)
+            months = [m for m in range(12, 0, -1) if (first.year, first.month) <= (year, m) <= (last.year, last.month)]
+            at = choices.index((str(year), str(year))) + 1
+            choices[at:at] = [(f'{year}-{m:02d}', f'\u2003{_month_start(year, m):%B %Y}') for m in months]
+        return choices
+
+    def queryset(self, request, queryset):
+        span = self._span()
+        if span is None:
+            return queryset
+        return queryset.filter(created_at__gte=span[0], created_at__lt=span[1])
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id','full_name','email','created_at','status','total')
-    list_filter = ('status','created_at')
-    inlines = [OrderItemInline]
+    list_display = ('id','full_name','email','created_at','status','total','item_count')
+    list_filter = ('status', CreatedFilter)
+    # every list query is served by orders_created_idx / orders_status_created_idx
+    ordering = ('-created_at','-id')
+    sortable_by = ('id','created_at')
+    # exact counts of millions of rows are the slow part of the list page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user',)
+    # status changes go through orders.states (see the actions)
+    readonly_fields = ('status',)
+    inlines = [OrderItemInline, OrderStatusLogInline]
+    actions = [mark_shipped, cancel_orders]
+
+    def get_queryset(self, request):
+        # a correlated count, so it is only computed for the rows on the page
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(n=Count('pk')).values('n')
+        return super().get_queryset(request).annotate(item_count=Coalesce(Subquery(items, output_field=IntegerField()), 0))
+
+    @admin.display(description='Items')
+    def item_count(self, obj):
+        return obj.item_count
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('id','order','book','quantity','status','expires_at')
+    list_filter = ('status',)
+    raw_id_fields = ('order','book')
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    formset = OrderItemFormSet
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only: archived orders are final (see orders.archive)."""
+    list_display = ('id','full_name','email','created_at','status','total','archived_at')
+    list_filter = ('status', CreatedFilter)
+    ordering = ('-created_at','-id')
+    sortable_by = ('id','created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user',)
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
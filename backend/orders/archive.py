@@ -0,0 +1,98 @@
+"""
+Order archival.
+
+Orders that are final (shipped or cancelled) and older than
+ORDER_ARCHIVE_AFTER_DAYS move from Order/OrderItem to ArchivedOrder/
+ArchivedOrderItem, keeping their ids, so the tables that checkout, the admin
+and reports hit stay sized to recent activity. Paid-but-unshipped orders are
+never archived: only orders that can't change any more leave the hot tables.
+
+``archive()`` works in batches of ``batch_size`` orders, each in its own
+short transaction (copy, then delete the originals with their items, status
+log, holds and capture jobs), so locks are held for one batch at a time.
+
+Reads go through ``get_order()``, ``history()`` and orders.export, which
+look in both places.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from bookbazaar import metrics
+from products.pagination import MergedKeysetPaginator
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+FINAL = (Order.SHIPPED, Order.CANCELLED)
+ORDER_FIELDS = ('id', 'user_id', 'full_name', 'email', 'address', 'created_at', 'status', 'total',
+                'razorpay_order_id', 'razorpay_payment_id')
+ITEM_FIELDS = ('id', 'order_id', 'product_id', 'title', 'price', 'quantity', 'subtotal')
+
+
+def cutoff(now=None, days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return (now or timezone.now()) - datetime.timedelta(days=days)
+
+
+def archivable(before):
+    return Order.objects.filter(status__in=FINAL, created_at__lt=before)
+
+
+def archive_batch(before, batch_size=500):
+    """Archive up to ``batch_size`` of the oldest archivable orders; returns how many moved."""
+    with transaction.atomic():
+        orders = list(archivable(before).order_by('created_at', 'id')
+                      .prefetch_related('items', 'status_log')[:batch_size])
+        if not orders:
+            return 0
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(**{f: getattr(o, f) for f in ORDER_FIELDS}, status_log=[
+                {'from': log.from_status, 'to': log.to_status, 'reason': log.reason,
+                 'at': log.created_at.isoformat()} for log in o.status_log.all()
+            ]) for o in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**{f: getattr(item, f) for f in ITEM_FIELDS})
+            for o in orders for item in o.items.all()
+        ], batch_size=1000)
+        # items, status log, holds and capture jobs go with their order (CASCADE)
+        Order.objects.filter(pk__in=[o.pk for o in orders]).delete()
+    metrics.incr('orders.archived', len(orders))
+    return len(orders)
+
+
+def archive(before=None, batch_size=500, pause=0.0, max_batches=None):
+    """Archive every archivable order created before ``before`` (default: cutoff()); returns the count."""
+    before = before or cutoff()
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(before, batch_size)
+        total += moved
+        batches += 1
+        if moved < batch_size:
+            break
+        if pause:
+            time.sleep(pause)   # let other writers in between batches
+    return total
+
+
+# ---- reads ----
+
+def get_order(order_id):
+    """The Order or ArchivedOrder with this id, or None."""
+    return (Order.objects.filter(pk=order_id).first()
+            or ArchivedOrder.objects.filter(pk=order_id).first())
+
+
+def history(user, per_page):
+    """A keyset paginator over the user's live and archived orders, newest first, with their items."""
+    return MergedKeysetPaginator([
+        Order.objects.filter(user=user).order_by('-created_at', '-id')
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.order_by('id'))),
+        ArchivedOrder.objects.filter(user=user).order_by('-created_at', '-id')
+        .prefetch_related(Prefetch('items', queryset=ArchivedOrderItem.objects.order_by('id'))),
+    ], per_page)
@@ -0,0 +1,61 @@
+"""
+Order placement.
+
+place_order() turns a cart into an Order in one transaction. It re-prices
+the cart against current book prices, checks it, inserts the Order, inserts
+all OrderItems with one bulk_create and reserves the stock (orders.inventory);
+the order starts out 'reserved'. If anything fails, nothing is written and
+CheckoutError says why.
+"""
+from django.db import transaction
+
+from products.pricing import price_cart
+from . import inventory, states
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """The cart can't be turned into an order; the message is shown to the customer."""
+
+
+def _validate(priced, expected_total_paise):
+    if not priced:
+        raise CheckoutError("Your cart is empty.")
+    if priced.unavailable:
+        raise CheckoutError("Some books in your cart are no longer available. Please review your cart.")
+    free = [line.title for line in priced if line.unit_paise <= 0]
+    if free:
+        raise CheckoutError(f"{free[0]} can't be ordered right now.")
+    if expected_total_paise is not None and expected_total_paise != priced.total_paise:
+        raise CheckoutError("Prices in your cart have changed. Please review your order and try again.")
+
+
+def place_order(cart, full_name='', email='', address='', user=None, expected_total_paise=None):
+    """
+    Create the order for ``cart`` (a products.cart store) and hold its stock.
+    ``expected_total_paise`` is the total the customer was shown; the order is
+    refused if current prices give a different one. Returns (order, priced cart).
+    """
+    with transaction.atomic():
+        priced = price_cart(cart, fresh=True)
+        _validate(priced, expected_total_paise)
+        order = Order.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            full_name=full_name or 'N/A',
+            email=email or 'N/A',
+            address=address or 'N/A',
+            total=priced.total,
+            status=Order.RESERVED,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line.book_id, title=line.title, price=line.price,
+                      quantity=line.quantity, subtotal=line.subtotal)
+            for line in priced
+        ])
+        try:
+            inventory.reserve(order, [(line.book_id, line.quantity) for line in priced])
+        except inventory.OutOfStock as e:
+            title = next((line.title for line in priced if line.book_id == e.book_id), 'A book in your cart')
+            raise CheckoutError(f"{title} is out of stock (or has fewer copies than you asked for).") from e
+        states.log(order, Order.PENDING, Order.RESERVED, 'stock held at checkout')
+    return order, priced
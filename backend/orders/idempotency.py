@@ -0,0 +1,126 @@
+"""
+Checkout idempotency.
+
+create_order claims a CheckoutKey before placing an order. A second
+submission of the same checkout (double click, browser retry) finds the key
+and gets the first order and its gateway order back instead of creating new
+ones. If the first request is still talking to the gateway, the duplicate
+only waits CHECKOUT_IDEMPOTENCY_WAIT seconds (a fraction of one, so it can't
+tie up a worker) and then gets a "still processing" page that polls
+checkout_status with a signed status_token() until the order is there.
+
+The key is the ``Idempotency-Key`` header or the ``idempotency_key`` form
+field (the checkout page renders a fresh one per visit), scoped to the cart.
+Without one it is derived from the cart, its contents and the form. Keys
+live for CHECKOUT_IDEMPOTENCY_TTL seconds.
+
+The keys are rows rather than cache entries: the unique constraint makes
+claiming atomic across all worker processes, which the default per-process
+cache can't.
+"""
+import datetime
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from products.pricing import cart_version
+from .models import CheckoutKey
+
+
+# a key still without an order after this long belongs to a request that died
+PENDING_STALE_SECONDS = 120
+
+TOKEN_SALT = 'orders.idempotency'
+
+
+class StillPending(Exception):
+    """The first request for this key hasn't finished yet."""
+
+
+def checkout_key(request, cart, fields=()):
+    """The idempotency key for this checkout of ``cart``; ``fields`` are the submitted form values."""
+    supplied = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')
+    scope = [cart.key or request.session.session_key or '', getattr(request.user, 'pk', None)]
+    if supplied:
+        material = ['client', *scope, supplied[:200]]
+    else:
+        material = ['cart', *scope, cart_version(cart.lines()), *fields]
+    return hashlib.sha256(json.dumps(material, default=str).encode('utf-8')).hexdigest()
+
+
+def claim(key, now=None):
+    """
+    Try to own ``key``. Returns None if this request now owns it (go on and
+    place the order), otherwise the earlier request's CheckoutKey.
+    """
+    now = now or timezone.now()
+    expires_at = now + datetime.timedelta(seconds=getattr(settings, 'CHECKOUT_IDEMPOTENCY_TTL', 900))
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                CheckoutKey.objects.create(key=key, expires_at=expires_at)
+            return None
+        except IntegrityError:
+            existing = CheckoutKey.objects.filter(key=key).first()
+            if existing is None:
+                continue    # given up in the meantime
+            stale = existing.order_id is None and existing.created_at <= now - datetime.timedelta(seconds=PENDING_STALE_SECONDS)
+            if existing.expires_at > now and not stale:
+                return existing
+            CheckoutKey.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+    return None
+
+
+def wait_for_order(key, timeout=None):
+    """
+    The order placed for ``key`` by another request. Returns None if that
+    request gave the key up (it failed); raises StillPending after ``timeout``.
+    """
+    deadline = time.monotonic() + (getattr(settings, 'CHECKOUT_IDEMPOTENCY_WAIT', 0.3) if timeout is None else timeout)
+    delay = 0.02
+    while True:
+        row = CheckoutKey.objects.filter(key=key).select_related('order').first()
+        if row is None:
+            return None
+        if row.order is not None:
+            return row.order
+        if time.monotonic() >= deadline:
+            raise StillPending(key)
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 0.1)
+
+
+def status_token(key):
+    """A signed token for ``key`` the client can poll checkout_status with."""
+    return signing.dumps(key, salt=TOKEN_SALT)
+
+
+def key_from_token(token):
+    """The key ``token`` was made for, or None if it is forged or older than the key could be."""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=getattr(settings, 'CHECKOUT_IDEMPOTENCY_TTL', 900))
+    except signing.BadSignature:
+        return None
+
+
+def complete(key, order):
+    CheckoutKey.objects.filter(key=key).update(order=order)
+
+
+def abandon(key):
+    """Give the key up so a retry places the order afresh."""
+    CheckoutKey.objects.filter(key=key, order__isnull=True).delete()
+
+
+def forget(key):
+    CheckoutKey.objects.filter(key=key).delete()
+
+
+def purge_expired(now=None):
+    deleted, _ = CheckoutKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
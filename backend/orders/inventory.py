@@ -0,0 +1,193 @@
+"""
+Stock reservation.
+
+``reserve()`` takes stock for an order with a conditional update
+(``UPDATE ... SET stock = stock - n WHERE id = ... AND stock >= n``; one
+statement with a per-book CASE for multi-book carts), so two checkouts can
+never both take the last copy. The stock is recorded as StockHold rows that
+expire after STOCK_HOLD_SECONDS.
+
+- ``commit()`` (on verified payment) makes the holds final.
+- ``release()`` gives an order's held stock back (failed payment, cancel).
+- ``release_expired()`` is the sweeper run by the release_expired_holds
+  command (a cron job in render.yaml, a process in the Procfile) for
+  checkouts that were never paid; their orders are cancelled. An order whose
+  payment is already being captured keeps its status: commit() takes the
+  stock again, or the capture cancels it.
+
+Multi-book reservations lock their rows in id order first so concurrent
+checkouts cannot deadlock.
+
+Stock is part of what the catalog shows, so every stock change also sets the
+books' updated_at and bumps the catalog version once the transaction
+commits (products.cache), like an edit in the admin would.
+"""
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.cache import bump_catalog_version
+from products.models import Book
+from . import states
+from .models import Order, StockHold
+
+
+class OutOfStock(Exception):
+    def __init__(self, book_id, requested):
+        self.book_id = book_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for book {book_id} (wanted {requested})")
+
+
+def hold_seconds():
+    return getattr(settings, 'STOCK_HOLD_SECONDS', 900)
+
+
+def _quantities(lines):
+    wanted = Counter()
+    for book_id, quantity in lines:
+        wanted[book_id] += quantity
+    return sorted(wanted.items())
+
+
+def _stock_changed():
+    transaction.on_commit(bump_catalog_version)
+
+
+def _take(book_id, quantity):
+    taken = Book.objects.filter(pk=book_id, stock__gte=quantity).update(stock=F('stock') - quantity,
+                                                                         updated_at=timezone.now())
+    if not taken:
+        raise OutOfStock(book_id, quantity)
+    _stock_changed()
+
+
+def _update_stock(wanted, sign, conditional):
+    """
+    One ``UPDATE ... SET stock = stock +/- CASE id WHEN ... END`` for several
+    books. Hand-written because the ORM spends far longer compiling a large
+    CASE than the database spends running it. Returns the rows updated.
+    """
+    qn = connection.ops.quote_name
+    table, pk, stock, updated = (qn(Book._meta.db_table), qn(Book._meta.pk.column), qn('stock'),
+                                 qn(Book._meta.get_field('updated_at').column))
+    case = f"CASE {pk} {' '.join(['WHEN %s THEN %s'] * len(wanted))} END"
+    case_params = [value for pair in wanted for value in pair]
+    ids = [book_id for book_id, _ in wanted]
+    sql = (f"UPDATE {table} SET {stock} = {stock} {sign} {case}, {updated} = %s "
+           f"WHERE {pk} IN ({', '.join(['%s'] * len(ids))})")
+    params = case_params + [connection.ops.adapt_datetimefield_value(timezone.now())] + ids
+    if conditional:
+        sql += f" AND {stock} >= {case}"
+        params += case_params
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if cursor.rowcount:
+            _stock_changed()
+        return cursor.rowcount
+
+
+def _take_many(wanted):
+    """
+    Take stock for several books with one conditional UPDATE. The rows are
+    locked in id order first; if any book is short nothing is taken (the
+    caller's transaction rolls back) and OutOfStock names that book.
+    """
+    if len(wanted) == 1:
+        return _take(*wanted[0])
+    ids = [book_id for book_id, _ in wanted]
+    list(Book.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+    if _update_stock(wanted, '-', conditional=True) == len(ids):
+        return
+    stock = dict(Book.objects.filter(pk__in=ids).values_list('pk', 'stock'))
+    for book_id, quantity in wanted:
+        if stock.get(book_id, 0) < quantity:
+            raise OutOfStock(book_id, quantity)
+    raise OutOfStock(*wanted[0])
+
+
+def _give_back(quantities):
+    wanted = sorted(quantities.items())
+    if wanted:
+        _update_stock(wanted, '+', conditional=False)
+
+
+def reserve(order, lines, seconds=None):
+    """
+    Hold stock for ``lines`` of (book_id, quantity). All or nothing: raises
+    OutOfStock (and takes nothing) if any book is short.
+    """
+    expires_at = timezone.now() + datetime.timedelta(seconds=seconds or hold_seconds())
+    wanted = _quantities(lines)
+    with transaction.atomic():
+        _take_many(wanted)
+        return StockHold.objects.bulk_create([
+            StockHold(order=order, book_id=book_id, quantity=quantity, expires_at=expires_at)
+            for book_id, quantity in wanted
+        ])
+
+
+def _release(holds):
+    """Release ``holds`` (a StockHold queryset) that are still held; returns (holds, units)."""
+    with transaction.atomic():
+        rows = list(holds.filter(status=StockHold.HELD).select_for_update().values_list('pk', 'book_id', 'quantity'))
+        if not rows:
+            return 0, 0
+        # only the rows this call flips from held give stock back
+        StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows], status=StockHold.HELD).update(status=StockHold.RELEASED)
+        given = Counter()
+        for _, book_id, quantity in rows:
+            given[book_id] += quantity
+        _give_back(given)
+        return len(rows), sum(given.values())
+
+
+def release(order):
+    """Give back whatever ``order`` still holds; returns (holds, units)."""
+    return _release(StockHold.objects.filter(order=order))
+
+
+def commit(order):
+    """
+    Make an order's holds final. Holds that expired and were released in the
+    meantime are taken again if the stock is still there; raises OutOfStock
+    otherwise.
+    """
+    with transaction.atomic():
+        holds = list(StockHold.objects.filter(order=order).exclude(status=StockHold.COMMITTED)
+                     .select_for_update().order_by('book_id'))
+        for hold in holds:
+            if hold.status == StockHold.RELEASED:
+                _take(hold.book_id, hold.quantity)
+        StockHold.objects.filter(pk__in=[h.pk for h in holds]).update(status=StockHold.COMMITTED)
+    return len(holds)
+
+
+def _cancel_unpaid(order_ids):
+    for order in Order.objects.filter(pk__in=order_ids, status=Order.RESERVED, razorpay_payment_id=''):
+        try:
+            states.transition(order, Order.CANCELLED, 'stock hold expired', from_status=Order.RESERVED)
+        except states.InvalidTransition:
+            pass    # paid or cancelled in the meantime
+
+
+def release_expired(now=None, batch_size=500):
+    """
+    Release expired holds in batches and cancel their unpaid orders; returns
+    (holds released, units given back).
+    """
+    now = now or timezone.now()
+    released = units = 0
+    while True:
+        rows = list(StockHold.objects.filter(status=StockHold.HELD, expires_at__lte=now)
+                    .order_by('expires_at').values_list('pk', 'order_id')[:batch_size])
+        if not rows:
+            return released, units
+        holds, given = _release(StockHold.objects.filter(pk__in=[pk for pk, _ in rows]))
+        _cancel_unpaid({order_id for _, order_id in rows})
+        released += holds
+        units += given
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from orders import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move shipped and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS (or --days) to the "
+        "archive tables, in batches with one short transaction each (run from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Archive orders older than this many days.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help="Seconds to sleep between batches so other writers get the tables.")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(days=options['days'])
+        if options['dry_run']:
+            count = archive.archivable(before).count()
+            self.stdout.write(f"{count} orders created before {before:%Y-%m-%d %H:%M} would be archived.")
+            return
+        moved = archive.archive(before, options['batch_size'], options['pause'], options['max_batches'])
+        self.stdout.write(f"Archived {moved} orders created before {before:%Y-%m-%d %H:%M}.")
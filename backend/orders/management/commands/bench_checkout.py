@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orders.checkout import place_order
+from orders.models import Order, OrderItem
+from products.cart import HashCartStore, LocalHashClient
+from products.models import Book
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time place_order() for carts of different sizes. Synthetic books and orders are "
+        "created inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', default='1,10,100', help="Comma separated cart sizes.")
+        parser.add_argument('--repeat', type=int, default=30, help="Checkouts per cart size.")
+        parser.add_argument('--legacy', action='store_true',
+                            help="Also time the old one-INSERT-per-line item creation.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['lines'].split(',') if s.strip())
+        try:
+            with transaction.atomic():
+                books = Book.objects.bulk_create([
+                    Book(title=f'Checkout bench {i}', slug=f'checkout-bench-{time.time_ns()}-{i}',
+                         price=100 + i, stock=10 ** 6)
+                    for i in range(max(sizes))
+                ])
+                if books[0].pk is None:
+                    books = list(Book.objects.filter(slug__startswith='checkout-bench-').order_by('id'))
+                self.stdout.write(f"{'lines':>6} {'path':<8} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8}")
+                for size in sizes:
+                    self._report(size, 'bulk', self._bulk(books[:size], options['repeat']))
+                    if options['legacy']:
+                        self._report(size, 'legacy', self._legacy(books[:size], options['repeat']))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _cart(self, books):
+        cart = HashCartStore(client=LocalHashClient())
+        for book in books:
+            cart.add(book, 1)
+        return cart
+
+    def _bulk(self, books, repeat):
+        runs = []
+        for _ in range(repeat):
+            cart = self._cart(books)
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                place_order(cart, full_name='bench')
+                elapsed = time.perf_counter() - start
+            runs.append((elapsed, len(ctx.captured_queries)))
+        return runs
+
+    def _legacy(self, books, repeat):
+        runs = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                order = Order.objects.create(full_name='bench')
+                for book in books:
+                    OrderItem.objects.create(order=order, product_id=book.pk, title=book.title,
+                                             price=book.price, quantity=1, subtotal=book.price)
+                elapsed = time.perf_counter() - start
+            runs.append((elapsed, len(ctx.captured_queries)))
+        return runs
+
+    def _report(self, size, label, runs):
+        times = sorted(t * 1000 for t, _ in runs)
+        p95 = times[max(int(len(times) * 0.95) - 1, 0)]
+        queries = statistics.median(q for _, q in runs)
+        self.stdout.write(f"{size:>6} {label:<8} {statistics.median(times):>8.2f} {p95:>8.2f} {queries:>8.0f}")
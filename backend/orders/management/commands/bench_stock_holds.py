@@ -0,0 +1,109 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.utils.text import slugify
+
+from orders import inventory
+from orders.models import Order, StockHold
+from products.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Run many parallel checkouts against one title and check that stock never "
+        "goes negative, every unit is accounted for and reservations don't queue for long. "
+        "Creates (and afterwards deletes) a throwaway book and orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=300)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--quantity', type=int, default=1, help="Copies per checkout.")
+        parser.add_argument('--max-wait-ms', type=float, default=1000,
+                            help="Fail if the p99 reservation latency is above this.")
+
+    def handle(self, *args, **options):
+        stock = options['stock']
+        book = Book.objects.create(title='Stock hold benchmark', slug=slugify(f'bench-holds-{time.time_ns()}'),
+                                   price=100, stock=stock)
+        orders = [Order(full_name='bench') for _ in range(options['checkouts'])]
+        orders = Order.objects.bulk_create(orders)
+        if orders[0].pk is None:
+            orders = list(Order.objects.filter(full_name='bench').order_by('-id')[:len(orders)])
+        try:
+            self._run(book, orders, options)
+        finally:
+            StockHold.objects.filter(book=book).delete()
+            Order.objects.filter(pk__in=[o.pk for o in orders]).delete()
+            book.delete()
+
+    def _run(self, book, orders, options):
+        queue = list(orders)
+        lock = threading.Lock()
+        waits, results = [], {'ok': 0, 'sold_out': 0, 'retries': 0}
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        order = queue.pop()
+                    start = time.perf_counter()
+                    while True:
+                        try:
+                            inventory.reserve(order, [(book.pk, options['quantity'])])
+                            outcome = 'ok'
+                        except inventory.OutOfStock:
+                            outcome = 'sold_out'
+                        except OperationalError:
+                            # SQLite: "database is locked" when the busy timeout runs out
+                            with lock:
+                                results['retries'] += 1
+                            continue
+                        break
+                    with lock:
+                        waits.append(time.perf_counter() - start)
+                        results[outcome] += 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        book.refresh_from_db()
+        held = sum(StockHold.objects.filter(book=book).values_list('quantity', flat=True))
+        expected_ok = min(len(orders), options['stock'] // options['quantity'])
+        waits_ms = sorted(w * 1000 for w in waits)
+        p99 = waits_ms[int(len(waits_ms) * 0.99) - 1] if waits_ms else 0
+
+        self.stdout.write(f"{connection.vendor}: {len(orders)} checkouts on {options['threads']} threads "
+                          f"in {elapsed:.2f}s")
+        self.stdout.write(f"reserved {results['ok']}, sold out {results['sold_out']}, "
+                          f"lock retries {results['retries']}")
+        self.stdout.write(f"reserve latency ms: p50 {statistics.median(waits_ms):.1f}  p99 {p99:.1f}  "
+                          f"max {waits_ms[-1]:.1f}")
+        self.stdout.write(f"stock left {book.stock}, held {held}, started with {options['stock']}")
+
+        problems = []
+        if book.stock < 0:
+            problems.append("stock went negative")
+        if book.stock + held != options['stock']:
+            problems.append("stock + held does not add up to the starting stock")
+        if results['ok'] != expected_ok:
+            problems.append(f"expected {expected_ok} successful reservations")
+        if p99 > options['max_wait_ms']:
+            problems.append(f"p99 latency above {options['max_wait_ms']:.0f} ms")
+        if problems:
+            self.stderr.write(self.style.ERROR("FAILED: " + "; ".join(problems)))
+        else:
+            self.stdout.write(self.style.SUCCESS("No oversell; latency within bounds."))
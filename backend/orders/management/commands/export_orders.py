@@ -0,0 +1,46 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.export import FORMATS, day_range, export_lines
+from orders.models import Order
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Not a YYYY-MM-DD date: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the orders created between two dates (inclusive, local time) as CSV (one row "
+        "per order line) or JSON Lines (one order per line), streamed in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', required=True, help="First day, YYYY-MM-DD.")
+        parser.add_argument('--until', help="Last day, YYYY-MM-DD (default: --since).")
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--status', action='append', default=[],
+                            choices=[value for value, _ in Order.STATUS_CHOICES],
+                            help="Only orders with this status (repeatable).")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = _date(options['since'])
+        until = _date(options['until']) if options['until'] else since
+        if until < since:
+            raise CommandError("--until is before --since")
+        start, end = day_range(since, until)
+        lines = export_lines(options['format'], start, end, options['status'], options['batch_size'])
+        out = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in lines:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
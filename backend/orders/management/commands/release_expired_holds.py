@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import purge_expired
+from orders.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Give back stock held by unpaid orders whose hold has expired, and drop expired "
+        "checkout idempotency keys (run from cron, or with --every)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--every', type=int, default=0,
+                            help="Keep running, sweeping every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            holds, units = release_expired(batch_size=options['batch_size'])
+            purge_expired()
+            if holds or not options['every']:
+                self.stdout.write(f"Released {holds} expired holds ({units} units back in stock).")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
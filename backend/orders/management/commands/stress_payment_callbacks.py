@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils.text import slugify
+
+from orders.checkout import place_order
+from orders.models import Order, OrderStatusLog, StockHold
+from payments import fake_gateway, gateway, jobs
+from payments.models import CaptureJob
+from products.cart import HashCartStore, LocalHashClient
+from products.models import Book
+
+KEY_SECRET = 'stress-key-secret'
+WEBHOOK_SECRET = 'stress-webhook-secret'
+QUIET_LOGGERS = ('payments.jobs', 'django.request')
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire duplicate payment callbacks (checkout verify posts and webhooks, some for a second "
+        "'rival' payment) at many orders in parallel while capture workers run, then check that "
+        "every order was captured once, with one payment, and moved to paid once. Uses an "
+        "in-process fake gateway; the throwaway book and orders are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50)
+        parser.add_argument('--duplicates', type=int, default=4,
+                            help="Verify posts and webhooks sent per payment.")
+        parser.add_argument('--rival-rate', type=float, default=0.25,
+                            help="Fraction of orders that also get a second authorized payment.")
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=4, help="Capture worker threads.")
+        parser.add_argument('--latency-ms', type=float, default=20)
+
+    def handle(self, *args, **options):
+        server = fake_gateway.start(latency_ms=options['latency_ms'], jitter_ms=options['latency_ms'] / 2)
+        book = Book.objects.create(title='Payment callback stress', slug=slugify(f'stress-pay-{time.time_ns()}'),
+                                   price=100, stock=options['orders'])
+        orders = []
+        try:
+            with override_settings(RAZORPAY_BASE_URL=f'http://127.0.0.1:{server.server_port}',
+                                   RAZORPAY_KEY_SECRET=KEY_SECRET, RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET,
+                                   PAYMENT_QUEUE_BACKEND='db', PAYMENT_JOB_LEASE_SECONDS=30):
+                gateway.reset_client()
+                orders = self._orders(book, options['orders'])
+                # rival payments and retried SQLite lock errors are expected here; don't log each one
+                for name in QUIET_LOGGERS:
+                    logging.getLogger(name).setLevel(logging.CRITICAL)
+                self._run(server, orders, options)
+        finally:
+            for name in QUIET_LOGGERS:
+                logging.getLogger(name).setLevel(logging.NOTSET)
+            gateway.reset_client()
+            server.shutdown()
+            server.server_close()
+            ids = [o.pk for o in orders]
+            CaptureJob.objects.filter(order_id__in=ids).delete()
+            StockHold.objects.filter(book=book).delete()
+            Order.objects.filter(pk__in=ids).delete()
+            book.delete()
+
+    def _orders(self, book, count):
+        orders = []
+        for _ in range(count):
+            cart = HashCartStore(client=LocalHashClient())
+            cart.add(book, 1)
+            order, priced = place_order(cart, full_name='stress')
+            razor_order = gateway.create_order(priced.total_paise, receipt=order.pk)
+            Order.objects.filter(pk=order.pk).update(razorpay_order_id=razor_order['id'])
+            order.razorpay_order_id = razor_order['id']
+            orders.append(order)
+        return orders
+
+    def _callbacks(self, orders, options):
+        calls, rivals = [], {}
+        for order in orders:
+            payments = [f'pay_stress{order.pk}']
+            if random.random() < options['rival_rate']:
+                payments.append(f'pay_stress{order.pk}b')
+                rivals[order.pk] = payments[1]
+            for payment_id in payments:
+                calls += [('verify', order, payment_id)] * options['duplicates']
+                calls += [('payment.authorized', order, payment_id)] * options['duplicates']
+        random.shuffle(calls)
+        return calls, rivals
+
+    def _send(self, client, kind, order, payment_id):
+        if kind == 'verify':
+            signature = hmac.new(KEY_SECRET.encode(), f'{order.razorpay_order_id}|{payment_id}'.encode(),
+                                 hashlib.sha256).hexdigest()
+            return client.post(reverse('orders:verify_payment'), {
+                'order_id': order.pk, 'razorpay_order_id': order.razorpay_order_id,
+                'razorpay_payment_id': payment_id, 'razorpay_signature': signature,
+            })
+        body = json.dumps({'event': kind, 'payload': {'payment': {'entity': {
+            'id': payment_id, 'order_id': order.razorpay_order_id, 'amount': 10000}}}})
+        signature = hmac.new(WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return client.post(reverse('payments:webhook'), body, content_type='application/json',
+                           HTTP_X_RAZORPAY_SIGNATURE=signature)
+
+    def _run(self, server, orders, options):
+        calls, rivals = self._callbacks(orders, options)
+        lock = threading.Lock()
+        stats = Counter()
+        sending = threading.Event()
+        sending.set()
+
+        def sender():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        if not calls:
+                            return
+                        call = calls.pop()
+                    while True:
+                        try:
+                            response = self._send(client, *call)
+                        except OperationalError:
+                            # SQLite "database is locked": the gateway/browser would retry
+                            with lock:
+                                stats['retried'] += 1
+                            continue
+                        break
+                    with lock:
+                        stats[f'{call[0]} {response.status_code}'] += 1
+            finally:
+                connections.close_all()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        done, failed = jobs.run_due(limit=1)
+                    except OperationalError:
+                        with lock:
+                            stats['worker retried'] += 1
+                        continue
+                    with lock:
+                        stats['captured'] += done
+                        stats['not captured'] += failed
+                    if not (done or failed):
+                        if not sending.is_set() and not CaptureJob.objects.filter(
+                                order_id__in=[o.pk for o in orders], status=CaptureJob.QUEUED).exists():
+                            return
+                        time.sleep(0.05)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        senders = [threading.Thread(target=sender) for _ in range(options['threads'])]
+        workers = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        for t in senders + workers:
+            t.start()
+        for t in senders:
+            t.join()
+        sending.clear()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        self._check(server, orders, rivals, stats, elapsed, options)
+
+    def _check(self, server, orders, rivals, stats, elapsed, options):
+        ids = [o.pk for o in orders]
+        statuses = Counter(Order.objects.filter(pk__in=ids).values_list('status', flat=True))
+        paid_logs = Counter(OrderStatusLog.objects.filter(order_id__in=ids, to_status=Order.PAID)
+                            .values_list('order_id', flat=True))
+        payment_of = dict(Order.objects.filter(pk__in=ids).values_list('pk', 'razorpay_payment_id'))
+        captured = {pid for pid in server.captured if pid.startswith('pay_stress')}
+
+        sent = sum(v for k, v in stats.items() if k.startswith(('verify ', 'payment.authorized ')))
+        calls = sum(server.capture_calls.values())
+        self.stdout.write(f"{connection.vendor}: {len(orders)} orders, {sent} callbacks ({len(rivals)} orders "
+                          f"with a rival payment) on {options['threads']} threads, {options['workers']} capture "
+                          f"workers, {elapsed:.2f}s")
+        self.stdout.write("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items())))
+        self.stdout.write(f"order statuses: {dict(statuses)}; payments captured {len(captured)}; "
+                          f"repeated capture calls (answered 'already captured') {calls - len(captured)}")
+
+        problems = []
+        if statuses.get(Order.PAID, 0) != len(orders):
+            problems.append("not every order is paid")
+        if any(paid_logs.get(pk, 0) != 1 for pk in ids):
+            problems.append("an order moved to paid more than once (or never)")
+        if any(payment_of[pk] not in captured for pk in ids):
+            problems.append("an order's recorded payment was not captured")
+        if len(captured) != len(orders):
+            problems.append("more payments captured than orders")
+        if any(rival in captured and payment_of[pk] != rival for pk, rival in rivals.items()):
+            problems.append("a rival payment was captured")
+        if any(k.endswith(' 500') for k in stats):
+            problems.append("server errors")
+        if problems:
+            self.stderr.write(self.style.ERROR("FAILED: " + "; ".join(problems)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every order captured exactly once and moved to paid once."))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalise_statuses(apps, schema_editor):
+    """'PAID' was written by the old verify_payment; unpaid orders holding stock are now 'reserved'."""
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.filter(status__in=['PAID', 'Paid']).update(status='paid')
+    Order.objects.filter(status='pending', holds__status__in=['held', 'committed']).update(status='reserved')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_checkout_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('reserved', 'Reserved'), ('paid', 'Paid'), ('shipped', 'Shipped'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('reason', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_log', to='orders.order')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(normalise_statuses, migrations.RunPython.noop),
+    ]
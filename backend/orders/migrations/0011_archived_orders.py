@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:18
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('full_name', models.CharField(blank=True, default='N/A', max_length=200)),
+                ('email', models.EmailField(blank=True, default='N/A', max_length=254)),
+                ('address', models.TextField(blank=True, default='N/A')),
+                ('created_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('reserved', 'Reserved'), ('paid', 'Paid'), ('shipped', 'Shipped'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('razorpay_order_id', models.CharField(blank=True, default='', max_length=200)),
+                ('razorpay_payment_id', models.CharField(blank=True, default='', max_length=200)),
+                ('status_log', models.JSONField(blank=True, default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('product_id', models.IntegerField(default=0)),
+                ('title', models.CharField(blank=True, default='N/A', max_length=300)),
+                ('price', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.archivedorder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='orders_arch_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['-created_at', '-id'], name='orders_arch_created_idx'),
+        ),
+    ]
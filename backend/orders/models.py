@@ -3,11 +3,14 @@ from django.conf import settings
 from decimal import Decimal
 
 class Order(models.Model):
+    # status only changes through orders.states.transition()
+    PENDING, RESERVED, PAID, SHIPPED, CANCELLED = 'pending', 'reserved', 'paid', 'shipped', 'cancelled'
     STATUS_CHOICES = [
-        ('pending', 'Pending'),
-        ('paid', 'Paid'),
-        ('shipped', 'Shipped'),
-        ('cancelled', 'Cancelled'),
+        (PENDING, 'Pending'),
+        (RESERVED, 'Reserved'),
+        (PAID, 'Paid'),
+        (SHIPPED, 'Shipped'),
+        (CANCELLED, 'Cancelled'),
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
@@ -22,6 +25,15 @@ class Order(models.Model):
     razorpay_order_id = models.CharField(max_length=200, blank=True, default='')
     razorpay_payment_id = models.CharField(max_length=200, blank=True, default='')
 
+    class Meta:
+        indexes = [
+            # order history: one range scan per page, however many orders the user has
+            models.Index(fields=['user', '-created_at', '-id'], name='orders_user_created_idx'),
+            # admin changelist: newest first, by status, by date range
+            models.Index(fields=['-created_at', '-id'], name='orders_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='orders_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.full_name}"
 
@@ -36,3 +48,104 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.title} (x{self.quantity})"
+
+
+class OrderStatusLog(models.Model):
+    """One row per Order.status change (written by orders.states.transition)."""
+    order = models.ForeignKey(Order, related_name='status_log', on_delete=models.CASCADE)
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    reason = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
+
+
+class StockHold(models.Model):
+    """
+    Stock taken from a book for an unpaid order (see orders.inventory).
+    Held stock is already subtracted from Book.stock; releasing a hold gives
+    it back, committing it makes the sale final.
+    """
+    HELD, COMMITTED, RELEASED = 'held', 'committed', 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, related_name='holds', on_delete=models.CASCADE)
+    book = models.ForeignKey('products.Book', related_name='+', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='orders_hold_status_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x book {self.book_id} for order {self.order_id} ({self.status})"
+
+
+class CheckoutKey(models.Model):
+    """
+    An idempotency key for create_order (see orders.idempotency): repeated
+    submissions of the same checkout get the order created by the first one.
+    ``order`` is set once the order and its gateway order exist.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    order = models.ForeignKey(Order, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} -> order {self.order_id}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    An order moved out of Order by orders.archive once it is old and final
+    (shipped or cancelled). Same id and columns as the Order it was; its
+    status log is kept inline.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='archived_orders', on_delete=models.SET_NULL)
+    full_name = models.CharField(max_length=200, blank=True, default='N/A')
+    email = models.EmailField(blank=True, default='N/A')
+    address = models.TextField(blank=True, default='N/A')
+    created_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    razorpay_order_id = models.CharField(max_length=200, blank=True, default='')
+    razorpay_payment_id = models.CharField(max_length=200, blank=True, default='')
+    status_log = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='orders_arch_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='orders_arch_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} - {self.full_name} (archived)"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='items', on_delete=models.CASCADE)
+    product_id = models.IntegerField(default=0)
+    title = models.CharField(max_length=300, blank=True, default='N/A')
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    quantity = models.PositiveIntegerField(default=1)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.title} (x{self.quantity})"
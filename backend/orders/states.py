@@ -0,0 +1,90 @@
+"""
+Order status state machine.
+
+    pending -> reserved -> paid -> shipped
+       |          |         |
+       +----------+---------+---> cancelled
+
+Every status change goes through ``transition()``, a compare-and-set: the
+UPDATE only matches while the order still has the status that was read, so
+when two callers race (duplicate payment callbacks, a webhook and the
+worker) exactly one moves the order and the other re-reads and sees it
+already moved. No row lock is held while reading. Only the changed columns
+are written, and each change is recorded in OrderStatusLog in the same
+transaction as the UPDATE.
+
+``claim_payment()`` attaches a payment to an order the same way: the first
+authorized payment wins and any other payment for that order is never
+captured.
+"""
+from django.db import transaction
+
+from bookbazaar import metrics
+from .models import Order, OrderStatusLog
+
+TRANSITIONS = {
+    Order.PENDING: {Order.RESERVED, Order.CANCELLED},
+    Order.RESERVED: {Order.PAID, Order.CANCELLED},
+    Order.PAID: {Order.SHIPPED, Order.CANCELLED},
+    Order.SHIPPED: set(),
+    Order.CANCELLED: set(),
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, order_id, current, target):
+        self.order_id = order_id
+        self.current = current
+        self.target = target
+        super().__init__(f"Order {order_id} can't go from {current} to {target}")
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def log(order, from_status, to_status, reason=''):
+    OrderStatusLog.objects.create(order_id=order.pk, from_status=from_status, to_status=to_status, reason=reason[:200])
+
+
+def transition(order, target, reason='', from_status=None, **fields):
+    """
+    Move ``order`` to ``target``, writing ``fields`` in the same UPDATE.
+    Returns True if this call moved it and False if it was already there
+    (a duplicate); raises InvalidTransition for any other status, or if
+    ``from_status`` is given and the order has moved on from it.
+    """
+    while True:
+        current = Order.objects.filter(pk=order.pk).values_list('status', flat=True).get()
+        if current == target:
+            order.status = current
+            return False
+        if not can_transition(current, target) or from_status not in (None, current):
+            raise InvalidTransition(order.pk, current, target)
+        with transaction.atomic():
+            if Order.objects.filter(pk=order.pk, status=current).update(status=target, **fields):
+                log(order, current, target, reason)
+                break
+        # another caller moved it first: look again
+    order.status = target
+    for name, value in fields.items():
+        setattr(order, name, value)
+    metrics.incr(f'orders.status.{target}')
+    return True
+
+
+def claim_payment(order, razorpay_payment_id):
+    """
+    Make ``razorpay_payment_id`` the payment of an unpaid ``order``. Returns
+    True if it is (now, or already) the order's payment, False if the order
+    has another payment or can no longer be paid.
+    """
+    claimed = Order.objects.filter(
+        pk=order.pk, status__in=(Order.PENDING, Order.RESERVED), razorpay_payment_id='',
+    ).update(razorpay_payment_id=razorpay_payment_id)
+    if not claimed:
+        claimed = Order.objects.filter(pk=order.pk, razorpay_payment_id=razorpay_payment_id) \
+            .exclude(status=Order.CANCELLED).exists()
+    if claimed:
+        order.razorpay_payment_id = razorpay_payment_id
+    return bool(claimed)
@@ -1,3 +1,466 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from bookbazaar.querybudget import assert_max_queries
+from products.cart import HashCartStore, LocalHashClient
+from products.models import Book
+from . import archive, export, idempotency, inventory, states
+from .checkout import CheckoutError, place_order
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, OrderStatusLog, StockHold
+
+
+def make_orders(user, count, items=3, status=Order.PAID):
+    orders = Order.objects.bulk_create([
+        Order(user=user, full_name=f'Customer {i}', status=status, total=100 * items) for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=n, title=f'Book {n}', price=100, quantity=1, subtotal=100)
+        for order in orders for n in range(items)
+    ])
+    return orders
+
+
+@override_settings(ANALYTICS_SINK='off')
+class QueryBudgetTests(TestCase):
+    """Order pages run a fixed number of queries however many orders and items there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.customer = User.objects.create_user('reader', password='pw')
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'pw')
+        make_orders(cls.customer, 25)
+        archived = ArchivedOrder.objects.create(id=10 ** 6, user=cls.customer, full_name='Old', status=Order.SHIPPED,
+                                                created_at='2020-01-01T00:00:00Z')
+        ArchivedOrderItem.objects.create(id=10 ** 6, order=archived, title='Old book')
+
+    def test_order_history_page_and_api(self):
+        self.client.force_login(self.customer)
+        with assert_max_queries(6):
+            response = self.client.get(reverse('orders:order_history'))
+        self.assertEqual(len(response.context['orders']), 10)
+        with assert_max_queries(6):
+            response = self.client.get(reverse('orders:order_history_api'), {'page_size': 50})
+        results = response.json()['results']
+        self.assertEqual(len(results), 26)
+        self.assertEqual(sum(len(order['items']) for order in results), 76)
+
+    def test_order_admin_changelist(self):
+        self.client.force_login(self.staff)
+        with assert_max_queries(8):
+            response = self.client.get(reverse('admin:orders_order_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 25)
+        with assert_max_queries(8):
+            self.client.get(reverse('admin:orders_order_changelist'), {'status__exact': Order.PAID})
+
+
+@override_settings(ANALYTICS_SINK='off')
+class DuplicateCheckoutTests(TestCase):
+    """A duplicate submission never holds a worker until the first one finishes."""
+
+    key = 'a' * 64
+
+    def setUp(self):
+        self.assertIsNone(idempotency.claim(self.key))    # the first submission, still running
+        patcher = mock.patch.object(idempotency, 'checkout_key', return_value=self.key)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_duplicate_polls_until_the_first_order_is_placed(self):
+        start = time.monotonic()
+        response = self.client.post(reverse('orders:create_order'), {'full_name': 'Reader'})
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(response.status_code, 202)
+        status_url = response.context['status_url']
+        self.assertEqual(response['Refresh'], f'2; url={status_url}')
+
+        self.assertEqual(self.client.get(status_url).status_code, 202)
+
+        order = Order.objects.create(full_name='Reader', status=Order.RESERVED, total=100, razorpay_order_id='order_1')
+        idempotency.complete(self.key, order)
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['order'], order)
+
+        Order.objects.filter(pk=order.pk).update(status=Order.PAID)
+        self.assertRedirects(self.client.get(status_url), reverse('orders:order_success', args=[order.pk]),
+                             fetch_redirect_response=False)
+
+    def test_status_link_is_signed(self):
+        response = self.client.get(reverse('orders:checkout_status', args=[self.key]))
+        self.assertEqual(response.status_code, 400)
+
+
+def make_book(slug, stock, price=100):
+    return Book.objects.create(title=slug.title(), slug=slug, price=price, stock=stock)
+
+
+class InventoryTests(TestCase):
+    """Stock is taken all or nothing, never below zero, and given back exactly once."""
+
+    def setUp(self):
+        self.dune = make_book('dune', stock=5)
+        self.emma = make_book('emma', stock=2)
+        self.order = Order.objects.create(status=Order.RESERVED)
+
+    def stock(self):
+        return dict(Book.objects.values_list('slug', 'stock'))
+
+    def held(self, order=None):
+        return {(h.book_id, h.quantity, h.status) for h in StockHold.objects.filter(order=order or self.order)}
+
+    def test_reserve_takes_stock_and_records_holds(self):
+        inventory.reserve(self.order, [(self.dune.pk, 1), (self.emma.pk, 2), (self.dune.pk, 2)])
+        self.assertEqual(self.stock(), {'dune': 2, 'emma': 0})
+        self.assertEqual(self.held(), {(self.dune.pk, 3, StockHold.HELD), (self.emma.pk, 2, StockHold.HELD)})
+
+    def test_reserve_is_all_or_nothing(self):
+        for lines in ([(self.dune.pk, 1), (self.emma.pk, 3)], [(self.emma.pk, 3)]):
+            with self.assertRaises(inventory.OutOfStock) as raised:
+                inventory.reserve(self.order, lines)
+            self.assertEqual(raised.exception.book_id, self.emma.pk)
+        self.assertEqual(self.stock(), {'dune': 5, 'emma': 2})
+        self.assertEqual(self.held(), set())
+
+    def test_never_sells_more_than_the_stock(self):
+        inventory.reserve(self.order, [(self.emma.pk, 2)])
+        other = Order.objects.create(status=Order.RESERVED)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(other, [(self.dune.pk, 1), (self.emma.pk, 1)])
+        self.assertEqual(self.stock(), {'dune': 5, 'emma': 0})
+
+    def test_release_gives_stock_back_once(self):
+        inventory.reserve(self.order, [(self.dune.pk, 2), (self.emma.pk, 1)])
+        self.assertEqual(inventory.release(self.order), (2, 3))
+        self.assertEqual(inventory.release(self.order), (0, 0))
+        self.assertEqual(self.stock(), {'dune': 5, 'emma': 2})
+
+    def test_commit_makes_holds_final(self):
+        inventory.reserve(self.order, [(self.dune.pk, 2)])
+        self.assertEqual(inventory.commit(self.order), 1)
+        self.assertEqual(inventory.release(self.order), (0, 0))
+        self.assertEqual(self.held(), {(self.dune.pk, 2, StockHold.COMMITTED)})
+        self.assertEqual(self.stock()['dune'], 3)
+
+    def test_release_expired_only_touches_expired_holds(self):
+        inventory.reserve(self.order, [(self.dune.pk, 2)], seconds=60)
+        fresh = Order.objects.create(status=Order.RESERVED)
+        inventory.reserve(fresh, [(self.emma.pk, 1)], seconds=3600)
+        later = timezone.now() + datetime.timedelta(minutes=5)
+        self.assertEqual(inventory.release_expired(now=later), (1, 2))
+        self.assertEqual(self.stock(), {'dune': 5, 'emma': 1})
+        self.assertEqual(self.held(fresh), {(self.emma.pk, 1, StockHold.HELD)})
+
+    def test_commit_after_expiry_takes_the_stock_again_if_it_is_there(self):
+        inventory.reserve(self.order, [(self.emma.pk, 2)], seconds=60)
+        inventory.release_expired(now=timezone.now() + datetime.timedelta(minutes=5))
+        inventory.commit(self.order)
+        self.assertEqual(self.stock()['emma'], 0)
+
+        other = Order.objects.create(status=Order.RESERVED)
+        inventory.reserve(other, [(self.dune.pk, 5)], seconds=60)
+        inventory.release_expired(now=timezone.now() + datetime.timedelta(minutes=5))
+        inventory.reserve(Order.objects.create(status=Order.RESERVED), [(self.dune.pk, 4)])
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.commit(other)
+        self.assertEqual(self.stock()['dune'], 1)
+
+    def test_release_expired_cancels_unpaid_orders(self):
+        paying = Order.objects.create(status=Order.RESERVED)
+        paid_meanwhile = Order.objects.create(status=Order.RESERVED)
+        for order in (self.order, paying, paid_meanwhile):
+            inventory.reserve(order, [(self.dune.pk, 1)], seconds=60)
+        states.claim_payment(paying, 'pay_1')
+        real_release = inventory._release
+
+        def release_then_pay(holds):
+            result = real_release(holds)
+            Order.objects.filter(pk=paid_meanwhile.pk).update(status=Order.PAID)
+            return result
+
+        with mock.patch.object(inventory, '_release', release_then_pay):
+            inventory.release_expired(now=timezone.now() + datetime.timedelta(minutes=5))
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[self.order.pk], Order.CANCELLED)
+        self.assertEqual(statuses[paying.pk], Order.RESERVED)
+        self.assertEqual(statuses[paid_meanwhile.pk], Order.PAID)
+        self.assertEqual(list(self.order.status_log.values_list('from_status', 'to_status', 'reason')),
+                         [(Order.RESERVED, Order.CANCELLED, 'stock hold expired')])
+        self.assertEqual(self.stock()['dune'], 5)
+
+
+class StateTests(TestCase):
+    """Status changes are compare-and-set: one caller wins, the rest see it already done."""
+
+    def setUp(self):
+        self.order = Order.objects.create(status=Order.RESERVED)
+
+    def log(self):
+        return list(OrderStatusLog.objects.filter(order=self.order).values_list('from_status', 'to_status'))
+
+    def test_transition_moves_once_and_logs(self):
+        self.assertTrue(states.transition(self.order, Order.PAID, 'captured', razorpay_payment_id='pay_1'))
+        self.assertFalse(states.transition(self.order, Order.PAID, 'captured again'))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.razorpay_payment_id), (Order.PAID, 'pay_1'))
+        self.assertEqual(self.log(), [(Order.RESERVED, Order.PAID)])
+
+    def test_illegal_transition_raises_and_changes_nothing(self):
+        states.transition(self.order, Order.CANCELLED)
+        with self.assertRaises(states.InvalidTransition) as raised:
+            states.transition(self.order, Order.PAID)
+        self.assertEqual((raised.exception.current, raised.exception.target), (Order.CANCELLED, Order.PAID))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.CANCELLED)
+        with self.assertRaises(states.InvalidTransition):
+            states.transition(Order.objects.create(status=Order.PAID), Order.CANCELLED, from_status=Order.RESERVED)
+
+    def test_losing_the_race_sees_the_winners_change(self):
+        can_transition = states.can_transition
+
+        def other_caller_wins(current, target):
+            # the order moves between this caller's read and its UPDATE
+            Order.objects.filter(pk=self.order.pk).update(status=Order.PAID)
+            states.log(self.order, current, Order.PAID, 'the winner')
+            return can_transition(current, target)
+
+        with mock.patch.object(states, 'can_transition', side_effect=other_caller_wins):
+            self.assertFalse(states.transition(self.order, Order.PAID, 'the loser'))
+        self.assertEqual(self.order.status, Order.PAID)
+        self.assertEqual(list(self.order.status_log.values_list('reason', flat=True)), ['the winner'])
+
+    def test_first_payment_claims_the_order(self):
+        self.assertTrue(states.claim_payment(self.order, 'pay_1'))
+        self.assertTrue(states.claim_payment(self.order, 'pay_1'))
+        self.assertFalse(states.claim_payment(Order.objects.get(pk=self.order.pk), 'pay_2'))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).razorpay_payment_id, 'pay_1')
+
+        states.transition(self.order, Order.CANCELLED)
+        self.assertFalse(states.claim_payment(self.order, 'pay_1'))
+        unpaid = Order.objects.create(status=Order.CANCELLED)
+        self.assertFalse(states.claim_payment(unpaid, 'pay_3'))
+
+
+
+class PlaceOrderTests(TestCase):
+    """An order is placed whole (order, items, stock holds) or not at all."""
+
+    def setUp(self):
+        self.dune, self.emma = make_book('dune', stock=5, price=399), make_book('emma', stock=1, price=250)
+        self.cart = HashCartStore('k', client=LocalHashClient())
+        self.cart.add(self.dune, 2)
+        self.cart.add(self.emma, 1)
+
+    def assert_nothing_written(self):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(dict(Book.objects.values_list('slug', 'stock')), {'dune': 5, 'emma': 1})
+
+    def test_places_the_order_and_holds_its_stock(self):
+        order, priced = place_order(self.cart, full_name='Reader', expected_total_paise=104800)
+        self.assertEqual((order.status, order.total, priced.total_paise), (Order.RESERVED, 1048, 104800))
+        self.assertEqual(sorted(order.items.values_list('title', 'quantity', 'subtotal')),
+                         [('Dune', 2, 798), ('Emma', 1, 250)])
+        self.assertEqual(sorted(order.holds.values_list('book__slug', 'quantity')), [('dune', 2), ('emma', 1)])
+        self.assertEqual(dict(Book.objects.values_list('slug', 'stock')), {'dune': 3, 'emma': 0})
+        self.assertEqual(list(order.status_log.values_list('to_status', flat=True)), [Order.RESERVED])
+
+    def test_out_of_stock_rolls_everything_back(self):
+        self.cart.add(self.emma, 1)
+        with self.assertRaisesMessage(CheckoutError, 'Emma is out of stock'):
+            place_order(self.cart)
+        self.assert_nothing_written()
+
+    def test_a_failure_after_reserving_rolls_the_reservation_back(self):
+        with mock.patch.object(states, 'log', side_effect=RuntimeError('audit log down')):
+            with self.assertRaises(RuntimeError):
+                place_order(self.cart)
+        self.assert_nothing_written()
+
+    def test_refuses_a_total_the_customer_was_not_shown(self):
+        Book.objects.filter(pk=self.dune.pk).update(price=450)
+        with self.assertRaisesMessage(CheckoutError, 'Prices in your cart have changed'):
+            place_order(self.cart, expected_total_paise=104800)
+        self.assert_nothing_written()
+
+
+
+def at(day, hour=12):
+    return timezone.make_aware(datetime.datetime(2025, 3, day, hour))
+
+
+class ExportTests(TestCase):
+    """Exports hold every order line in range, live and archived, oldest first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paid = Order.objects.create(full_name='=HYPERLINK("http://evil")', email='a@example.com',
+                                        status=Order.PAID, total=Decimal('-5.50'), razorpay_payment_id='pay_1')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.paid, product_id=1, title='Dune', price=Decimal('2.50'), quantity=2, subtotal=5),
+            OrderItem(order=cls.paid, product_id=2, title='@SUM(A1:A9)', price=Decimal('0.50'), subtotal=Decimal('0.50')),
+        ])
+        cls.cancelled = Order.objects.create(full_name='-1+1', status=Order.CANCELLED)
+        cls.later = Order.objects.create(status=Order.PAID)
+        for order, when in ((cls.paid, at(1, 9)), (cls.cancelled, at(2)), (cls.later, at(3))):
+            Order.objects.filter(pk=order.pk).update(created_at=when)
+        cls.archived = ArchivedOrder.objects.create(id=10 ** 6, full_name='Old', status=Order.SHIPPED, created_at=at(1, 18))
+        ArchivedOrderItem.objects.create(id=10 ** 6, order=cls.archived, product_id=3, title='Emma')
+        cls.start, cls.end = export.day_range(datetime.date(2025, 3, 1), datetime.date(2025, 3, 2))
+
+    def export(self, fmt, statuses=(), batch_size=2):
+        return ''.join(export.export_lines(fmt, self.start, self.end, statuses, batch_size))
+
+    def csv_rows(self, **kwargs):
+        rows = list(csv.DictReader(self.export('csv', **kwargs).splitlines()))
+        return [(int(row['order_id']), row['item_title']) for row in rows], rows
+
+    def test_csv_has_one_row_per_line_in_date_order(self):
+        text = self.export('csv')
+        self.assertEqual(text.splitlines()[0], ','.join(export.CSV_HEADER))
+        keys, rows = self.csv_rows()
+        self.assertEqual(keys, [(self.paid.pk, 'Dune'), (self.paid.pk, "'@SUM(A1:A9)"),
+                                (self.archived.pk, 'Emma'), (self.cancelled.pk, '')])
+        self.assertEqual(rows[0]['order_created_at'], '2025-03-01T09:00:00+05:30')
+        self.assertEqual((rows[0]['order_total'], rows[0]['item_price'], rows[0]['item_quantity']), ('-5.50', '2.50', '2'))
+        self.assertEqual((rows[2]['order_status'], rows[2]['order_user_id']), (Order.SHIPPED, ''))
+        self.assertEqual({rows[3][f'item_{f}'] for f in export.ITEM_FIELDS}, {''})
+
+    def test_csv_escapes_cells_a_spreadsheet_would_run(self):
+        _, rows = self.csv_rows()
+        self.assertEqual(rows[0]['order_full_name'], "'" + self.paid.full_name)
+        self.assertEqual(rows[0]['order_email'], 'a@example.com')
+        self.assertEqual(rows[3]['order_full_name'], "'-1+1")
+
+    def test_csv_status_filter(self):
+        keys, _ = self.csv_rows(statuses=[Order.CANCELLED, Order.SHIPPED])
+        self.assertEqual(keys, [(self.archived.pk, 'Emma'), (self.cancelled.pk, '')])
+
+    def test_jsonl_has_one_object_per_order(self):
+        orders = [json.loads(line) for line in self.export('jsonl', batch_size=1).splitlines()]
+        self.assertEqual([o['id'] for o in orders], [self.paid.pk, self.archived.pk, self.cancelled.pk])
+        self.assertEqual(orders[0]['full_name'], '=HYPERLINK("http://evil")')
+        self.assertEqual((orders[0]['total'], orders[0]['created_at']), ('-5.50', '2025-03-01T09:00:00+05:30'))
+        item = orders[0]['items'][1]
+        self.assertEqual([item[f] for f in export.ITEM_FIELDS[1:]], [2, '@SUM(A1:A9)', '0.50', 1, '0.50'])
+        self.assertEqual([item['title'] for item in orders[1]['items']], ['Emma'])
+        self.assertEqual(orders[2]['items'], [])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export.export_lines('xlsx', self.start, self.end)
+
+
+
+class ArchiveTests(TestCase):
+    """Archiving moves old final orders out of the hot tables without losing or hiding any."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = get_user_model().objects.create_user('reader', password='pw')
+        cls.shipped, cls.cancelled, cls.paid, cls.recent = make_orders(cls.customer, 4, items=2)
+        for order, status, when in ((cls.shipped, Order.SHIPPED, at(1)), (cls.cancelled, Order.CANCELLED, at(2)),
+                                    (cls.paid, Order.PAID, at(1)), (cls.recent, Order.SHIPPED, at(20))):
+            Order.objects.filter(pk=order.pk).update(status=status, created_at=when)
+        OrderStatusLog.objects.create(order=cls.shipped, from_status=Order.PAID, to_status=Order.SHIPPED, reason='dispatched')
+        StockHold.objects.create(order=cls.cancelled, book=make_book('dune', stock=1), quantity=1,
+                                 status=StockHold.RELEASED, expires_at=at(2))
+
+    def test_round_trip(self):
+        items = list(self.shipped.items.order_by('id').values_list('id', 'product_id', 'title', 'subtotal'))
+        self.assertEqual(archive.archive(before=at(10), batch_size=1), 2)
+
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.paid.pk, self.recent.pk})
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[self.shipped.pk, self.cancelled.pk]).exists())
+        self.assertFalse(OrderStatusLog.objects.filter(order_id=self.shipped.pk).exists())
+        self.assertFalse(StockHold.objects.exists())
+
+        archived = archive.get_order(self.shipped.pk)
+        self.assertIsInstance(archived, ArchivedOrder)
+        self.assertEqual((archived.user, archived.full_name, archived.status, archived.created_at, archived.total),
+                         (self.customer, self.shipped.full_name, Order.SHIPPED, at(1), self.shipped.total))
+        self.assertEqual(list(archived.items.order_by('id').values_list('id', 'product_id', 'title', 'subtotal')), items)
+        self.assertEqual([(e['from'], e['to'], e['reason']) for e in archived.status_log],
+                         [(Order.PAID, Order.SHIPPED, 'dispatched')])
+        self.assertIsInstance(archive.get_order(self.cancelled.pk), ArchivedOrder)
+        self.assertIsInstance(archive.get_order(self.paid.pk), Order)
+        self.assertIsNone(archive.get_order(10 ** 6))
+
+        self.assertEqual(archive.archive(before=at(10)), 0)
+
+    def test_max_batches(self):
+        self.assertEqual(archive.archive(before=at(10), batch_size=1, max_batches=1), 1)
+        self.assertEqual(list(ArchivedOrder.objects.values_list('pk', flat=True)), [self.shipped.pk])
+
+    def test_history_pages_across_live_and_archived_orders(self):
+        Order.objects.all().delete()
+        created = {}
+        for i, order in enumerate(make_orders(self.customer, 9, items=1)):
+            # pairs share a timestamp, one of each pair archived, so the id tiebreak crosses tables
+            created[order.pk] = at(1 + i // 2)
+            Order.objects.filter(pk=order.pk).update(created_at=created[order.pk],
+                                                     status=Order.SHIPPED if i % 2 else Order.PAID)
+        self.assertEqual(archive.archive(before=at(10)), 4)
+        expected = sorted(created, key=lambda pk: (created[pk], pk), reverse=True)
+
+        paginator = archive.history(self.customer, per_page=2)
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([order.pk for order in page])
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual([len(p) for p in pages], [2, 2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual({type(order) for order in paginator.get_page(None)}, {Order, ArchivedOrder})
+
+        back, cursor = [], None
+        for _ in range(4):
+            cursor = paginator.get_page(cursor).next_cursor
+        while cursor is not None:
+            page = paginator.get_page(cursor)
+            back.append([order.pk for order in page])
+            cursor = page.previous_cursor
+        self.assertEqual(back, pages[::-1])
+
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReserveTests(TransactionTestCase):
+    """Parallel checkouts for the last copies: exactly the stock is sold (needs a database with row locks)."""
+
+    def test_parallel_reservations_never_oversell(self):
+        book, spare = make_book('dune', stock=5), make_book('emma', stock=100)
+        results, barrier = [], threading.Barrier(8)
+
+        def checkout():
+            order = Order.objects.create(status=Order.RESERVED)
+            barrier.wait()
+            try:
+                inventory.reserve(order, [(book.pk, 1), (spare.pk, 1)])
+                results.append(True)
+            except inventory.OutOfStock:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(Book.objects.get(pk=book.pk).stock, 0)
+        self.assertEqual(Book.objects.get(pk=spare.pk).stock, 95)
@@ -1,11 +1,15 @@
 ﻿from django.urls import path
-from .views import checkout, create_order, verify_payment, order_success
+from .views import checkout, create_order, checkout_status, verify_payment, order_success, order_history, OrderHistoryAPIView, export_orders
 
 app_name = "orders"
 
 urlpatterns = [
     path('checkout/', checkout, name='checkout'),
     path('create/', create_order, name='create_order'),
+    path('create/status/<str:token>/', checkout_status, name='checkout_status'),
     path('verify/', verify_payment, name='verify_payment'),
     path('success/<int:order_id>/', order_success, name='order_success'),
+    path('history/', order_history, name='order_history'),
+    path('api/', OrderHistoryAPIView.as_view(), name='order_history_api'),
+    path('export/', export_orders, name='export'),
 ]
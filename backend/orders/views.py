@@ -2,9 +2,12 @@
 from django.conf import settings
 from django.views.decorators.http import require_POST
 from django.urls import reverse
-from django.http import HttpResponse
-import razorpay
-from decimal import Decimal
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from rest_framework import generics, permissions
+import datetime
+import logging
+import uuid
 
 # Import models defensively
 try:
@@ -18,136 +21,146 @@ try:
 except Exception:
     Book = None
 
-def _get_cart_from_session(request):
-    """
-    Expected session cart format:
-      request.session['cart'] = { '<book_slug>': { 'qty': 2, 'price': 19900, 'title': '...' }, ... }
-    """
-    return request.session.get('cart', {})
+from bookbazaar import metrics
+from bookbazaar.querybudget import query_budget
+from payments import gateway, jobs
+from products.cart import get_cart
+from products.pagination import KeysetPagination
+from products.pricing import price_cart, to_paise
+from . import archive, export, idempotency, inventory, states
+from .checkout import CheckoutError, place_order
+from .serializers import OrderSerializer
+
+logger = logging.getLogger(__name__)
 
 def checkout(request):
     """
-    Show checkout page. Reads cart from session and computes total.
+    Show checkout page with the cart priced against current book prices.
     """
-    cart = _get_cart_from_session(request)
-    items = []
-    total = Decimal('0.00')
-    for slug, data in cart.items():
-        qty = int(data.get('qty', 1))
-        price_paise = int(data.get('price', 0))
-        subtotal = price_paise * qty
-        total += Decimal(price_paise) * qty
-        items.append({
-            'slug': slug,
-            'title': data.get('title', ''),
-            'qty': qty,
-            'price_paise': price_paise,
-            'subtotal_paise': int(subtotal),
-        })
-
-    amount_display = f"{(total/100):.2f}"
+    cart = price_cart(get_cart(request))
     context = {
-        'items': items,
-        'total': int(total),           # in paise
-        'total_display': amount_display
+        'items': cart.lines,
+        'total': cart.total,                 # Decimal rupees
+        'total_paise': cart.total_paise,
+        'total_display': f"{cart.total:.2f}",
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'checkout.html', context)
 
+def _payment_page(request, order, razor_order):
+    razor_amount = int(razor_order.get('amount') or to_paise(order.total))
+    context = {
+        'order': order,
+        'amount': razor_amount,
+        'amount_display': f"{(razor_amount/100):.2f}",
+        'razorpay_order': razor_order,
+        'razorpay_key_id': getattr(settings, 'RAZORPAY_KEY_ID', ''),
+    }
+    return render(request, 'payment_page.html', context)
+
 @require_POST
 def create_order(request):
     """
-    Create Order in DB (if model exists), create Razorpay order, render payment page.
+    Create the order (orders.checkout.place_order), create the Razorpay order,
+    render payment page. Repeated submissions of the same checkout get the
+    first order back (orders.idempotency).
     """
-    cart = _get_cart_from_session(request)
-    if not cart:
-        return redirect('products:product-list')
-
     full_name = request.POST.get('full_name', '').strip()
     email = request.POST.get('email', '').strip()
     address = request.POST.get('address', '').strip()
+    expected = request.POST.get('total_paise', '')
+    cart = get_cart(request)
 
-    total_paise = 0
-    for slug, data in cart.items():
-        qty = int(data.get('qty', 1))
-        price_paise = int(data.get('price', 0))
-        total_paise += price_paise * qty
-
-    order = None
-    if Order is not None:
+    key = idempotency.checkout_key(request, cart, (full_name, email, address, expected))
+    while idempotency.claim(key) is not None:
         try:
-            # create DB order (fields may vary — adjust if needed)
-            kwargs = {}
-            # best-effort fields; adapt if your Order model differs
-            if hasattr(Order, 'full_name'):
-                kwargs['full_name'] = full_name or "N/A"
-            if hasattr(Order, 'email'):
-                kwargs['email'] = email or "N/A"
-            if hasattr(Order, 'address'):
-                kwargs['address'] = address or "N/A"
-            if hasattr(Order, 'total'):
-                # store total in rupees if total field expects that
-                kwargs['total'] = (total_paise // 100)
-            order = Order.objects.create(**kwargs)
-            # try to create OrderItems
-            if OrderItem is not None:
-                for slug, data in cart.items():
-                    qty = int(data.get('qty', 1))
-                    price_paise = int(data.get('price', 0))
-                    title = data.get('title', '')
-                    try:
-                        fields = {}
-                        if hasattr(OrderItem, 'order'):
-                            fields['order'] = order
-                        if hasattr(OrderItem, 'product_id'):
-                            fields['product_id'] = data.get('product_id', None)
-                        if hasattr(OrderItem, 'title'):
-                            fields['title'] = title
-                        if hasattr(OrderItem, 'price'):
-                            fields['price'] = int(price_paise)
-                        if hasattr(OrderItem, 'quantity'):
-                            fields['quantity'] = qty
-                        if hasattr(OrderItem, 'subtotal'):
-                            fields['subtotal'] = int(price_paise * qty)
-                        OrderItem.objects.create(**fields)
-                    except Exception:
-                        # ignore item creation errors to keep flow moving
-                        pass
-        except Exception as e:
-            print("Warning: could not create Order model instance:", e)
-            order = None
-
-    client = razorpay.Client(auth=(getattr(settings, 'RAZORPAY_KEY_ID', ''), getattr(settings, 'RAZORPAY_KEY_SECRET', '')))
+            order = idempotency.wait_for_order(key)
+        except idempotency.StillPending:
+            return _processing_page(request, key)
+        if order is not None and order.status != Order.RESERVED:
+            # that checkout has been paid for or cancelled; this is a new one
+            idempotency.forget(key)
+        elif order is not None:
+            return _replay(request, order)
+
+    try:
+        return _place_order(request, key, cart, full_name, email, address, expected)
+    except Exception:
+        idempotency.abandon(key)
+        raise
+
+def _replay(request, order):
+    metrics.incr('checkout.replayed')
+    razor_order = {'id': order.razorpay_order_id, 'amount': to_paise(order.total), 'currency': 'INR'}
+    return _payment_page(request, order, razor_order)
+
+def _processing_page(request, key):
+    # answer at once and let the browser come back, rather than hold a worker until the first request finishes
+    status_url = reverse('orders:checkout_status', args=[idempotency.status_token(key)])
+    response = render(request, 'order_processing.html', {'status_url': status_url}, status=202)
+    response['Refresh'] = f'2; url={status_url}'
+    return response
+
+def checkout_status(request, token):
+    """
+    Where a duplicate checkout submission polls until the first one has
+    placed the order: the payment page once it has, the processing page
+    again while it hasn't.
+    """
+    key = idempotency.key_from_token(token)
+    if key is None:
+        return HttpResponseBadRequest('Invalid or expired checkout status link')
+    try:
+        order = idempotency.wait_for_order(key, timeout=0)
+    except idempotency.StillPending:
+        return _processing_page(request, key)
+    if order is None:
+        return render(request, 'order_failed.html', {'error_message': 'Your order could not be placed. Please go back to checkout and try again.'})
+    if order.status == Order.RESERVED:
+        return _replay(request, order)
+    if order.status in (Order.PAID, Order.SHIPPED):
+        return redirect('orders:order_success', order_id=order.pk)
+    return render(request, 'order_failed.html', {'error_message': 'This order has been cancelled. Please go back to checkout and try again.'})
+
+def _place_order(request, key, cart, full_name, email, address, expected):
+    try:
+        order, priced = place_order(
+            cart,
+            full_name=full_name,
+            email=email,
+            address=address,
+            user=request.user,
+            expected_total_paise=int(expected) if expected.isdigit() else None,
+        )
+    except CheckoutError as e:
+        idempotency.abandon(key)
+        if not get_cart(request):
+            return redirect('products:product-list')
+        return render(request, 'order_failed.html', {'error_message': str(e)})
 
     try:
-        razor_amount = int(total_paise)  # paise
-        razor_order = client.order.create(dict(amount=razor_amount, currency='INR', payment_capture='0'))
+        razor_order = gateway.create_order(priced.total_paise, receipt=order.pk)
         razorpay_order_id = razor_order.get('id')
-        if order is not None:
-            try:
-                if hasattr(order, 'razorpay_order_id'):
-                    order.razorpay_order_id = razorpay_order_id
-                    order.save()
-            except Exception:
-                pass
+        Order.objects.filter(pk=order.pk).update(razorpay_order_id=razorpay_order_id)
+        order.razorpay_order_id = razorpay_order_id
     except Exception as e:
+        inventory.release(order)
+        states.transition(order, Order.CANCELLED, 'gateway order could not be created')
+        idempotency.abandon(key)
         return render(request, 'order_failed.html', {'error_message': f'Razorpay order creation failed: {e}'})
 
-    context = {
-        'order': order or {'id': 'TEMP'},
-        'amount': razor_amount,
-        'amount_display': f"{(razor_amount/100):.2f}",
-        'razorpay_order': razor_order,
-        'razorpay_key_id': getattr(settings, 'RAZORPAY_KEY_ID', ''),
-    }
-    return render(request, 'payment_page.html', context)
+    idempotency.complete(key, order)
+    return _payment_page(request, order, razor_order)
 
 
 @require_POST
 def verify_payment(request):
     """
-    Verify Razorpay signature and capture payment using exact razor order amount.
+    Verify the Razorpay checkout signature, make the stock hold final and
+    queue the capture (payments.jobs). No gateway calls are made here; the
+    payment worker captures and marks the order paid.
     """
-    order_id = request.POST.get('order_id') or request.POST.get('order_id')
+    order_id = request.POST.get('order_id', '')
     razorpay_payment_id = request.POST.get('razorpay_payment_id')
     razorpay_order_id = request.POST.get('razorpay_order_id')
     razorpay_signature = request.POST.get('razorpay_signature')
@@ -155,8 +168,6 @@ def verify_payment(request):
     if not (order_id and razorpay_payment_id and razorpay_order_id and razorpay_signature):
         return render(request, 'order_failed.html', {'error_message': 'Missing payment parameters.'})
 
-    client = razorpay.Client(auth=(getattr(settings, 'RAZORPAY_KEY_ID', ''), getattr(settings, 'RAZORPAY_KEY_SECRET', '')))
-
     params = {
         'razorpay_order_id': razorpay_order_id,
         'razorpay_payment_id': razorpay_payment_id,
@@ -164,75 +175,88 @@ def verify_payment(request):
     }
 
     try:
-        client.utility.verify_payment_signature(params)
+        gateway.verify_payment_signature(params)
     except Exception as e:
         return render(request, 'order_failed.html', {'error_message': f'Payment signature verification failed: {e}'})
 
-    # SAFER CAPTURE: fetch razor order to get exact amount expected, then capture that amount
+    order_obj = Order.objects.filter(id=order_id).first() if str(order_id).isdigit() else None
+    if order_obj is None or (order_obj.razorpay_order_id and order_obj.razorpay_order_id != razorpay_order_id):
+        return render(request, 'order_failed.html', {'error_message': 'This payment does not belong to a known order.'})
+
+    # first payment wins; a duplicate callback for the same payment passes, any other payment is never captured
+    if not states.claim_payment(order_obj, razorpay_payment_id):
+        return render(request, 'order_failed.html', {'error_message': 'This order has already been paid or cancelled. Your payment was not captured.'})
+
+    # make the stock hold final before taking the money; an uncaptured payment lapses on its own
     try:
-        try:
-            razor_order = client.order.fetch(razorpay_order_id)
-            razor_amount = int(razor_order.get('amount', 0))  # amount in paise
-        except Exception as e:
-            razor_order = None
-            razor_amount = None
-            print("Warning: could not fetch razor order:", e)
-
-        amount_to_capture = None
-        if Order is not None:
-            try:
-                order_obj = get_object_or_404(Order, id=order_id)
-                if hasattr(order_obj, 'total') and order_obj.total is not None:
-                    db_amount_paise = int(order_obj.total) * 100
-                    if razor_amount and db_amount_paise != razor_amount:
-                        print(f"Notice: DB amount ({db_amount_paise}) != razor amount ({razor_amount}); using razor amount for capture")
-                    amount_to_capture = razor_amount or db_amount_paise
-            except Exception:
-                pass
-
-        if amount_to_capture is None:
-            amount_to_capture = razor_amount or 0
-
-        if not amount_to_capture:
-            raise Exception("Could not determine amount to capture (amount is 0).")
-
-        client.payment.capture(razorpay_payment_id, amount_to_capture)
-    except Exception as e:
-        print("Warning: capture failed:", e)
+        inventory.commit(order_obj)
+    except inventory.OutOfStock:
+        logger.warning("Order %s paid after its stock hold expired and the book sold out", order_id)
+        states.transition(order_obj, Order.CANCELLED, 'sold out before payment')
+        return render(request, 'order_failed.html', {'error_message': 'Sorry, an item sold out before your payment completed. Your payment was not captured.'})
 
-    # update DB order if exists
-    if Order is not None:
-        try:
-            order_obj = get_object_or_404(Order, id=order_id)
-            if hasattr(order_obj, 'razorpay_order_id'):
-                order_obj.razorpay_order_id = razorpay_order_id
-            if hasattr(order_obj, 'razorpay_payment_id'):
-                order_obj.razorpay_payment_id = razorpay_payment_id
-            if hasattr(order_obj, 'status'):
-                try:
-                    order_obj.status = 'PAID'
-                except Exception:
-                    pass
-            order_obj.save()
-        except Exception as e:
-            return render(request, 'order_failed.html', {'error_message': f'Could not update order record: {e}'})
+    jobs.enqueue_capture(order_obj, razorpay_order_id, razorpay_payment_id)
 
     try:
-        del request.session['cart']
-        request.session.modified = True
+        get_cart(request).clear()
     except Exception:
         pass
 
-    if Order is not None:
-        return redirect('orders:order_success', order_id=order_id)
-    else:
-        return render(request, 'order_success.html', {'order': {'id': order_id}})
+    return redirect('orders:order_success', order_id=order_obj.pk)
 
 def order_success(request, order_id):
     order_obj = None
     if Order is not None:
-        try:
-            order_obj = get_object_or_404(Order, id=order_id)
-        except Exception:
-            order_obj = None
+        order_obj = archive.get_order(order_id)
     return render(request, 'order_success.html', {'order': order_obj or {'id': order_id}})
+
+# ---- Order history ----
+# newest first on the (user, created_at, id) indexes of Order and ArchivedOrder;
+# a page costs one query per table plus one items prefetch per table
+
+class OrderHistoryPagination(KeysetPagination):
+    page_size = 10
+    max_page_size = 50
+
+    def get_paginator(self, queryset, page_size):
+        return archive.history(self.request.user, page_size)
+
+class OrderHistoryAPIView(generics.ListAPIView):
+    """The logged-in user's orders (archived ones included) with their items, newest first (cursor paginated)."""
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+    query_budget = 6
+
+    def get_queryset(self):
+        # paged by OrderHistoryPagination across Order and ArchivedOrder
+        return Order.objects.filter(user=self.request.user)
+
+@query_budget(6)
+def order_history(request):
+    orders = None
+    if request.user.is_authenticated:
+        orders = archive.history(request.user, 10).get_page(request.GET.get('cursor'))
+    return render(request, 'order_history.html', {'orders': orders})
+
+# ---- Export (finance) ----
+@staff_member_required
+@query_budget(2)    # the export's own queries run while the response streams
+def export_orders(request):
+    """?since=YYYY-MM-DD&until=YYYY-MM-DD&format=csv|jsonl[&status=paid...] as a download."""
+    fmt = request.GET.get('format', 'csv')
+    try:
+        since = datetime.date.fromisoformat(request.GET.get('since', ''))
+        until = datetime.date.fromisoformat(request.GET.get('until') or since.isoformat())
+    except ValueError:
+        return HttpResponseBadRequest("since and until must be YYYY-MM-DD dates")
+    if fmt not in export.FORMATS or until < since:
+        return HttpResponseBadRequest(f"format must be one of {', '.join(export.FORMATS)} and until not before since")
+    max_days = getattr(settings, 'ORDER_EXPORT_MAX_DAYS', 31)
+    if (until - since).days + 1 > max_days:
+        return HttpResponseBadRequest(f"At most {max_days} days per download; use manage.py export_orders for longer ranges")
+    start, end = export.day_range(since, until)
+    response = StreamingHttpResponse(export.export_lines(fmt, start, end, request.GET.getlist('status')),
+                                     content_type=export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders-{since}-{until}.{fmt}"'
+    return response
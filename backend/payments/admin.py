@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import CaptureJob
 
-# Register your models here.
+@admin.register(CaptureJob)
+class CaptureJobAdmin(admin.ModelAdmin):
+    list_display = ('id','order','razorpay_payment_id','status','attempts','run_after','updated_at')
+    list_filter = ('status',)
+    search_fields = ('razorpay_payment_id','razorpay_order_id')
+    raw_id_fields = ('order',)
@@ -0,0 +1,122 @@
+"""
+A local stand-in for the Razorpay orders/payments API, for load-testing
+payments.gateway offline (``manage.py fake_payment_gateway``).
+
+Implements POST /v1/orders, GET /v1/orders/<id> and
+POST /v1/payments/<id>/capture with in-memory state, plus injected latency,
+5xx errors and hung requests. Credentials are not checked.
+"""
+import collections
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, jitter_ms=0, error_rate=0.0, hang_rate=0.0, hang_seconds=30):
+        super().__init__(address, FakeGatewayHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.captured = {}
+        self.capture_calls = collections.Counter()
+        self.ids = itertools.count(1)
+        self.requests = 0
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, code, description):
+        self._send(status, {'error': {'code': code, 'description': description}})
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw or b'{}')
+        except ValueError:
+            return {}
+
+    def _simulate(self):
+        """Apply the configured latency and faults; False if the request was answered with an error."""
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        roll = random.random()
+        if roll < server.hang_rate:
+            time.sleep(server.hang_seconds)
+        elif server.latency_ms or server.jitter_ms:
+            time.sleep(max(server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms), 0) / 1000)
+        if roll >= server.hang_rate and roll < server.hang_rate + server.error_rate:
+            self._error(503, 'SERVER_ERROR', 'Injected failure')
+            return False
+        return True
+
+    def do_POST(self):
+        body = self._body()
+        if not self._simulate():
+            return
+        server = self.server
+        if self.path.rstrip('/') == '/v1/orders':
+            amount = body.get('amount')
+            if not isinstance(amount, int) or amount < 100:
+                return self._error(400, 'BAD_REQUEST_ERROR', 'The amount must be atleast INR 1.00')
+            with server.lock:
+                order = {
+                    'id': f'order_fake{next(server.ids):010d}', 'entity': 'order', 'amount': amount,
+                    'amount_paid': 0, 'currency': body.get('currency', 'INR'), 'receipt': body.get('receipt'),
+                    'status': 'created', 'attempts': 0, 'created_at': int(time.time()),
+                }
+                server.orders[order['id']] = order
+            return self._send(200, order)
+        match = re.fullmatch(r'/v1/payments/([\w-]+)/capture/?', self.path)
+        if match:
+            payment_id = match.group(1)
+            with server.lock:
+                server.capture_calls[payment_id] += 1
+                if payment_id in server.captured:
+                    return self._error(400, 'BAD_REQUEST_ERROR', 'This payment has already been captured')
+                payment = {'id': payment_id, 'entity': 'payment', 'amount': body.get('amount'),
+                           'currency': body.get('currency', 'INR'), 'status': 'captured', 'captured': True}
+                server.captured[payment_id] = payment
+            return self._send(200, payment)
+        self._error(404, 'BAD_REQUEST_ERROR', 'The requested URL was not found on the server.')
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        match = re.fullmatch(r'/v1/orders/([\w-]+)/?', self.path)
+        order = self.server.orders.get(match.group(1)) if match else None
+        if order is None:
+            return self._error(400, 'BAD_REQUEST_ERROR', 'The id provided does not exist')
+        self._send(200, order)
+
+
+def start(port=0, **options):
+    """Start a server on 127.0.0.1 in a daemon thread; returns it (``server.server_port`` has the port)."""
+    server = FakeGatewayServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,226 @@
+"""
+Payment gateway client.
+
+One razorpay.Client per worker process, sharing a keep-alive connection pool,
+with connect/read timeouts on every request so a slow gateway can't hold a
+worker indefinitely. Calls go through ``call()``:
+
+- transport failures and 5xx answers are retried with jittered exponential
+  backoff. Calls that are not safe to repeat (creating an order, capturing a
+  payment) are only retried when the request provably never reached the
+  gateway (the connection could not be opened);
+- a circuit breaker opens after PAYMENT_GATEWAY_BREAKER_FAILURES consecutive
+  failures and fails calls fast with GatewayUnavailable until
+  PAYMENT_GATEWAY_BREAKER_RESET_SECONDS have passed, then lets one trial call
+  through;
+- every attempt is timed in bookbazaar.metrics as ``payments.gateway.<op>``.
+
+Signature checks are local HMACs and don't go through the breaker.
+"""
+import os
+import random
+import threading
+import time
+
+import razorpay
+import requests
+from django.conf import settings
+from razorpay.errors import ServerError, SignatureVerificationError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from bookbazaar import metrics
+
+
+class PaymentGatewayError(Exception):
+    """A gateway call failed after retries."""
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    """The circuit breaker is open; the gateway was not called."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class TimeoutSession(requests.Session):
+    """A Session that applies a default (connect, read) timeout to every request."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session():
+    session = TimeoutSession((_setting('PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.05),
+                              _setting('PAYMENT_GATEWAY_READ_TIMEOUT', 10)))
+    # retries are done by call(), which knows which operations are safe to repeat
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_setting('PAYMENT_GATEWAY_POOL_SIZE', 10), max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_client(session=None):
+    return razorpay.Client(
+        session=session or build_session(),
+        auth=(_setting('RAZORPAY_KEY_ID', ''), _setting('RAZORPAY_KEY_SECRET', '')),
+        base_url=_setting('RAZORPAY_BASE_URL', 'https://api.razorpay.com'),
+    )
+
+
+_client_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+def get_client():
+    """The process-wide client (rebuilt after a fork so workers never share sockets)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client, _client_pid = build_client(), pid
+    return _client
+
+
+def reset_client():
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.session.close()
+        _client = _client_pid = None
+    breaker.reset()
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failures=None, reset_seconds=None):
+        self._failures_setting = failures
+        self._reset_setting = reset_seconds
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def threshold(self):
+        return self._failures_setting or _setting('PAYMENT_GATEWAY_BREAKER_FAILURES', 5)
+
+    @property
+    def reset_seconds(self):
+        return self._reset_setting or _setting('PAYMENT_GATEWAY_BREAKER_RESET_SECONDS', 30)
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = 0.0
+
+    def allow(self):
+        """True if a call may go out now. In half-open state only one trial call is let through."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    metrics.incr('payments.gateway.breaker_opened')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+
+def _never_sent(exc):
+    """True if ``exc`` means the request never left this process."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        reason = exc.args[0] if exc.args else None
+        return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+    return False
+
+
+def call(op, func, *args, idempotent=False, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` (a client method) with the breaker, retries
+    and timing described in the module docstring. Gateway 4xx errors
+    (razorpay BadRequestError etc.) are raised unchanged and count as success
+    for the breaker: the gateway answered.
+    """
+    retries = _setting('PAYMENT_GATEWAY_MAX_RETRIES', 2)
+    backoff = _setting('PAYMENT_GATEWAY_BACKOFF', 0.2)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            metrics.incr('payments.gateway.short_circuited')
+            raise GatewayUnavailable("Payment gateway is unavailable, please try again shortly.")
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except (requests.exceptions.RequestException, ServerError) as e:
+            metrics.observe(f'payments.gateway.{op}', time.perf_counter() - start)
+            metrics.incr('payments.gateway.errors')
+            breaker.failure()
+            if attempt >= retries or not (idempotent or _never_sent(e)):
+                raise PaymentGatewayError(f"{op} failed: {e}") from e
+            attempt += 1
+            metrics.incr('payments.gateway.retries')
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+            continue
+        except Exception:
+            metrics.observe(f'payments.gateway.{op}', time.perf_counter() - start)
+            breaker.success()
+            raise
+        metrics.observe(f'payments.gateway.{op}', time.perf_counter() - start)
+        breaker.success()
+        return result
+
+
+# ---- operations ----
+
+def create_order(amount_paise, receipt=None, currency='INR'):
+    data = {'amount': int(amount_paise), 'currency': currency, 'payment_capture': '0'}
+    if receipt is not None:
+        data['receipt'] = str(receipt)
+    return call('create_order', get_client().order.create, data)
+
+
+def fetch_order(razorpay_order_id):
+    return call('fetch_order', get_client().order.fetch, razorpay_order_id, idempotent=True)
+
+
+def capture_payment(razorpay_payment_id, amount_paise):
+    return call('capture_payment', get_client().payment.capture, razorpay_payment_id, int(amount_paise))
+
+
+def verify_payment_signature(params):
+    """Raises razorpay.errors.SignatureVerificationError if the checkout callback wasn't signed by the gateway."""
+    return get_client().utility.verify_payment_signature(params)
+
+
+def verify_webhook_signature(body, signature):
+    """Raises SignatureVerificationError unless ``body`` (str) was signed with RAZORPAY_WEBHOOK_SECRET."""
+    secret = _setting('RAZORPAY_WEBHOOK_SECRET', '')
+    if not secret:
+        raise SignatureVerificationError('RAZORPAY_WEBHOOK_SECRET is not set')
+    return get_client().utility.verify_webhook_signature(body, signature, secret)
@@ -0,0 +1,213 @@
+"""
+Payment capture queue.
+
+verify_payment only checks the checkout signature and calls
+``enqueue_capture()``; the capture itself (commit the stock holds, fetch the
+gateway order for the exact amount, capture, mark the order paid) runs in a
+worker:
+
+- ``manage.py run_payment_worker`` polls the CaptureJob table (the default,
+  PAYMENT_QUEUE_BACKEND = "db");
+- with PAYMENT_QUEUE_BACKEND = "celery" each new job is also sent to Celery
+  (CELERY_BROKER_URL) once the enqueueing transaction commits. The table
+  stays the record, so the polling worker still picks up a job whose message
+  was lost.
+
+Workers claim a job with a conditional UPDATE that pushes its run_after
+forward (a lease), so two workers never capture the same payment at once.
+Gateway failures are retried with exponential backoff up to
+PAYMENT_JOB_MAX_ATTEMPTS. A payment whose gateway order is for a different
+amount than the order total is never captured: the job fails and the order
+stays unpaid. ``handle_event()`` reconciles webhook events, so a
+payment is captured even if the customer never came back from the gateway.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from razorpay.errors import BadRequestError
+
+from bookbazaar import metrics
+from orders import inventory, states
+from orders.models import Order
+from products.pricing import to_paise
+from . import gateway
+from .models import CaptureJob
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _dispatch(job):
+    if _setting('PAYMENT_QUEUE_BACKEND', 'db') != 'celery':
+        return
+    try:
+        from .tasks import capture_job
+    except ImportError as exc:
+        raise ImproperlyConfigured("PAYMENT_QUEUE_BACKEND is 'celery' but the celery package is not installed") from exc
+    transaction.on_commit(lambda: capture_job.delay(job.pk))
+
+
+def enqueue_capture(order, razorpay_order_id, razorpay_payment_id):
+    """Queue the capture of an authorized payment (once per payment id); returns the CaptureJob."""
+    job, created = CaptureJob.objects.get_or_create(
+        razorpay_payment_id=razorpay_payment_id,
+        defaults={'order': order, 'razorpay_order_id': razorpay_order_id or '', 'run_after': timezone.now()},
+    )
+    if created:
+        metrics.incr('payments.capture.enqueued')
+        _dispatch(job)
+    return job
+
+
+def claim(limit=20, job_id=None, now=None):
+    """Lease up to ``limit`` due jobs to the caller and return them."""
+    now = now or timezone.now()
+    due = CaptureJob.objects.filter(status=CaptureJob.QUEUED, run_after__lte=now)
+    if job_id is not None:
+        due = due.filter(pk=job_id)
+    lease = now + datetime.timedelta(seconds=_setting('PAYMENT_JOB_LEASE_SECONDS', 120))
+    claimed = [
+        pk for pk in due.order_by('run_after').values_list('pk', flat=True)[:limit]
+        if CaptureJob.objects.filter(pk=pk, status=CaptureJob.QUEUED, run_after__lte=now)
+        .update(run_after=lease, attempts=F('attempts') + 1)
+    ]
+    return list(CaptureJob.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def mark_paid(razorpay_payment_id, order=None, razorpay_order_id=''):
+    """
+    Record a captured payment: the order becomes paid (orders.states) and its
+    capture job done. Returns True if this call moved the order to paid.
+    """
+    order = order or Order.objects.filter(razorpay_order_id=razorpay_order_id).first()
+    if order is None:
+        return False
+    try:
+        moved = states.transition(order, Order.PAID, f'payment {razorpay_payment_id} captured',
+                                  razorpay_payment_id=razorpay_payment_id)
+    except states.InvalidTransition as e:
+        logger.error("Payment %s was captured but %s", razorpay_payment_id, e)
+        moved = False
+    # if this is lost the job runs again, finds the order paid and ends up here
+    CaptureJob.objects.filter(razorpay_payment_id=razorpay_payment_id).exclude(status=CaptureJob.DONE) \
+        .update(status=CaptureJob.DONE, last_error='')
+    return moved
+
+
+def _fail(job, error):
+    CaptureJob.objects.filter(pk=job.pk).update(status=CaptureJob.FAILED, last_error=error)
+    metrics.incr('payments.capture.failed')
+    logger.error("Capture of payment %s for order %s failed: %s", job.razorpay_payment_id, job.order_id, error)
+    return False
+
+
+def _retry(job, error):
+    if job.attempts >= _setting('PAYMENT_JOB_MAX_ATTEMPTS', 8):
+        return _fail(job, error)
+    delay = min(_setting('PAYMENT_JOB_RETRY_SECONDS', 10) * 2 ** (job.attempts - 1), 3600)
+    CaptureJob.objects.filter(pk=job.pk).update(
+        run_after=timezone.now() + datetime.timedelta(seconds=delay), last_error=error,
+    )
+    metrics.incr('payments.capture.retried')
+    return False
+
+
+def run(job):
+    """Capture one claimed job; returns True if the payment is now captured."""
+    order = Order.objects.get(pk=job.order_id)
+    if order.status == Order.PAID and order.razorpay_payment_id == job.razorpay_payment_id:
+        mark_paid(job.razorpay_payment_id, order=order)
+        return True
+    # an uncaptured payment is refunded by the gateway on its own
+    if not states.claim_payment(order, job.razorpay_payment_id):
+        return _fail(job, f"Order is {order.status} with payment {order.razorpay_payment_id or '-'}; not captured")
+    if order.status != Order.RESERVED:
+        return _fail(job, f"Order is {order.status}; not captured")
+    amount = to_paise(order.total)
+    if job.razorpay_order_id:
+        try:
+            razor_amount = int(gateway.fetch_order(job.razorpay_order_id).get('amount') or 0)
+        except BadRequestError as e:
+            return _fail(job, str(e))
+        except gateway.PaymentGatewayError as e:
+            return _retry(job, str(e))
+        if razor_amount != amount:
+            # tampering or a bug either way: leave the order unpaid for someone to look at
+            metrics.incr('payments.capture.amount_mismatch')
+            return _fail(job, f"Gateway order {job.razorpay_order_id} is for {razor_amount} paise but the order "
+                              f"total is {amount}; not captured")
+    try:
+        inventory.commit(order)
+    except inventory.OutOfStock as e:
+        states.transition(order, Order.CANCELLED, 'sold out before capture')
+        return _fail(job, f"Stock gone before capture: {e}")
+    with metrics.timer('payments.capture'):
+        try:
+            gateway.capture_payment(job.razorpay_payment_id, amount)
+        except BadRequestError as e:
+            # a retry after a lost response, or a capture from the gateway dashboard
+            if 'already been captured' not in str(e):
+                return _fail(job, str(e))
+        except gateway.PaymentGatewayError as e:
+            return _retry(job, str(e))
+    mark_paid(job.razorpay_payment_id, order=order)
+    metrics.incr('payments.capture.captured')
+    return True
+
+
+def run_due(limit=20):
+    """Claim and run due jobs; returns (captured, not captured)."""
+    done = failed = 0
+    jobs = claim(limit)
+    for i, job in enumerate(jobs):
+        try:
+            captured = run(job)
+        except Exception:
+            # hand the unfinished jobs back instead of leaving them leased
+            CaptureJob.objects.filter(pk__in=[j.pk for j in jobs[i:]], status=CaptureJob.QUEUED) \
+                .update(run_after=timezone.now())
+            raise
+        if captured:
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+# ---- webhook events ----
+
+def handle_event(event):
+    """
+    Apply one gateway webhook event. Returns False for events that are
+    ignored (unknown type or order); the webhook still answers 200 so the
+    gateway doesn't redeliver them.
+    """
+    kind = event.get('event', '')
+    payment = ((event.get('payload') or {}).get('payment') or {}).get('entity') or {}
+    payment_id, razorpay_order_id = payment.get('id'), payment.get('order_id')
+    metrics.incr(f'payments.webhook.{kind or "unknown"}')
+    if not (payment_id and razorpay_order_id):
+        return False
+    if kind == 'payment.authorized':
+        order = Order.objects.filter(razorpay_order_id=razorpay_order_id).first()
+        if order is None:
+            logger.warning("Webhook for unknown gateway order %s", razorpay_order_id)
+            return False
+        if not states.claim_payment(order, payment_id):
+            logger.warning("Payment %s authorized for order %s, which is %s with another payment; not captured",
+                           payment_id, order.pk, order.status)
+            return False
+        enqueue_capture(order, razorpay_order_id, payment_id)
+        return True
+    if kind in ('payment.captured', 'order.paid'):
+        mark_paid(payment_id, razorpay_order_id=razorpay_order_id)
+        return True
+    return False
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from bookbazaar import metrics
+from payments import fake_gateway, gateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test payments.gateway against the fake gateway (started in-process unless --url "
+        "is given). Reports call latency percentiles, failures and breaker short-circuits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='', help="Gateway base URL (default: start a fake gateway).")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--latency-ms', type=float, default=20)
+        parser.add_argument('--jitter-ms', type=float, default=5)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--hang-rate', type=float, default=0.0)
+        parser.add_argument('--hang-seconds', type=float, default=30)
+        parser.add_argument('--fresh-client', action='store_true',
+                            help="Build a new client (new connection) per call, as the views used to.")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server = fake_gateway.start(
+                latency_ms=options['latency_ms'], jitter_ms=options['jitter_ms'], error_rate=options['error_rate'],
+                hang_rate=options['hang_rate'], hang_seconds=options['hang_seconds'],
+            )
+            url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            with override_settings(RAZORPAY_BASE_URL=url):
+                gateway.reset_client()
+                metrics.reset()
+                self._run(options)
+        finally:
+            gateway.reset_client()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    def _run(self, options):
+        fresh = options['fresh_client']
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                if fresh:
+                    client = gateway.build_client()
+                    gateway.call('create_order', client.order.create,
+                                 {'amount': 10000 + i, 'currency': 'INR', 'payment_capture': '0'})
+                    client.session.close()
+                else:
+                    gateway.create_order(10000 + i, receipt=i)
+                outcome = 'ok'
+            except gateway.GatewayUnavailable:
+                outcome = 'short-circuited'
+            except gateway.PaymentGatewayError:
+                outcome = 'failed'
+            return time.perf_counter() - start, outcome
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(one, range(options['requests'])))
+        wall = time.perf_counter() - started
+
+        times = sorted(t * 1000 for t, _ in results)
+
+        def pct(p):
+            return times[min(int(len(times) * p), len(times) - 1)]
+
+        outcomes = {}
+        for _, outcome in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        self.stdout.write(
+            f"{len(results)} calls in {wall:.2f}s ({len(results) / wall:.0f}/s), "
+            f"client: {'new per call' if fresh else 'pooled'}"
+        )
+        self.stdout.write(f"p50 {pct(0.5):.1f} ms  p95 {pct(0.95):.1f} ms  p99 {pct(0.99):.1f} ms  max {times[-1]:.1f} ms")
+        self.stdout.write("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+        counters = metrics.snapshot()['counters']
+        counts = [f"{k.rsplit('.', 1)[1]}={v}" for k, v in sorted(counters.items()) if k.startswith('payments.gateway.')]
+        self.stdout.write(f"gateway: {', '.join(counts) or 'no errors'}; breaker {gateway.breaker.state}")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from payments.fake_gateway import FakeGatewayServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local fake of the Razorpay orders/payments API with injectable latency and "
+        "faults. Point RAZORPAY_BASE_URL at it (http://127.0.0.1:<port>)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=50)
+        parser.add_argument('--jitter-ms', type=float, default=20)
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 503.")
+        parser.add_argument('--hang-rate', type=float, default=0.0, help="Fraction of requests that stall.")
+        parser.add_argument('--hang-seconds', type=float, default=30, help="How long a stalled request stalls.")
+
+    def handle(self, *args, **options):
+        server = FakeGatewayServer(
+            ('127.0.0.1', options['port']), latency_ms=options['latency_ms'], jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'], hang_rate=options['hang_rate'], hang_seconds=options['hang_seconds'],
+        )
+        self.stdout.write(f"Fake payment gateway on http://127.0.0.1:{server.server_port} (Ctrl-C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.jobs import run_due
+
+
+class Command(BaseCommand):
+    help = "Capture queued payments (payments.jobs). Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the due jobs once and exit.")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = run_due(limit=options['batch_size'])
+            if done or failed:
+                self.stdout.write(f"Captured {done} payments ({failed} not captured, see CaptureJob).")
+            if options['once']:
+                return
+            if not (done or failed):
+                time.sleep(options['interval'])
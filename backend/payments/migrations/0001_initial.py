@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('orders', '0006_stock_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaptureJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razorpay_order_id', models.CharField(blank=True, default='', max_length=200)),
+                ('razorpay_payment_id', models.CharField(max_length=200, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capture_jobs', to='orders.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='payments_job_status_run_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,34 @@
 from django.db import models
 
-# Create your models here.
+
+class CaptureJob(models.Model):
+    """
+    A queued capture of an authorized payment (see payments.jobs). One row
+    per gateway payment id, so enqueueing the same payment twice (checkout
+    callback and webhook) is harmless.
+    """
+    QUEUED, DONE, FAILED = 'queued', 'done', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    order = models.ForeignKey('orders.Order', related_name='capture_jobs', on_delete=models.CASCADE)
+    razorpay_order_id = models.CharField(max_length=200, blank=True, default='')
+    razorpay_payment_id = models.CharField(max_length=200, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # due time; a worker that claims the job pushes it forward by PAYMENT_JOB_LEASE_SECONDS
+    run_after = models.DateTimeField()
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='payments_job_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"Capture {self.razorpay_payment_id} for order {self.order_id} ({self.status})"
@@ -0,0 +1,10 @@
+"""Celery tasks (PAYMENT_QUEUE_BACKEND = "celery"); see payments.jobs."""
+from bookbazaar.celery import app
+
+from . import jobs
+
+
+@app.task(name='payments.capture_job', ignore_result=True)
+def capture_job(job_id):
+    for job in jobs.claim(limit=1, job_id=job_id):
+        jobs.run(job)
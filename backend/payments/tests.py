@@ -1,3 +1,226 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import json
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from razorpay.errors import BadRequestError, ServerError
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from orders import inventory
+from orders.models import Order, StockHold
+from products.models import Book
+from . import gateway, jobs
+from .models import CaptureJob
+
+
+@override_settings(ANALYTICS_SINK='off')
+class PaymentTestCase(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', slug='dune', price=399, stock=5)
+        self.order = Order.objects.create(status=Order.RESERVED, total=399, razorpay_order_id='order_1')
+        inventory.reserve(self.order, [(self.book.pk, 1)])
+        self.gateway_order = {'id': 'order_1', 'amount': 39900}
+        self.fetch_order = self.patch_gateway('fetch_order', side_effect=lambda order_id: self.gateway_order)
+        self.capture_payment = self.patch_gateway('capture_payment')
+
+    def patch_gateway(self, name, **kwargs):
+        patcher = mock.patch.object(gateway, name, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def refresh(self):
+        self.order.refresh_from_db()
+        return self.order
+
+
+class CaptureJobTests(PaymentTestCase):
+    def test_capture_marks_the_order_paid(self):
+        job = jobs.enqueue_capture(self.order, 'order_1', 'pay_1')
+        self.assertEqual(jobs.enqueue_capture(self.order, 'order_1', 'pay_1'), job)
+        self.assertEqual(jobs.run_due(), (1, 0))
+        self.capture_payment.assert_called_once_with('pay_1', 39900)
+        self.assertEqual((self.refresh().status, self.order.razorpay_payment_id), (Order.PAID, 'pay_1'))
+        self.assertEqual(CaptureJob.objects.get().status, CaptureJob.DONE)
+        self.assertEqual(list(self.order.holds.values_list('status', flat=True)), [StockHold.COMMITTED])
+
+    def test_amount_mismatch_is_not_captured(self):
+        self.gateway_order['amount'] = 100
+        jobs.enqueue_capture(self.order, 'order_1', 'pay_1')
+        with self.assertLogs('payments.jobs', 'ERROR') as logs:
+            self.assertEqual(jobs.run_due(), (0, 1))
+        self.capture_payment.assert_not_called()
+        job = CaptureJob.objects.get()
+        self.assertEqual(job.status, CaptureJob.FAILED)
+        self.assertIn('is for 100 paise but the order total is 39900', job.last_error)
+        self.assertIn('not captured', logs.output[0])
+        self.assertEqual(self.refresh().status, Order.RESERVED)
+        self.assertEqual(list(self.order.holds.values_list('status', flat=True)), [StockHold.HELD])
+
+    def test_gateway_errors_are_retried_with_backoff(self):
+        self.capture_payment.side_effect = gateway.PaymentGatewayError('capture_payment failed: timeout')
+        jobs.enqueue_capture(self.order, 'order_1', 'pay_1')
+        self.assertEqual(jobs.run_due(), (0, 1))
+        job = CaptureJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (CaptureJob.QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(self.refresh().status, Order.RESERVED)
+
+    def test_a_claimed_job_is_leased_to_one_worker(self):
+        job = jobs.enqueue_capture(self.order, 'order_1', 'pay_1')
+        self.assertEqual(jobs.claim(), [job])
+        self.assertEqual(jobs.claim(), [])
+        after_lease = timezone.now() + datetime.timedelta(seconds=121)
+        self.assertEqual(jobs.claim(now=after_lease), [job])
+
+    def test_another_payment_for_a_claimed_order_is_not_captured(self):
+        jobs.enqueue_capture(self.order, 'order_1', 'pay_1')
+        jobs.enqueue_capture(self.order, 'order_1', 'pay_2')
+        with self.assertLogs('payments.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_due(), (1, 1))
+        self.capture_payment.assert_called_once_with('pay_1', 39900)
+        self.assertEqual(CaptureJob.objects.get(razorpay_payment_id='pay_2').status, CaptureJob.FAILED)
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+class WebhookTests(PaymentTestCase):
+    def post(self, event, secret='whsec'):
+        body = json.dumps(event)
+        signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(reverse('payments:webhook'), body, content_type='application/json',
+                                HTTP_X_RAZORPAY_SIGNATURE=signature)
+
+    def event(self, kind, payment_id='pay_1'):
+        return {'event': kind, 'payload': {'payment': {'entity': {'id': payment_id, 'order_id': 'order_1'}}}}
+
+    def test_authorized_payment_is_queued_for_capture(self):
+        self.assertEqual(self.post(self.event('payment.authorized')).status_code, 200)
+        self.assertEqual(self.post(self.event('payment.authorized')).status_code, 200)
+        job = CaptureJob.objects.get()
+        self.assertEqual((job.razorpay_payment_id, job.order_id), ('pay_1', self.order.pk))
+        self.assertEqual(self.refresh().razorpay_payment_id, 'pay_1')
+
+    def test_captured_payment_marks_the_order_paid(self):
+        self.post(self.event('payment.authorized'))
+        self.assertEqual(self.post(self.event('payment.captured')).status_code, 200)
+        self.assertEqual(self.refresh().status, Order.PAID)
+        self.assertEqual(CaptureJob.objects.get().status, CaptureJob.DONE)
+
+    def test_unsigned_events_are_rejected(self):
+        self.assertEqual(self.post(self.event('payment.captured'), secret='guess').status_code, 400)
+        self.assertEqual(self.refresh().status, Order.RESERVED)
+        self.assertFalse(CaptureJob.objects.exists())
+
+
+@override_settings(PAYMENT_GATEWAY_BREAKER_FAILURES=3, PAYMENT_GATEWAY_BREAKER_RESET_SECONDS=30,
+                   PAYMENT_GATEWAY_MAX_RETRIES=2, PAYMENT_GATEWAY_BACKOFF=0)
+class GatewayTestCase(SimpleTestCase):
+    def setUp(self):
+        gateway.breaker.reset()
+        self.addCleanup(gateway.breaker.reset)
+        self.now = 1000.0
+        for target in ('monotonic', 'sleep'):
+            patcher = mock.patch.object(gateway.time, target, side_effect=getattr(self, target))
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def failing(self, exc=None):
+        return mock.Mock(side_effect=exc or requests.exceptions.ConnectionError('reset by peer'))
+
+
+class CircuitBreakerTests(GatewayTestCase):
+    def trip(self):
+        for _ in range(3):
+            with self.assertRaises(gateway.PaymentGatewayError):
+                gateway.call('fetch_order', self.failing())
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        self.trip()
+        self.assertEqual(gateway.breaker.state, gateway.CircuitBreaker.OPEN)
+        func = mock.Mock()
+        with self.assertRaises(gateway.GatewayUnavailable):
+            gateway.call('fetch_order', func, idempotent=True)
+        func.assert_not_called()
+
+    def test_a_success_resets_the_failure_count(self):
+        gateway.call('fetch_order', self.failing([requests.exceptions.ConnectionError(), 'ok']), idempotent=True)
+        self.assertEqual((gateway.breaker.state, gateway.breaker.failures), (gateway.CircuitBreaker.CLOSED, 0))
+
+    def test_half_opens_after_the_reset_period_and_closes_on_success(self):
+        self.trip()
+        self.now += 29
+        self.assertFalse(gateway.breaker.allow())
+        self.now += 1
+        func = mock.Mock(return_value='ok')
+        self.assertEqual(gateway.call('fetch_order', func), 'ok')
+        self.assertEqual(gateway.breaker.state, gateway.CircuitBreaker.CLOSED)
+
+    def test_only_one_trial_call_while_half_open(self):
+        self.trip()
+        self.now += 30
+        self.assertTrue(gateway.breaker.allow())
+        self.assertEqual(gateway.breaker.state, gateway.CircuitBreaker.HALF_OPEN)
+        self.assertFalse(gateway.breaker.allow())
+
+    def test_a_failed_trial_reopens_the_breaker(self):
+        self.trip()
+        self.now += 30
+        func = self.failing()
+        with self.assertRaises(gateway.PaymentGatewayError):
+            gateway.call('fetch_order', func, idempotent=True)
+        func.assert_called_once()
+        self.assertEqual((gateway.breaker.state, gateway.breaker.opened_at), (gateway.CircuitBreaker.OPEN, self.now))
+        with self.assertRaises(gateway.GatewayUnavailable):
+            gateway.call('fetch_order', mock.Mock())
+
+    def test_gateway_rejections_count_as_success(self):
+        for _ in range(5):
+            with self.assertRaises(BadRequestError):
+                gateway.call('fetch_order', self.failing(BadRequestError('bad order id')))
+        self.assertEqual(gateway.breaker.state, gateway.CircuitBreaker.CLOSED)
+
+
+@override_settings(PAYMENT_GATEWAY_BREAKER_FAILURES=10)
+class RetryTests(GatewayTestCase):
+    def never_connected(self):
+        reason = MaxRetryError(None, '/v1/orders', NewConnectionError(None, 'Connection refused'))
+        return requests.exceptions.ConnectionError(reason)
+
+    def test_idempotent_calls_are_retried(self):
+        func = self.failing([requests.exceptions.ReadTimeout(), ServerError('502'), {'id': 'order_1'}])
+        self.assertEqual(gateway.call('fetch_order', func, 'order_1', idempotent=True), {'id': 'order_1'})
+        self.assertEqual(func.call_count, 3)
+        func.assert_called_with('order_1')
+
+    def test_retries_are_bounded(self):
+        func = self.failing()
+        with self.assertRaisesMessage(gateway.PaymentGatewayError, 'fetch_order failed'):
+            gateway.call('fetch_order', func, idempotent=True)
+        self.assertEqual(func.call_count, 3)
+
+    def test_calls_that_may_have_reached_the_gateway_are_not_resent(self):
+        for exc in (requests.exceptions.ReadTimeout('read timed out'), ServerError('502'),
+                    requests.exceptions.ConnectionError('reset by peer')):
+            with self.subTest(exc=type(exc).__name__):
+                func = self.failing(exc)
+                with self.assertRaises(gateway.PaymentGatewayError) as cm:
+                    gateway.call('capture_payment', func, 'pay_1', 39900)
+                func.assert_called_once_with('pay_1', 39900)
+                self.assertIs(cm.exception.__cause__, exc)
+
+    def test_calls_that_never_left_are_retried(self):
+        for exc in (requests.exceptions.ConnectTimeout('connect timed out'), self.never_connected()):
+            with self.subTest(exc=type(exc).__name__):
+                func = self.failing([exc, {'id': 'pay_1'}])
+                self.assertEqual(gateway.call('capture_payment', func, 'pay_1', 39900), {'id': 'pay_1'})
+                self.assertEqual(func.call_count, 2)
@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import razorpay_webhook
+
+app_name = "payments"
+
+urlpatterns = [
+    path('webhook/', razorpay_webhook, name='webhook'),
+]
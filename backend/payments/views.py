@@ -1,3 +1,27 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from razorpay.errors import SignatureVerificationError
+
+from . import gateway, jobs
+
+
+@csrf_exempt
+@require_POST
+def razorpay_webhook(request):
+    """
+    Gateway webhook (payment.authorized, payment.captured, order.paid).
+    Verifies the X-Razorpay-Signature HMAC, applies the event and answers
+    at once; captures themselves run in the payment worker.
+    """
+    signature = request.headers.get('X-Razorpay-Signature', '')
+    try:
+        body = request.body.decode('utf-8')
+        gateway.verify_webhook_signature(body, signature)
+        event = json.loads(body)
+    except (UnicodeDecodeError, SignatureVerificationError, ValueError):
+        return HttpResponseBadRequest('Invalid webhook.')
+    jobs.handle_event(event)
+    return HttpResponse('ok')
@@ -0,0 +1,240 @@
+"""
+Typeahead suggestions from an in-memory prefix index.
+
+Each worker process keeps a sorted list of normalized titles and authors and
+answers a prefix with two bisects. Short prefixes match huge ranges, so their
+best results are precomputed at build time (one and two characters) or
+memoized on first use, and kept current as books change. Suggestions are
+ranked by units sold (OrderItem.quantity), then by id.
+
+The index is built on first use. After that, whenever the (shared) catalog
+version moves, whichever process changed the catalog, it applies the books
+changed since (by ``updated_at``) and drops deleted ones. It is also fully
+rebuilt in the background every AUTOCOMPLETE_REFRESH_SECONDS to pick up new
+sales figures.
+"""
+import datetime
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Sum
+
+from .cache import catalog_version
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+# ranges up to this size are ranked on the fly; larger ones are memoized
+SCAN_LIMIT = 256
+MAX_MEMOIZED = 20000
+PRECOMPUTED_PREFIX_LENGTH = 2
+# changes are re-read this far back: a save stamped earlier can commit after a later one
+CHANGE_LOOKBACK = datetime.timedelta(seconds=5)
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self._keys = []          # sorted normalized titles/authors
+        self._ids = array('q')   # book id for each key
+        self._books = {}         # id -> (score, title, author, slug)
+        self._top = {}           # memoized prefix -> best ids, best first
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._books)
+
+    def ids(self):
+        with self._lock:
+            return set(self._books)
+
+    @staticmethod
+    def _book_keys(title, author):
+        return {k for k in (normalize(title), normalize(author)) if k}
+
+    def build(self, rows):
+        """Replace the contents with ``rows`` of (id, title, author, slug, score)."""
+        books = {}
+        pairs = []
+        for book_id, title, author, slug, score in rows:
+            books[book_id] = (score, title, author, slug)
+            pairs.extend((key, book_id) for key in self._book_keys(title, author))
+        pairs.sort()
+        fresh = PrefixIndex(self.top_k)
+        fresh._keys = [key for key, _ in pairs]
+        fresh._ids = array('q', (book_id for _, book_id in pairs))
+        fresh._books = books
+        fresh._precompute()
+        with self._lock:
+            self._keys, self._ids, self._books, self._top = fresh._keys, fresh._ids, fresh._books, fresh._top
+
+    def _precompute(self):
+        for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+            for prefix in {key[:length] for key in self._keys}:
+                lo, hi = self._range(prefix)
+                if hi - lo > SCAN_LIMIT:
+                    self._top[prefix] = self._best(lo, hi)
+
+    @property
+    def _depth(self):
+        # memoized lists keep spare entries so removals rarely force a rescan
+        return self.top_k * 2
+
+    def _memo_remove(self, book_id, key):
+        for end in range(1, len(key) + 1):
+            ranked = self._top.get(key[:end])
+            if ranked is not None and book_id in ranked:
+                ranked.remove(book_id)
+                if len(ranked) < self.top_k:
+                    del self._top[key[:end]]
+
+    def _memo_add(self, book_id, key):
+        rank = self._rank(book_id)
+        for end in range(1, len(key) + 1):
+            ranked = self._top.get(key[:end])
+            if ranked is None or book_id in ranked:
+                continue
+            if len(ranked) < self._depth or rank > self._rank(ranked[-1]):
+                ranked.append(book_id)
+                ranked.sort(key=self._rank, reverse=True)
+                del ranked[self._depth:]
+
+    def remove(self, book_id):
+        with self._lock:
+            book = self._books.pop(book_id, None)
+            if book is None:
+                return
+            for key in self._book_keys(book[1], book[2]):
+                i = bisect_left(self._keys, key)
+                while i < len(self._keys) and self._keys[i] == key:
+                    if self._ids[i] == book_id:
+                        del self._keys[i]
+                        del self._ids[i]
+                        break
+                    i += 1
+                self._memo_remove(book_id, key)
+
+    def upsert(self, book_id, title, author, slug, score=None):
+        """Add or replace one book; ``score`` None keeps the current score."""
+        with self._lock:
+            if score is None:
+                score = self._books.get(book_id, (0,))[0]
+            self.remove(book_id)
+            self._books[book_id] = (score, title, author, slug)
+            for key in self._book_keys(title, author):
+                i = bisect_left(self._keys, key)
+                self._keys.insert(i, key)
+                self._ids.insert(i, book_id)
+                self._memo_add(book_id, key)
+
+    def _rank(self, book_id):
+        return (self._books[book_id][0], -book_id)
+
+    def _range(self, prefix):
+        lo = bisect_left(self._keys, prefix)
+        return lo, bisect_left(self._keys, prefix + '\uffff', lo)
+
+    def _best(self, lo, hi, count=None):
+        return heapq.nlargest(count or self._depth, set(self._ids[lo:hi]), key=self._rank)
+
+    def _ranked_ids(self, prefix, lo, hi):
+        if hi - lo <= SCAN_LIMIT:
+            return self._best(lo, hi, self.top_k)
+        ranked = self._top.get(prefix)
+        if ranked is None:
+            ranked = self._best(lo, hi)
+            if len(self._top) < MAX_MEMOIZED:
+                self._top[prefix] = ranked
+        return ranked
+
+    def query(self, prefix, limit=None):
+        """Up to ``limit`` suggestion dicts for titles or authors starting with ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        limit = min(limit or self.top_k, self.top_k)
+        with self._lock:
+            lo, hi = self._range(prefix)
+            results = []
+            for book_id in self._ranked_ids(prefix, lo, hi)[:limit]:
+                _, title, author, slug = self._books[book_id]
+                results.append({'title': title, 'author': author, 'slug': slug})
+            return results
+
+
+# ---- Process-wide index over Book ----
+_index = None
+_state = {'version': None, 'seen': None, 'built_at': 0.0, 'rebuilding': False}
+_state_lock = threading.Lock()
+
+
+def _sales():
+    from orders.models import OrderItem
+    return dict(OrderItem.objects.values_list('product_id').annotate(total=Sum('quantity')).order_by())
+
+
+def _load(index):
+    version = catalog_version()
+    seen = Book.objects.aggregate(latest=Max('updated_at'))['latest']
+    sales = _sales()
+    rows = Book.objects.values_list('id', 'title', 'author', 'slug').iterator(chunk_size=5000)
+    index.build((book_id, title, author, slug, sales.get(book_id, 0)) for book_id, title, author, slug in rows)
+    _state.update(version=version, seen=seen, built_at=time.monotonic())
+
+
+def _rebuild_in_background():
+    try:
+        _load(_index)
+    except Exception:
+        logger.exception("Autocomplete index rebuild failed")
+    finally:
+        _state['rebuilding'] = False
+        connection.close()
+
+
+def _apply_changes():
+    qs = Book.objects.order_by('updated_at')
+    if _state['seen'] is not None:
+        qs = qs.filter(updated_at__gt=_state['seen'] - CHANGE_LOOKBACK)
+    for book_id, title, author, slug, updated_at in qs.values_list('id', 'title', 'author', 'slug', 'updated_at'):
+        _index.upsert(book_id, title, author, slug)
+        if updated_at is not None and (_state['seen'] is None or updated_at > _state['seen']):
+            _state['seen'] = updated_at
+    # books deleted (here or in another process) leave the index holding more ids than the table
+    if Book.objects.count() != len(_index):
+        for book_id in _index.ids() - set(Book.objects.values_list('id', flat=True)):
+            _index.remove(book_id)
+
+
+def get_index():
+    global _index
+    with _state_lock:
+        if _index is None:
+            _index = PrefixIndex(getattr(settings, 'AUTOCOMPLETE_RESULTS', 10))
+            _load(_index)
+            return _index
+        version = catalog_version()
+        if version != _state['version']:
+            _state['version'] = version
+            _apply_changes()
+        refresh = getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 900)
+        if time.monotonic() - _state['built_at'] > refresh and not _state['rebuilding']:
+            _state['rebuilding'] = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return _index
+
+
+def book_deleted(book_id):
+    """Drop a deleted book from this process's index (other processes catch up when the version moves)."""
+    if _index is not None:
+        _index.remove(book_id)
@@ -0,0 +1,167 @@
+"""
+Catalog caching.
+
+The catalog version lives in the CatalogVersion row, which products.signals
+bumps (after commit) whenever a Book or Category is saved or deleted or a
+book's categories change, and orders.inventory whenever stock is taken or
+given back, so every worker process sees the same version
+whichever process made the change. It is read once per request (see
+``reset_request_state``), and on every call outside a request.
+
+Cached list fragments and book objects include the version in their key.
+The Django cache and the book LRU are per process, so each process's entries
+for the old version become unreachable at its next request after a bump and
+simply expire.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Prefetch
+from django.http import QueryDict
+from django.utils import timezone
+
+from bookbazaar import metrics
+from .models import Book, CatalogVersion, Category
+
+# query parameters that change the product list; anything else is ignored
+LIST_PARAMS = ('q', 'order', 'cursor', 'category', 'price')
+
+_request_state = threading.local()
+
+
+def reset_request_state(in_request=False):
+    """Forget the version read by this thread (wired to request_started/finished in products.signals)."""
+    _request_state.row = None
+    _request_state.in_request = in_request
+
+
+def _catalog_row():
+    row = getattr(_request_state, 'row', None)
+    if row is None:
+        row = CatalogVersion.objects.filter(pk=1).values_list('version', 'modified').first()
+        if row is None:
+            # start from the clock so a recreated row never reuses an old version
+            created, _ = CatalogVersion.objects.get_or_create(pk=1, defaults={'version': int(time.time() * 1000)})
+            row = (created.version, created.modified)
+        if getattr(_request_state, 'in_request', False):
+            _request_state.row = row
+    return row
+
+
+def catalog_version():
+    return _catalog_row()[0]
+
+
+def bump_catalog_version():
+    _request_state.row = None
+    _catalog_row()  # creates the row if it is missing
+    CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, modified=timezone.now())
+    _request_state.row = None
+    return catalog_version()
+
+
+def catalog_last_modified():
+    """When the catalog last changed (an aware datetime)."""
+    return _catalog_row()[1]
+
+
+def normalize_list_params(params):
+    """QueryDict of the list parameters in ``params``: known keys only, trimmed, multi-values sorted."""
+    normalized = QueryDict(mutable=True)
+    for key in LIST_PARAMS:
+        if key in ('category', 'price'):
+            values = sorted({v.strip() for v in params.getlist(key)} - {''})
+            if values:
+                normalized.setlist(key, values)
+        else:
+            value = ' '.join(params.get(key, '').split())
+            if value:
+                normalized[key] = value
+    normalized._mutable = False
+    return normalized
+
+
+def list_page_cache_key(params):
+    digest = hashlib.md5(params.urlencode().encode('utf-8')).hexdigest()
+    return f'catalog:list:{catalog_version()}:{digest}'
+
+
+def list_page_cache_ttl():
+    return getattr(settings, 'CATALOG_PAGE_CACHE_TTL', 600)
+
+
+# ---- Book objects (detail page and detail API) ----
+_MISSING = 'catalog:missing'
+
+
+class LRUCache:
+    """Small thread-safe per-process LRU."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_book_lru = LRUCache(getattr(settings, 'BOOK_CACHE_LRU_SIZE', 512))
+
+
+def get_cached_book(slug):
+    """
+    The Book with ``slug`` (categories prefetched), or None if there is none.
+
+    Lookups go through a per-process LRU, then the Django cache, then the
+    database. Unknown slugs are cached too (for BOOK_NEGATIVE_CACHE_TTL) so
+    requests for nonexistent books don't reach the database. Both layers are
+    keyed on the catalog version, so any catalog change invalidates them, and
+    LRU entries also expire after the same TTLs as the cache entries.
+    """
+    version = catalog_version()
+    entry = _book_lru.get(slug)
+    if entry is not None and entry[0] == version and entry[2] > time.monotonic():
+        metrics.incr('catalog.book_cache.lru_hit')
+        value = entry[1]
+    else:
+        key = f'catalog:book:{version}:{hashlib.md5(slug.encode("utf-8")).hexdigest()}'
+        value = cache.get(key)
+        if value is None:
+            metrics.incr('catalog.book_cache.miss')
+            value = (Book.objects.filter(slug=slug)
+                     .prefetch_related(Prefetch('categories', queryset=Category.objects.order_by('id')))
+                     .first())
+            if value is None:
+                value = _MISSING
+            cache.set(key, value, _book_ttl(value))
+        else:
+            metrics.incr('catalog.book_cache.hit')
+        _book_lru.set(slug, (version, value, time.monotonic() + _book_ttl(value)))
+    return None if isinstance(value, str) else value
+
+
+def _book_ttl(value):
+    if isinstance(value, str):
+        return getattr(settings, 'BOOK_NEGATIVE_CACHE_TTL', 60)
+    return getattr(settings, 'BOOK_CACHE_TTL', 300)
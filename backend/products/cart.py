@@ -0,0 +1,657 @@
+"""
+Cart storage.
+
+CART_STORE_BACKEND selects where carts live:
+
+- "db" (default): Cart / CartItem rows. Each change updates or inserts a
+  single CartItem row.
+- "kv": one hash per cart in Redis (CART_REDIS_URL), one field per line, with
+  quantities changed by HINCRBY. Without CART_REDIS_URL a process-local
+  in-memory hash is used, which is only suitable for tests and local dev.
+- "session": the old ``request.session['cart']`` dict, rewritten on every
+  change.
+
+Signed-in users' carts are keyed by user; anonymous carts by a random token
+kept in the CART_COOKIE_NAME cookie, which is only issued on the first write.
+Anonymous carts expire after CART_TTL without a write: the kv store sets a
+TTL on the hash, and ``purge_carts()`` (the purge_carts command) deletes the
+idle Cart rows of the database store.
+On login the anonymous cart is merged into the user's cart. None of the
+server-side backends touch the session.
+
+CartMiddleware also maintains a signed "cart_summary" cookie (line count and
+quantity) that page headers read client-side, so pages never need the cart.
+
+Every store returns lines as ``{slug: {'id', 'title', 'price', 'quantity'}}``,
+the shape the session cart always had.
+"""
+import datetime
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+from .models import Book, Cart, CartItem
+
+SESSION_KEY = 'cart'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _line(book_id, title, price, quantity):
+    return {'id': book_id, 'title': title, 'price': float(price), 'quantity': int(quantity)}
+
+
+class BaseCartStore:
+    """
+    Lines of one cart. ``key`` may be None for an anonymous visitor without a
+    cart yet; ``on_new_key`` is then called with the key the first write
+    allocates. Lines are read once and reused until the next change.
+    """
+
+    def __init__(self, key=None, on_new_key=None):
+        self.key = key
+        self._on_new_key = on_new_key
+        self._lines = None
+        self.modified = False
+
+    def _ensure_key(self):
+        if self.key is None:
+            self.key = secrets.token_urlsafe(24)
+            if self._on_new_key is not None:
+                self._on_new_key(self.key)
+        return self.key
+
+    def lines(self):
+        if self._lines is None:
+            self._lines = self._load() if self.key is not None else OrderedDict()
+        return self._lines
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _changed(self):
+        self._lines = None
+        self.modified = True
+
+    @property
+    def loaded(self):
+        return self._lines is not None
+
+    def add(self, book, quantity=1):
+        """Add ``quantity`` of ``book`` (a Book or anything with id/slug/title/price)."""
+        raise NotImplementedError
+
+    def set_quantity(self, slug, quantity):
+        """Set an existing line's quantity; zero or less removes it."""
+        raise NotImplementedError
+
+    def remove(self, slug):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def batch(self):
+        """
+        Context manager grouping several changes. Only the database store
+        makes it a transaction; stores that can't must override apply() to
+        write all of a batch at once.
+        """
+        return nullcontext()
+
+    def apply(self, operations, books):
+        """Apply validated operations; ``books`` maps slug -> Book for every 'add'."""
+        with self.batch():
+            for o in operations:
+                if o['op'] == 'add':
+                    self.add(books[o['slug']], o.get('quantity', 1))
+                elif o['op'] == 'set':
+                    self.set_quantity(o['slug'], o.get('quantity', 0))
+                else:
+                    self.remove(o['slug'])
+
+    def merge(self, other):
+        """Add every line of ``other`` to this cart and empty ``other``."""
+        for slug, line in other.lines().items():
+            self._merge_line(slug, line)
+        other.clear()
+
+    def _merge_line(self, slug, line):
+        book = _LineBook(line['id'], slug, line['title'], line['price'])
+        self.add(book, line['quantity'])
+
+    def __len__(self):
+        return len(self.lines())
+
+    def __bool__(self):
+        return bool(self.lines())
+
+
+class _LineBook:
+    def __init__(self, id, slug, title, price):
+        self.id, self.slug, self.title, self.price = id, slug, title, price
+
+
+# ---- session ----
+class SessionCartStore(BaseCartStore):
+    def __init__(self, session):
+        super().__init__(key=None)
+        self.session = session
+
+    def lines(self):
+        self._lines = self.session.get(SESSION_KEY, {})
+        return self._lines
+
+    def _save(self, cart):
+        self.session[SESSION_KEY] = cart
+        self.session.modified = True
+        self._changed()
+
+    def add(self, book, quantity=1):
+        cart = self.lines()
+        item = cart.get(book.slug)
+        if item:
+            item['quantity'] = item.get('quantity', 0) + quantity
+        else:
+            cart[book.slug] = _line(book.id, book.title, book.price, quantity)
+        self._save(cart)
+
+    def set_quantity(self, slug, quantity):
+        cart = self.lines()
+        if slug in cart:
+            if quantity > 0:
+                cart[slug]['quantity'] = quantity
+            else:
+                cart.pop(slug)
+            self._save(cart)
+
+    def remove(self, slug):
+        cart = self.lines()
+        if cart.pop(slug, None) is not None:
+            self._save(cart)
+
+    def clear(self):
+        if SESSION_KEY in self.session:
+            del self.session[SESSION_KEY]
+            self._changed()
+
+
+# ---- database ----
+# Cart.updated_at only has to be right to the hour, so a write costs one
+# UPDATE that rarely matches a row
+TOUCH_INTERVAL = datetime.timedelta(hours=1)
+
+
+class DatabaseCartStore(BaseCartStore):
+    def batch(self):
+        return transaction.atomic()
+
+    def _changed(self):
+        super()._changed()
+        if self.key is not None:
+            now = timezone.now()
+            Cart.objects.filter(key=self.key, updated_at__lt=now - TOUCH_INTERVAL).update(updated_at=now)
+
+    def _items(self):
+        return CartItem.objects.filter(cart__key=self.key)
+
+    def _load(self):
+        rows = self._items().order_by('id').values_list('slug', 'book_id', 'title', 'price', 'quantity')
+        return OrderedDict((slug, _line(book_id, title, price, qty)) for slug, book_id, title, price, qty in rows)
+
+    def add(self, book, quantity=1):
+        key = self._ensure_key()
+        self._changed()
+        if self._items().filter(slug=book.slug).update(quantity=F('quantity') + quantity):
+            return
+        cart, _ = Cart.objects.get_or_create(key=key)
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, book_id=book.id, slug=book.slug, title=book.title,
+                                        price=book.price, quantity=quantity)
+        except IntegrityError:
+            # a concurrent request added the same book first
+            self._items().filter(slug=book.slug).update(quantity=F('quantity') + quantity)
+
+    def apply(self, operations, books):
+        """
+        Net the operations per line in memory, then write each affected line
+        once: one SELECT, one bulk INSERT, an UPDATE per changed line and one
+        DELETE, however many operations there are.
+        """
+        if any(o['op'] == 'add' for o in operations):
+            self._ensure_key()
+        if self.key is None:
+            return
+        self._changed()
+        slugs = {o['slug'] for o in operations}
+        try:
+            with transaction.atomic():
+                existing = {slug: (pk, qty) for pk, slug, qty in self._items().select_for_update()
+                            .filter(slug__in=slugs).values_list('pk', 'slug', 'quantity')}
+                quantities = {slug: qty for slug, (_, qty) in existing.items()}
+                for o in operations:
+                    slug = o['slug']
+                    if o['op'] == 'add':
+                        quantities[slug] = (quantities.get(slug) or 0) + o['quantity']
+                    elif o['op'] == 'set' and quantities.get(slug):
+                        quantities[slug] = o['quantity'] or None
+                    elif o['op'] == 'remove':
+                        quantities[slug] = None
+                self._write(existing, quantities, books)
+        except IntegrityError:
+            # a concurrent request created one of the lines first
+            super().apply(operations, books)
+
+    def _write(self, existing, quantities, books):
+        new = [slug for slug, qty in quantities.items() if qty and slug not in existing]
+        if new:
+            cart, _ = Cart.objects.get_or_create(key=self.key)
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, book_id=books[slug].id, slug=slug, title=books[slug].title,
+                         price=books[slug].price, quantity=quantities[slug])
+                for slug in new
+            ])
+        for slug, (pk, qty) in existing.items():
+            if quantities[slug] and quantities[slug] != qty:
+                CartItem.objects.filter(pk=pk).update(quantity=quantities[slug])
+        gone = [pk for slug, (pk, _) in existing.items() if not quantities[slug]]
+        if gone:
+            CartItem.objects.filter(pk__in=gone).delete()
+
+    def set_quantity(self, slug, quantity):
+        if self.key is None:
+            return
+        if quantity > 0:
+            self._changed()
+            self._items().filter(slug=slug).update(quantity=quantity)
+        else:
+            self.remove(slug)
+
+    def remove(self, slug):
+        if self.key is not None:
+            self._changed()
+            self._items().filter(slug=slug).delete()
+
+    def clear(self):
+        if self.key is not None:
+            self._changed()
+            Cart.objects.filter(key=self.key).delete()
+
+
+# ---- key-value (Redis hash) ----
+class LocalHashClient:
+    """In-memory stand-in for the handful of Redis hash commands the kv store uses."""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        # re-entrant: a pipeline runs its queued commands while holding it
+        self._lock = threading.RLock()
+
+    def _live(self, name, create=True):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        if not create:
+            return self._data.get(name, {})
+        return self._data.setdefault(name, {})
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._live(name, create=False))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            fields = self._live(name)
+            if key is not None:
+                fields[key] = str(value)
+            fields.update({k: str(v) for k, v in (mapping or {}).items()})
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            fields = self._live(name)
+            fields[key] = str(int(fields.get(key, 0)) + amount)
+            return int(fields[key])
+
+    def hexists(self, name, key):
+        with self._lock:
+            return key in self._live(name, create=False)
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            fields = self._live(name, create=False)
+            return sum(fields.pop(k, None) is not None for k in keys)
+
+    def delete(self, *names):
+        with self._lock:
+            for name in names:
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+
+    def expire(self, name, seconds):
+        with self._lock:
+            self._expires[name] = time.monotonic() + seconds
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def pipeline(self):
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    """Queues commands and runs them all under the client's lock, like a MULTI/EXEC pipeline."""
+
+    def __init__(self, client):
+        self.client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *args, **kwargs: self._commands.append((method, args, kwargs))
+
+    def execute(self):
+        with self.client._lock:
+            results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_hash_client():
+    """The Redis client for CART_REDIS_URL, or the process-wide LocalHashClient."""
+    url = _setting('CART_REDIS_URL', '')
+    with _clients_lock:
+        if url not in _clients:
+            if url:
+                try:
+                    import redis
+                except ImportError as exc:
+                    raise ImproperlyConfigured("CART_REDIS_URL is set but the redis package is not installed") from exc
+                _clients[url] = redis.Redis.from_url(url, decode_responses=True)
+            else:
+                _clients[url] = LocalHashClient()
+        return _clients[url]
+
+
+class HashCartStore(BaseCartStore):
+    """
+    Hash ``cart:<key>`` with a JSON field per line (``<slug>``) and its
+    quantity beside it (``#<slug>``), so adding to a line is one HINCRBY.
+    """
+
+    def __init__(self, key=None, on_new_key=None, client=None):
+        super().__init__(key, on_new_key)
+        self.client = client or get_hash_client()
+
+    @property
+    def _name(self):
+        return f'cart:{self.key}'
+
+    def _touch(self):
+        self.client.expire(self._name, _setting('CART_TTL', 60 * 60 * 24 * 30))
+
+    def _load(self):
+        fields = self.client.hgetall(self._name)
+        cart = OrderedDict()
+        for slug in sorted(f for f in fields if not f.startswith('#')):
+            quantity = int(fields.get(f'#{slug}', 0))
+            if quantity > 0:
+                data = json.loads(fields[slug])
+                cart[slug] = _line(data['id'], data['title'], data['price'], quantity)
+        return cart
+
+    def add(self, book, quantity=1):
+        self._ensure_key()
+        self._changed()
+        if not self.client.hexists(self._name, book.slug):
+            data = {'id': book.id, 'title': book.title, 'price': str(book.price)}
+            self.client.hset(self._name, book.slug, json.dumps(data))
+        self.client.hincrby(self._name, f'#{book.slug}', quantity)
+        self._touch()
+
+    def set_quantity(self, slug, quantity):
+        if self.key is None or not self.client.hexists(self._name, slug):
+            return
+        if quantity > 0:
+            self._changed()
+            self.client.hset(self._name, f'#{slug}', quantity)
+            self._touch()
+        else:
+            self.remove(slug)
+
+    def remove(self, slug):
+        if self.key is not None:
+            self._changed()
+            self.client.hdel(self._name, slug, f'#{slug}')
+
+    def apply(self, operations, books):
+        """
+        Net the operations per line against one HGETALL, then write them in
+        a single MULTI/EXEC pipeline, so other requests see all of them or
+        none. Adds to lines the batch doesn't otherwise set stay HINCRBYs and
+        don't overwrite a concurrent add.
+        """
+        if any(o['op'] == 'add' for o in operations):
+            self._ensure_key()
+        if self.key is None:
+            return
+        self._changed()
+        present = {f for f in self.client.hgetall(self._name) if not f.startswith('#')}
+        added, quantities, increments = set(), {}, {}
+        for o in operations:
+            slug = o['slug']
+            if o['op'] == 'add':
+                added.add(slug)
+                if slug in quantities:
+                    quantities[slug] = (quantities[slug] or 0) + o['quantity']
+                else:
+                    increments[slug] = increments.get(slug, 0) + o['quantity']
+            elif o['op'] == 'set' and (slug in present or slug in added) and quantities.get(slug, True):
+                quantities[slug] = o['quantity'] if o['quantity'] > 0 else None
+                increments.pop(slug, None)
+            elif o['op'] == 'remove':
+                quantities[slug] = None
+                increments.pop(slug, None)
+                added.discard(slug)
+        self._write(added, quantities, increments, books)
+
+    def _write(self, added, quantities, increments, books):
+        mapping = {
+            slug: json.dumps({'id': books[slug].id, 'title': books[slug].title, 'price': str(books[slug].price)})
+            for slug in added if quantities.get(slug, True)
+        }
+        mapping.update({f'#{slug}': qty for slug, qty in quantities.items() if qty})
+        gone = [field for slug, qty in quantities.items() if not qty for field in (slug, f'#{slug}')]
+        pipe = self.client.pipeline()
+        if mapping:
+            pipe.hset(self._name, mapping=mapping)
+        for slug, amount in increments.items():
+            pipe.hincrby(self._name, f'#{slug}', amount)
+        if gone:
+            pipe.hdel(self._name, *gone)
+        pipe.expire(self._name, _setting('CART_TTL', 60 * 60 * 24 * 30))
+        pipe.execute()
+
+    def clear(self):
+        if self.key is not None:
+            self._changed()
+            self.client.delete(self._name)
+
+
+# ---- batched operations ----
+class UnknownBooks(LookupError):
+    def __init__(self, slugs):
+        self.slugs = sorted(slugs)
+        super().__init__(f"Unknown books: {', '.join(self.slugs)}")
+
+
+def apply_operations(cart, operations):
+    """
+    Apply ``operations`` ([{'op': 'add'|'set'|'remove', 'slug', 'quantity'}])
+    to ``cart`` in order. Books to add are looked up in one query, and nothing
+    is changed if any of them is unknown (UnknownBooks).
+    """
+    slugs = {o['slug'] for o in operations if o['op'] == 'add'}
+    books = Book.objects.only('id', 'slug', 'title', 'price').in_bulk(slugs, field_name='slug') if slugs else {}
+    if len(books) != len(slugs):
+        raise UnknownBooks(slugs - set(books))
+    cart.apply(operations, books)
+
+
+def purge_carts(before=None, batch_size=1000):
+    """
+    Delete anonymous database carts not written to since ``before`` (default
+    CART_TTL ago, when their cookie has expired too); returns how many.
+    """
+    before = before or timezone.now() - datetime.timedelta(seconds=_setting('CART_TTL', 60 * 60 * 24 * 30))
+    idle = Cart.objects.filter(updated_at__lt=before).exclude(key__startswith='user:').order_by('updated_at')
+    deleted = 0
+    while True:
+        ids = list(idle.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        CartItem.objects.filter(cart_id__in=ids).delete()
+        deleted += Cart.objects.filter(pk__in=ids).delete()[1].get(Cart._meta.label, 0)
+
+
+# ---- per-request wiring ----
+BACKENDS = {
+    'db': DatabaseCartStore,
+    'kv': HashCartStore,
+}
+
+
+def _backend():
+    name = _setting('CART_STORE_BACKEND', 'db')
+    if name != 'session' and name not in BACKENDS:
+        raise ImproperlyConfigured(f"Unknown CART_STORE_BACKEND {name!r}")
+    return name
+
+
+def user_cart_key(user):
+    return f'user:{user.pk}'
+
+
+def store_for_key(key, on_new_key=None):
+    """A server-side store for ``key`` (ignores the session backend)."""
+    return BACKENDS[_backend()](key, on_new_key)
+
+
+def _cart_for_request(request):
+    if _backend() == 'session':
+        return SessionCartStore(request.session)
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return store_for_key(user_cart_key(user))
+
+    def remember(key):
+        request._new_cart_key = key
+
+    return store_for_key(request.COOKIES.get(_setting('CART_COOKIE_NAME', 'cart_id')) or None, remember)
+
+
+def get_cart(request):
+    """The cart store for ``request`` (``request.cart`` when CartMiddleware is installed)."""
+    cart = getattr(request, 'cart', None)
+    if cart is None:
+        cart = request.cart = _cart_for_request(request)
+    return cart
+
+
+def cart_switched(request):
+    """The request now belongs to a different cart (login/logout): resolve it again."""
+    request.cart = SimpleLazyObject(lambda: _cart_for_request(request))
+    request._cart_switched = True
+
+
+def merge_anonymous_cart(request, user):
+    """Fold the visitor's anonymous cart into ``user``'s cart (called on login)."""
+    if _backend() != 'session':
+        key = request.COOKIES.get(_setting('CART_COOKIE_NAME', 'cart_id')) or getattr(request, '_new_cart_key', None)
+        if key:
+            store_for_key(user_cart_key(user)).merge(store_for_key(key))
+    cart_switched(request)
+
+
+# ---- summary cookie ----
+# "<lines>.<quantity>", signed. Not HttpOnly: the page header reads it in the
+# browser, so catalog pages render the same HTML for everyone and never have
+# to load the cart or the session.
+SUMMARY_SALT = 'products.cart.summary'
+
+
+def summarize(lines):
+    return len(lines), sum(int(line['quantity']) for line in lines.values())
+
+
+def read_summary(request):
+    """(lines, quantity) from the summary cookie, or None if missing or tampered with."""
+    value = request.get_signed_cookie(_setting('CART_SUMMARY_COOKIE_NAME', 'cart_summary'),
+                                      default=None, salt=SUMMARY_SALT)
+    try:
+        lines, quantity = value.split('.')
+        return int(lines), int(quantity)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _evaluated_cart(request):
+    cart = request.__dict__.get('cart')
+    if isinstance(cart, SimpleLazyObject):
+        if cart._wrapped is empty:
+            if not getattr(request, '_cart_switched', False):
+                return None
+            cart._setup()
+        cart = cart._wrapped
+    return cart
+
+
+class CartMiddleware:
+    """
+    Sets ``request.cart`` (lazily), issues the anonymous cart cookie on first
+    write and keeps the summary cookie in step with the cart.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = SimpleLazyObject(lambda: _cart_for_request(request))
+        response = self.get_response(request)
+        max_age = _setting('CART_TTL', 60 * 60 * 24 * 30)
+        key = getattr(request, '_new_cart_key', None)
+        if key:
+            response.set_cookie(
+                _setting('CART_COOKIE_NAME', 'cart_id'), key,
+                max_age=max_age, secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        # refresh the summary cookie whenever this request changed or read the cart anyway
+        cart = _evaluated_cart(request)
+        if cart is not None and (cart.modified or cart.loaded or getattr(request, '_cart_switched', False)):
+            summary = summarize(cart.lines())
+            if summary != read_summary(request):
+                response.set_signed_cookie(
+                    _setting('CART_SUMMARY_COOKIE_NAME', 'cart_summary'), '%d.%d' % summary, salt=SUMMARY_SALT,
+                    max_age=max_age, secure=request.is_secure(), httponly=False, samesite='Lax',
+                )
+        return response
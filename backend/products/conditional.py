@@ -0,0 +1,64 @@
+"""
+ETag / Last-Modified functions for the catalog views (used with Django's
+``condition`` decorator), so unchanged pages and API responses are answered
+with 304 before any query, template or serializer work.
+
+List validators come from the catalog version plus the normalized request;
+detail validators from the cached book's ``updated_at``. The detail page also
+folds in the CSRF cookie, which its add-to-cart form embeds. The mini-cart is
+filled in client-side, so no page depends on the cart or the session.
+"""
+import hashlib
+
+from django.conf import settings
+
+from .cache import catalog_last_modified, catalog_version, get_cached_book, normalize_list_params
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def _csrf_state(request):
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+
+
+def _api_variant(request):
+    # DRF picks the renderer from Accept / ?format=
+    return request.META.get('HTTP_ACCEPT', '')
+
+
+def _book_stamp(slug):
+    book = get_cached_book(slug)
+    if book is None or book.updated_at is None:
+        return None
+    return f'{book.pk}:{book.updated_at.isoformat()}'
+
+
+def catalog_modified(request, *args, **kwargs):
+    return catalog_last_modified()
+
+
+def book_modified(request, slug, **kwargs):
+    book = get_cached_book(slug)
+    return book.updated_at if book is not None else None
+
+
+def product_list_etag(request, *args, **kwargs):
+    params = normalize_list_params(request.GET).urlencode()
+    return _digest('list', catalog_version(), params)
+
+
+def product_detail_etag(request, slug, **kwargs):
+    stamp = _book_stamp(slug)
+    return _digest('detail', stamp, _csrf_state(request)) if stamp else None
+
+
+def api_list_etag(request, *args, **kwargs):
+    params = sorted((k, sorted(v)) for k, v in request.GET.lists())
+    return _digest('api-list', catalog_version(), params, _api_variant(request))
+
+
+def api_detail_etag(request, slug, **kwargs):
+    stamp = _book_stamp(slug)
+    return _digest('api-detail', stamp, _api_variant(request)) if stamp else None
@@ -0,0 +1,99 @@
+"""
+Result counts for listings.
+
+With RESULT_COUNT_STRATEGY = "exact" (the default) this is a plain COUNT(*).
+With "estimate", counts are exact up to RESULT_COUNT_EXACT_THRESHOLD (using a
+LIMITed count, so the database stops scanning early) and come from the query
+planner above it. Either way the result is cached per normalized SQL query for
+RESULT_COUNT_CACHE_TTL seconds.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCount:
+    """A row count and whether it is exact; renders as the number in templates."""
+
+    def __init__(self, value, exact=True):
+        self.value = int(value)
+        self.exact = exact
+
+    def __str__(self):
+        return str(self.value)
+
+    def __int__(self):
+        return self.value
+
+    def __repr__(self):
+        return f"ResultCount({self.value}, exact={self.exact})"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def cache_key(queryset):
+    """Cache key for the count of ``queryset``: a hash of its SQL and params."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f"{queryset.db}|{sql}|{params!r}".encode('utf-8')).hexdigest()
+    return f'result-count:{digest}'
+
+
+def planner_estimate(queryset):
+    """
+    Row estimate from the database planner, or None when the backend has no
+    usable estimate (SQLite).
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]['Plan']['Plan Rows'])
+            if connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                columns = [c[0].lower() for c in cursor.description]
+                row = dict(zip(columns, cursor.fetchone()))
+                return int((row.get('rows') or 0) * float(row.get('filtered') or 100) / 100)
+    except DatabaseError:
+        logger.warning("Could not get a planner estimate for count", exc_info=True)
+    return None
+
+
+def count_results(queryset, strategy=None):
+    """
+    Return a ResultCount for ``queryset`` using ``strategy`` ("exact" or
+    "estimate"), by default the configured RESULT_COUNT_STRATEGY.
+    """
+    if (strategy or _setting('RESULT_COUNT_STRATEGY', 'exact')) != 'estimate':
+        return ResultCount(queryset.count())
+
+    key = cache_key(queryset)
+    cached = cache.get(key)
+    if cached is not None:
+        return ResultCount(*cached)
+
+    threshold = _setting('RESULT_COUNT_EXACT_THRESHOLD', 1000)
+    bounded = queryset.order_by().values('pk')[:threshold + 1].count()
+    if bounded <= threshold:
+        result = ResultCount(bounded)
+    else:
+        estimate = planner_estimate(queryset)
+        if estimate is None:
+            result = ResultCount(queryset.count())
+        else:
+            result = ResultCount(max(estimate, threshold + 1), exact=False)
+
+    cache.set(key, (result.value, result.exact), _setting('RESULT_COUNT_CACHE_TTL', 300))
+    return result
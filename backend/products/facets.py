@@ -0,0 +1,89 @@
+"""
+Category and price facets for book listings.
+
+``?category=<slug>`` (repeatable, any-of) and ``?price=<bucket>`` (repeatable)
+narrow the results. Facet counts are disjunctive: category counts ignore the
+category selection and price counts ignore the price selection, so users can
+see what adding another option would give. Each facet is one grouped query,
+however many categories or buckets there are.
+"""
+from collections import OrderedDict
+
+from django.db.models import Count, Q
+
+from .models import Book, Category
+
+# key -> (label, min inclusive, max exclusive)
+PRICE_BUCKETS = OrderedDict([
+    ('under-200', ('Under ₹200', None, 200)),
+    ('200-500', ('₹200 – ₹500', 200, 500)),
+    ('500-1000', ('₹500 – ₹1000', 500, 1000)),
+    ('1000-plus', ('₹1000 & above', 1000, None)),
+])
+
+
+def _price_q(key):
+    _, low, high = PRICE_BUCKETS[key]
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def filter_categories(queryset, slugs):
+    if not slugs:
+        return queryset
+    through = Book.categories.through
+    return queryset.filter(pk__in=through.objects.filter(category__slug__in=slugs).values('book_id'))
+
+
+def filter_prices(queryset, keys):
+    if not keys:
+        return queryset
+    q = Q()
+    for key in keys:
+        q |= _price_q(key)
+    return queryset.filter(q)
+
+
+def category_counts(queryset, selected=()):
+    """[{'slug', 'name', 'count', 'selected'}] for categories with matches, biggest first."""
+    through = Book.categories.through
+    rows = (through.objects.filter(book_id__in=queryset.order_by().values('pk'))
+            .values('category__slug', 'category__name')
+            .annotate(count=Count('book_id'))
+            .order_by('-count', 'category__name'))
+    facets = [{'slug': r['category__slug'], 'name': r['category__name'], 'count': r['count'],
+               'selected': r['category__slug'] in selected} for r in rows]
+    missing = set(selected) - {f['slug'] for f in facets}
+    if missing:
+        # keep selected-but-empty categories visible so they can be unticked
+        facets += [{'slug': slug, 'name': name, 'count': 0, 'selected': True}
+                   for slug, name in Category.objects.filter(slug__in=missing).values_list('slug', 'name')]
+    return facets
+
+
+def price_counts(queryset, selected=()):
+    """[{'key', 'label', 'count', 'selected'}] for every price bucket."""
+    counts = queryset.order_by().aggregate(**{
+        f'b{i}': Count('pk', filter=_price_q(key)) for i, key in enumerate(PRICE_BUCKETS)
+    })
+    return [{'key': key, 'label': label, 'count': counts[f'b{i}'], 'selected': key in selected}
+            for i, (key, (label, _, _)) in enumerate(PRICE_BUCKETS.items())]
+
+
+def apply_facets(queryset, params):
+    """
+    Apply the category/price selections in ``params`` (a QueryDict) to
+    ``queryset``. Returns (filtered queryset, facets dict).
+    """
+    categories = [slug for slug in params.getlist('category') if slug]
+    prices = [key for key in params.getlist('price') if key in PRICE_BUCKETS]
+    by_category = filter_categories(queryset, categories)
+    facets = {
+        'categories': category_counts(filter_prices(queryset, prices), categories),
+        'price': price_counts(by_category, prices),
+    }
+    return filter_prices(by_category, prices), facets
@@ -0,0 +1,58 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.autocomplete import PrefixIndex
+
+
+def _word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+
+class Command(BaseCommand):
+    help = "Benchmark autocomplete prefix queries on a synthetic in-memory index (no database)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--updates', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        n = options['titles']
+        authors = [f'{_word(rng)} {_word(rng)}' for _ in range(max(n // 20, 1))]
+        titles = [' '.join(_word(rng) for _ in range(rng.randint(2, 5))) for _ in range(n)]
+
+        index = PrefixIndex()
+        start = time.perf_counter()
+        index.build((i, titles[i], rng.choice(authors), f'book-{i}', rng.randint(0, 500)) for i in range(n))
+        self.stdout.write(f"built {n:,} titles in {time.perf_counter() - start:.1f}s")
+
+        # prefixes typed by a user: 1..8 characters of real titles/authors
+        prefixes = []
+        for _ in range(options['queries']):
+            source = rng.choice(titles) if rng.random() < 0.8 else rng.choice(authors)
+            prefixes.append(source[:rng.randint(1, 8)])
+
+        for label in ('cold', 'warm'):
+            timings = []
+            for prefix in prefixes:
+                t = time.perf_counter()
+                index.query(prefix)
+                timings.append((time.perf_counter() - t) * 1e6)
+            timings.sort()
+            self.stdout.write(
+                f"{label} queries: p50 {statistics.median(timings):.1f}us  "
+                f"p99 {timings[int(len(timings) * 0.99)]:.1f}us  max {timings[-1]:.1f}us")
+
+        timings = []
+        for _ in range(options['updates']):
+            i = rng.randrange(n)
+            t = time.perf_counter()
+            index.upsert(i, titles[i] + ' revised', rng.choice(authors), f'book-{i}')
+            timings.append((time.perf_counter() - t) * 1e6)
+        self.stdout.write(f"incremental updates: p50 {statistics.median(timings):.1f}us")
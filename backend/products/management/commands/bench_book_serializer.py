@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.models import Book, Category
+from products.serializers import BOOK_ROW_FIELDS, BookSerializer, serialize_book_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/sec of BookSerializer and the values()-based list path, and "
+        "check both render byte-identical JSON. Synthetic rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        request = Request(APIRequestFactory().get('/api/books/api/'))
+        renderer = JSONRenderer()
+
+        with transaction.atomic():
+            self._populate(rows)
+            queryset = Book.objects.filter(slug__startswith='bench-ser-').order_by('id')
+
+            def drf():
+                qs = queryset.prefetch_related(Prefetch('categories', queryset=Category.objects.order_by('id')))
+                return renderer.render(BookSerializer(qs, many=True, context={'request': request}).data)
+
+            def fast():
+                return renderer.render(serialize_book_rows(list(queryset.values(*BOOK_ROW_FIELDS)), request))
+
+            before, after = drf(), fast()
+            if before != after:
+                raise CommandError("Fast path output differs from BookSerializer output.")
+
+            for label, fn in (('BookSerializer', drf), ('serialize_book_rows', fast)):
+                best = min(self._time(fn) for _ in range(repeat))
+                self.stdout.write(f"{label:<20} {rows / best:>12,.0f} rows/sec ({best * 1000:.1f} ms)")
+            self.stdout.write(self.style.SUCCESS(f"Output identical ({len(after):,} bytes)."))
+            transaction.set_rollback(True)
+
+    def _populate(self, rows):
+        categories = [Category.objects.create(name=f'Bench {i}', slug=f'bench-ser-{i}') for i in range(5)]
+        books = Book.objects.bulk_create([
+            Book(title=f'Benchmark book {i}', slug=f'bench-ser-{i}', author='Bench Author',
+                 description='Lorem ipsum dolor sit amet. ' * 4, price=f'{100 + i % 900}.50', stock=i % 7,
+                 cover=f'covers/bench {i}.jpg' if i % 2 else '')
+            for i in range(rows)
+        ])
+        through = Book.categories.through
+        through.objects.bulk_create([
+            through(book_id=book.pk, category_id=categories[(book.pk + k) % 5].pk)
+            for book in books for k in range(2)
+        ])
+
+    def _time(self, fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
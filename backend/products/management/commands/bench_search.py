@@ -0,0 +1,90 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Book, BookSearchToken
+from products.search import book_tokens, search_books, uses_native_search
+
+PAGE_SIZE = 9
+
+
+def _word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark catalog search latency as the catalog grows. Synthetic books are "
+        "inserted inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help="Comma separated catalog sizes (cumulative).")
+        parser.add_argument('--queries', type=int, default=50, help="Queries per class and size.")
+        parser.add_argument('--vocabulary', type=int, default=200000)
+        parser.add_argument('--legacy', action='store_true',
+                            help="Also time the old icontains search for comparison.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(',') if s.strip())
+        rng = random.Random(options['seed'])
+        vocab = [_word(rng, rng.randint(4, 10)) for _ in range(options['vocabulary'])]
+        self.native = uses_native_search()
+
+        self.stdout.write(f"{'books':>9} {'query':<10} {'median ms':>10} {'p95 ms':>8}")
+        with transaction.atomic():
+            created = 0
+            for size in sizes:
+                self._grow(rng, vocab, created, size)
+                created = size
+                for label, queries in self._query_classes(rng, vocab, size, options['queries']).items():
+                    self._report(size, label, [self._time(search_books, q) for q in queries])
+                if options['legacy']:
+                    queries = [rng.choice(vocab) for _ in range(options['queries'])]
+                    self._report(size, 'icontains', [self._time(self._legacy, q) for q in queries])
+            transaction.set_rollback(True)
+
+    def _grow(self, rng, vocab, start, end, batch=5000):
+        for offset in range(start, end, batch):
+            books = []
+            for i in range(offset, min(offset + batch, end)):
+                books.append(Book(
+                    title=' '.join(rng.choices(vocab, k=3)) + f' bench{i}',
+                    slug=f'bench-search-{i}',
+                    author=' '.join(rng.choices(vocab, k=2)),
+                    description=' '.join(rng.choices(vocab, k=12)),
+                    price=rng.randint(100, 200000) / 100,
+                ))
+            books = Book.objects.bulk_create(books)
+            if not self.native:
+                rows = [BookSearchToken(book_id=b.pk, token=t, weight=w)
+                        for b in books for t, w in book_tokens(b).items()]
+                BookSearchToken.objects.bulk_create(rows, batch_size=5000)
+
+    def _query_classes(self, rng, vocab, size, n):
+        return {
+            'exact': [f'bench{rng.randrange(size)}' for _ in range(n)],
+            'one-term': [rng.choice(vocab) for _ in range(n)],
+            'two-term': [' '.join(rng.sample(vocab, 2)) for _ in range(n)],
+            'prefix': [rng.choice(vocab)[:4] for _ in range(n)],
+        }
+
+    def _legacy(self, qs, q):
+        return qs.filter(Q(title__icontains=q) | Q(author__icontains=q) | Q(description__icontains=q))
+
+    def _time(self, fn, q):
+        start = time.perf_counter()
+        list(fn(Book.objects.all(), q)[:PAGE_SIZE])
+        return (time.perf_counter() - start) * 1000
+
+    def _report(self, size, label, timings):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f"{size:>9} {label:<10} {statistics.median(timings):>10.2f} {p95:>8.2f}")
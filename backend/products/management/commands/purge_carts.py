@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.cart import purge_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete anonymous database carts with no writes for CART_TTL seconds "
+        "(run from cron, or with --every)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--every', type=int, default=0,
+                            help="Keep running, purging every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = purge_carts(batch_size=options['batch_size'])
+            if deleted or not options['every']:
+                self.stdout.write(f"Deleted {deleted} idle carts.")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
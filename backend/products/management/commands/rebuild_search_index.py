@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from products.search import rebuild_index, uses_native_search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the built-in catalog search index (no-op on Postgres/MySQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if uses_native_search(using):
+            self.stdout.write("Database uses native full-text search; nothing to rebuild.")
+            return
+        count = rebuild_index(using=using, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} books."))
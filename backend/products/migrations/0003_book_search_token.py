@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_book_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='products.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'book'], name='products_token_book_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'token'), name='products_unique_book_token')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+import re
+from collections import Counter
+
+from django.db import migrations
+
+# Frozen copies of what products.search had when this migration was written:
+# the index must stay the one created here whatever that module becomes.
+FIELD_WEIGHTS = {'title': 3, 'author': 2, 'description': 1}
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(\"title\", '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(\"author\", '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(\"description\", '')), 'C')"
+)
+TOKEN_MAX_LENGTH = 64
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+PG_INDEX = 'products_book_fulltext_gin'
+MYSQL_INDEX = 'products_book_fulltext'
+
+
+def book_tokens(book):
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in TOKEN_RE.findall((getattr(book, field) or '').lower()):
+            counts[token[:TOKEN_MAX_LENGTH]] += weight
+    return counts
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX {PG_INDEX} ON products_book USING GIN (({PG_VECTOR_SQL}))')
+    elif vendor == 'mysql':
+        columns = ', '.join(FIELD_WEIGHTS)
+        schema_editor.execute(f'CREATE FULLTEXT INDEX {MYSQL_INDEX} ON products_book ({columns})')
+    else:
+        # built-in index: tokenize books that already exist
+        Book = apps.get_model('products', 'Book')
+        BookSearchToken = apps.get_model('products', 'BookSearchToken')
+        db = schema_editor.connection.alias
+        rows = []
+        for book in Book.objects.using(db).iterator(chunk_size=1000):
+            rows.extend(BookSearchToken(book_id=book.pk, token=t, weight=w) for t, w in book_tokens(book).items())
+        BookSearchToken.objects.using(db).bulk_create(rows, batch_size=1000)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+    elif vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {MYSQL_INDEX} ON products_book')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_book_search_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
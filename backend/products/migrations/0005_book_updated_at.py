@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_updated_at(apps, schema_editor):
+    Book = apps.get_model('products', 'Book')
+    Book.objects.using(schema_editor.connection.alias).filter(updated_at__isnull=True).update(
+        updated_at=Coalesce('created_at', Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_book_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
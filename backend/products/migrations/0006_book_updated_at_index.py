@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+    ]
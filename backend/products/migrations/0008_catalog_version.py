@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:29
+
+import time
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    # start from the clock so the new versions never repeat ones cached before this migration
+    apps.get_model('products', 'CatalogVersion').objects.get_or_create(pk=1, defaults={'version': int(time.time() * 1000)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
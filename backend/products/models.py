@@ -18,6 +18,73 @@ class Book(models.Model):
     cover = models.ImageField(upload_to='covers/', blank=True, null=True)
     categories = models.ManyToManyField(Category, related_name='books', blank=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.title
+
+
+class CatalogVersion(models.Model):
+    """
+    The catalog version (see products.cache): a single row (pk=1) that every
+    process reads, bumped whenever a Book or Category changes.
+    """
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"catalog v{self.version}"
+
+
+class BookSearchToken(models.Model):
+    """
+    Inverted index row used by the built-in search backend (SQLite / local dev).
+    One row per (book, token); weight is the field-weighted term frequency.
+    Postgres and MySQL use their native full-text indexes instead.
+    """
+    book = models.ForeignKey(Book, related_name='search_tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'book'], name='products_token_book_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'token'], name='products_unique_book_token'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.book_id}"
+
+
+class Cart(models.Model):
+    """
+    Server-side cart (CART_STORE_BACKEND = "db"). ``key`` is "user:<id>" for
+    signed-in users and the cart cookie's random token otherwise.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # last write (to the hour); anonymous carts idle for CART_TTL are purged (products.cart.purge_carts)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class CartItem(models.Model):
+    """One cart line; title and price are captured when the book is added."""
+    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    slug = models.SlugField()
+    title = models.CharField(max_length=255)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'slug'], name='products_unique_cart_slug'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (x{self.quantity})"
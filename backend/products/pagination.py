@@ -0,0 +1,342 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with ``WHERE (ordering columns) > (last row seen) LIMIT n``
+instead of ``OFFSET``, so page 10,000 costs the same as page 1 and no
+``COUNT(*)`` is needed. The ordering is taken from the queryset itself and an
+``id`` tiebreak is appended when missing, so ``price``/``created_at``
+orderings page deterministically. NULLs always sort first (ascending).
+
+Cursors are signed, opaque strings; a tampered or stale cursor falls back to
+the first page.
+"""
+import datetime
+import decimal
+import functools
+from collections import OrderedDict
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .counting import count_results
+
+CURSOR_SALT = 'products.pagination.cursor'
+
+
+def _value(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+def _encode_value(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def resolve_ordering(queryset):
+    """The queryset's ordering as field names, with an ``id`` tiebreak appended."""
+    ordering = [o for o in queryset.query.order_by if isinstance(o, str)]
+    if not ordering:
+        ordering = list(queryset.model._meta.ordering or [])
+    names = [o.lstrip('-') for o in ordering]
+    if 'id' not in names and 'pk' not in names:
+        ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+    return tuple('id' if o == 'pk' else '-id' if o == '-pk' else o for o in ordering)
+
+
+def ordering_fields(queryset):
+    """Columns a values() queryset must include to be keyset-paginated."""
+    return [name.lstrip('-') for name in resolve_ordering(queryset)]
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move around it."""
+
+    def __init__(self, paginator, object_list, number, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._links = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not (self.has_next and self.object_list):
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        """Cursor of the previous page; '' when that is the first page."""
+        if not (self.has_previous and self.object_list):
+            return None
+        if self.number <= 2:
+            return ''
+        return self.paginator.encode_cursor(self.object_list[0], self.number - 1, reverse=True)
+
+    def page_links(self, window=2):
+        """
+        Numbered links for up to ``window`` pages either side of this one.
+        Costs two extra LIMITed queries over the ordering columns only, however
+        deep the current page is.
+        """
+        if self._links is None:
+            self._links = self.paginator.window_links(self, window)
+        return self._links
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = resolve_ordering(queryset)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    # ---- ordering ----
+    def _order_by(self, reverse=False):
+        exprs = []
+        for name in self.ordering:
+            descending = name.startswith('-') != reverse
+            field = F(name.lstrip('-'))
+            exprs.append(field.desc(nulls_last=True) if descending else field.asc(nulls_first=True))
+        return exprs
+
+    def _nullable(self, name):
+        try:
+            return self.queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return True
+
+    def _after(self, values, reverse=False):
+        """Q matching rows strictly after ``values`` in (possibly reversed) ordering."""
+        result = Q(pk__in=[])
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-') != reverse
+            if value is None:
+                beyond = Q(pk__in=[]) if descending else Q(**{f'{field}__isnull': False})
+                same = Q(**{f'{field}__isnull': True})
+            elif descending:
+                beyond = Q(**{f'{field}__lt': value})
+                if self._nullable(field):
+                    beyond |= Q(**{f'{field}__isnull': True})
+                same = Q(**{field: value})
+            else:
+                beyond = Q(**{f'{field}__gt': value})
+                same = Q(**{field: value})
+            result |= equal & beyond
+            equal &= same
+        first, value = self.ordering[0], values[0]
+        if value is not None and not self._nullable(first.lstrip('-')):
+            # redundant bound on the leading column so the database can seek to
+            # the cursor in the index instead of filtering from the start
+            descending = first.startswith('-') != reverse
+            result &= Q(**{f"{first.lstrip('-')}__{'lte' if descending else 'gte'}": value})
+        return result
+
+    # ---- cursors ----
+    def encode_cursor(self, row, number, reverse=False):
+        values = [_encode_value(_value(row, f)) for f in self.fields]
+        return signing.dumps({'v': values, 'n': number, 'r': reverse}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """Return (values, page number, reverse) or None for a missing/invalid cursor."""
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            raw = data['v']
+            if len(raw) != len(self.fields):
+                return None
+            values = [self._to_python(f, v) for f, v in zip(self.fields, raw)]
+            return values, max(int(data['n']), 1), bool(data['r'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError, decimal.InvalidOperation):
+            return None
+
+    def _to_python(self, name, value):
+        if value is None:
+            return None
+        try:
+            return self.queryset.model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # annotations such as search_rank
+            return value
+
+    # ---- pages ----
+    def _rows(self, values, limit, reverse=False, fields=None):
+        """Up to ``limit`` rows after ``values`` (from the start when None), as values() dicts if ``fields``."""
+        qs = self.queryset
+        if values is not None:
+            qs = qs.filter(self._after(values, reverse))
+        qs = qs.order_by(*self._order_by(reverse))
+        if fields:
+            qs = qs.values(*fields)
+        return list(qs[:limit])
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor)
+        limit = self.per_page + 1
+        if decoded is None:
+            rows = self._rows(None, limit)
+            return KeysetPage(self, rows[:self.per_page], 1, len(rows) > self.per_page, False)
+
+        values, number, reverse = decoded
+        rows = self._rows(values, limit, reverse)
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            return KeysetPage(self, rows, number, True, more)
+        return KeysetPage(self, rows, number, more, True)
+
+    def window_links(self, page, window):
+        links = [{'number': page.number, 'cursor': None, 'current': True}]
+        if not page.object_list:
+            return links
+        span = self.per_page * window
+        ahead = self._rows([_value(page.object_list[-1], f) for f in self.fields], span, fields=self.fields)
+        behind = self._rows([_value(page.object_list[0], f) for f in self.fields], span, True, fields=self.fields)
+
+        for k in range(window):
+            if k == 0 and page.has_next:
+                links.append({'number': page.number + 1, 'cursor': page.next_cursor, 'current': False})
+            elif 0 < k and len(ahead) > k * self.per_page:
+                number = page.number + 1 + k
+                cursor = self.encode_cursor(ahead[k * self.per_page - 1], number)
+                links.append({'number': number, 'cursor': cursor, 'current': False})
+        for k in range(window):
+            number = page.number - 1 - k
+            if number < 1:
+                break
+            if k == 0 and page.has_previous:
+                links.insert(0, {'number': number, 'cursor': page.previous_cursor, 'current': False})
+            elif 0 < k and len(behind) > k * self.per_page:
+                cursor = '' if number == 1 else self.encode_cursor(behind[k * self.per_page - 1], number, reverse=True)
+                links.insert(0, {'number': number, 'cursor': cursor, 'current': False})
+        return links
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    A KeysetPaginator over several querysets with the same ordering columns
+    and disjoint ids (e.g. a table and its archive), paged as if they were
+    one: each page takes the next rows from every queryset and merges them.
+    """
+
+    def __init__(self, querysets, per_page):
+        super().__init__(querysets[0], per_page)
+        self.querysets = querysets
+
+    def _compare(self, a, b):
+        for name, field in zip(self.ordering, self.fields):
+            x, y = _value(a, field), _value(b, field)
+            if x == y:
+                continue
+            # NULLs come first ascending and last descending, as in _order_by()
+            less = x is None or (y is not None and x < y)
+            return (1 if less else -1) if name.startswith('-') else (-1 if less else 1)
+        return 0
+
+    def _rows(self, values, limit, reverse=False, fields=None):
+        rows = []
+        for queryset in self.querysets:
+            self.queryset = queryset
+            rows += super()._rows(values, limit, reverse, fields)
+        self.queryset = self.querysets[0]
+        rows.sort(key=functools.cmp_to_key(self._compare), reverse=reverse)
+        return rows[:limit]
+
+
+# ---- DRF ----
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class using KeysetPaginator; response shape matches
+    CursorPagination. With ``include_count`` the response also carries
+    ``count`` and ``count_exact`` (see products.counting).
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    include_count = False
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_paginator(self, queryset, page_size):
+        return KeysetPaginator(queryset, page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = count_results(queryset) if self.include_count else None
+        paginator = self.get_paginator(queryset, self.get_page_size(request))
+        self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return self.page.object_list
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        if cursor == '':
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        fields = []
+        if self.count is not None:
+            fields += [('count', self.count.value), ('count_exact', self.count.exact)]
+        return Response(OrderedDict(fields + [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        properties = {
+            'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'results': schema,
+        }
+        if self.include_count:
+            properties.update(count={'type': 'integer'}, count_exact={'type': 'boolean'})
+        return {'type': 'object', 'required': ['results'], 'properties': properties}
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Django Paginator (for OFFSET-paged screens such as the admin) whose
+    ``count`` is exact up to RESULT_COUNT_EXACT_THRESHOLD and the planner's
+    estimate above it, whatever RESULT_COUNT_STRATEGY says.
+    """
+
+    @cached_property
+    def count(self):
+        return count_results(self.object_list, strategy='estimate').value
@@ -0,0 +1,138 @@
+"""
+Cart pricing.
+
+price_cart() re-prices every cart line against the current Book price and
+stock in one query, using Decimal rupees and integer paise (no floats). The
+result is cached per cart version (a digest of its lines) and catalog
+version, so repeated renders of an unchanged cart skip the query. The catalog
+version also moves when stock is taken or given back (orders.inventory), so
+a cached ``in_stock`` is never staler than the last stock change. Checkout
+passes ``fresh=True`` to always read current prices.
+"""
+import hashlib
+import json
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import catalog_version
+from .models import Book
+
+PAISE = Decimal('0.01')
+
+
+def to_paise(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_paise(paise):
+    return (Decimal(paise) / 100).quantize(PAISE)
+
+
+class PricedLine:
+    def __init__(self, slug, book_id, title, unit_paise, quantity, stock, captured_paise):
+        self.slug = slug
+        self.book_id = book_id
+        self.title = title
+        self.unit_paise = unit_paise
+        self.quantity = quantity
+        self.stock = stock
+        self.price_changed = captured_paise is not None and captured_paise != unit_paise
+
+    @property
+    def price(self):
+        return from_paise(self.unit_paise)
+
+    @property
+    def subtotal_paise(self):
+        return self.unit_paise * self.quantity
+
+    @property
+    def subtotal(self):
+        return from_paise(self.subtotal_paise)
+
+    @property
+    def in_stock(self):
+        return self.stock >= self.quantity
+
+
+class PricedCart:
+    """Priced lines plus totals; ``unavailable`` lists slugs whose book no longer exists."""
+
+    def __init__(self, lines, unavailable=()):
+        self.lines = lines
+        self.unavailable = list(unavailable)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    @property
+    def count(self):
+        return sum(line.quantity for line in self.lines)
+
+    @property
+    def total_paise(self):
+        return sum(line.subtotal_paise for line in self.lines)
+
+    @property
+    def total(self):
+        return from_paise(self.total_paise)
+
+    @property
+    def out_of_stock(self):
+        return [line for line in self.lines if not line.in_stock]
+
+    def as_dict(self):
+        return {
+            'items': [{'slug': l.slug, 'id': l.book_id, 'title': l.title, 'price': str(l.price),
+                       'quantity': l.quantity, 'subtotal': str(l.subtotal), 'in_stock': l.in_stock,
+                       'price_changed': l.price_changed} for l in self.lines],
+            'count': self.count,
+            'total': str(self.total),
+            'unavailable': self.unavailable,
+        }
+
+
+def cart_version(lines):
+    payload = json.dumps([[slug, line['id'], line['quantity'], line['price']] for slug, line in sorted(lines.items())])
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _price(lines):
+    books = {row[0]: row for row in Book.objects.filter(pk__in=[line['id'] for line in lines.values()])
+             .values_list('id', 'title', 'price', 'stock')}
+    priced, unavailable = [], []
+    for slug, line in lines.items():
+        book = books.get(line['id'])
+        if book is None:
+            unavailable.append(slug)
+            continue
+        _, title, price, stock = book
+        captured = to_paise(str(line['price'])) if line.get('price') is not None else None
+        priced.append(PricedLine(slug, line['id'], title, to_paise(price), int(line['quantity']), stock, captured))
+    return PricedCart(priced, unavailable)
+
+
+def price_cart(cart, fresh=False):
+    """PricedCart for a cart store (see products.cart)."""
+    lines = cart.lines()
+    if not lines:
+        return PricedCart([])
+    memo = getattr(cart, '_priced', None)
+    version = f'{cart_version(lines)}:{catalog_version()}'
+    if not fresh and memo is not None and memo[0] == version:
+        return memo[1]
+    key = f'cart-price:{version}'
+    priced = None if fresh else cache.get(key)
+    if priced is None:
+        priced = _price(lines)
+        cache.set(key, priced, getattr(settings, 'CART_PRICE_CACHE_TTL', 300))
+    cart._priced = (version, priced)
+    return priced
@@ -0,0 +1,174 @@
+"""
+Catalog full-text search.
+
+Postgres and MySQL use the database's native full-text index (created in
+migration 0004). Every other backend -- SQLite in local dev -- uses the
+BookSearchToken inverted index, which products.signals keeps in sync when a
+Book is saved.
+
+All backends share the same query semantics: every term must match and the
+last term is treated as a prefix, so results update sensibly while typing.
+Matches are annotated with ``search_rank`` (higher is better). MySQL doesn't
+index words shorter than SEARCH_MYSQL_MIN_TOKEN_SIZE, so there such terms are
+ignored rather than required (which would match nothing).
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import BooleanField, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Book, BookSearchToken
+
+# field -> weight; also the column order of the MySQL FULLTEXT index
+FIELD_WEIGHTS = {'title': 3, 'author': 2, 'description': 1}
+MAX_TERMS = 8
+TOKEN_MAX_LENGTH = 64
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+NATIVE_VENDORS = ('postgresql', 'mysql')
+
+
+def tokenize(text):
+    """Lower-cased word tokens of ``text`` (truncated to fit the token column)."""
+    return [t[:TOKEN_MAX_LENGTH] for t in _TOKEN_RE.findall((text or '').lower())]
+
+
+def query_terms(q):
+    """Unique search terms of ``q`` in input order, capped at MAX_TERMS."""
+    terms = []
+    for t in tokenize(q):
+        if t not in terms:
+            terms.append(t)
+    return terms[:MAX_TERMS]
+
+
+def uses_native_search(using='default'):
+    return connections[using].vendor in NATIVE_VENDORS
+
+
+# ---- Postgres ----
+def pg_vector_sql(table=''):
+    """
+    tsvector expression over the weighted fields. Migration 0004 builds a GIN
+    index on exactly this expression (unqualified), so keep the two in sync.
+    """
+    prefix = f'"{table}".' if table else ''
+    parts = []
+    for field, label in zip(FIELD_WEIGHTS, 'ABC'):
+        parts.append(f"setweight(to_tsvector('english', coalesce({prefix}\"{field}\", '')), '{label}')")
+    return ' || '.join(parts)
+
+
+def _pg_search(qs, terms):
+    tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+    vector = pg_vector_sql(qs.model._meta.db_table)
+    match = RawSQL(f"({vector}) @@ to_tsquery('english', %s)", [tsquery], output_field=BooleanField())
+    rank = RawSQL(f"ts_rank_cd({vector}, to_tsquery('english', %s))", [tsquery], output_field=FloatField())
+    return qs.filter(match).annotate(search_rank=rank)
+
+
+# ---- MySQL ----
+def _mysql_search(qs, terms):
+    min_size = getattr(settings, 'SEARCH_MYSQL_MIN_TOKEN_SIZE', 3)
+    terms = [t for t in terms if len(t) >= min_size]
+    if not terms:
+        return qs.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    boolean_query = ' '.join([f'+{t}' for t in terms[:-1]] + [f'+{terms[-1]}*'])
+    table = qs.model._meta.db_table
+    columns = ', '.join(f'`{table}`.`{f}`' for f in FIELD_WEIGHTS)
+    expr = f"MATCH({columns}) AGAINST (%s IN BOOLEAN MODE)"
+    return (qs.filter(RawSQL(expr, [boolean_query], output_field=BooleanField()))
+              .annotate(search_rank=RawSQL(expr, [boolean_query], output_field=FloatField())))
+
+
+# ---- Built-in inverted index (SQLite and anything else) ----
+def _term_q(term, prefix=False):
+    if prefix:
+        # range scan instead of LIKE so the (token, book) index is used
+        return Q(token__gte=term, token__lt=term + '\uffff')
+    return Q(token=term)
+
+
+def _fallback_search(qs, terms):
+    matched = Q()
+    for i, term in enumerate(terms):
+        term_q = _term_q(term, prefix=(i == len(terms) - 1))
+        qs = qs.filter(pk__in=BookSearchToken.objects.filter(term_q).values('book_id'))
+        matched |= term_q
+    score = (BookSearchToken.objects.filter(matched, book=OuterRef('pk'))
+             .order_by().values('book').annotate(score=Sum('weight')).values('score'))
+    return qs.annotate(search_rank=Coalesce(Subquery(score, output_field=FloatField()), 0.0))
+
+
+def search_books(queryset, q):
+    """
+    Filter ``queryset`` to books matching ``q`` and annotate ``search_rank``.
+    Results are ordered by relevance; callers may re-order afterwards.
+    An empty query returns the queryset unchanged.
+    """
+    terms = query_terms(q)
+    if not terms:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        qs = _pg_search(queryset, terms)
+    elif vendor == 'mysql':
+        qs = _mysql_search(queryset, terms)
+    else:
+        qs = _fallback_search(queryset, terms)
+    return qs.order_by('-search_rank', 'id')
+
+
+# ---- Index maintenance (built-in backend only) ----
+def book_tokens(book):
+    """Counter of token -> weighted frequency for one book."""
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(book, field, '')):
+            counts[token] += weight
+    return counts
+
+
+def index_book(book, using='default'):
+    """Replace the index rows of ``book``. No-op on native full-text backends."""
+    if uses_native_search(using):
+        return
+    rows = [BookSearchToken(book_id=book.pk, token=t, weight=w) for t, w in book_tokens(book).items()]
+    with transaction.atomic(using=using):
+        BookSearchToken.objects.using(using).filter(book_id=book.pk).delete()
+        BookSearchToken.objects.using(using).bulk_create(rows, batch_size=500)
+
+
+def rebuild_index(using='default', batch_size=1000):
+    """Rebuild the whole built-in index; returns the number of books indexed."""
+    if uses_native_search(using):
+        return 0
+    BookSearchToken.objects.using(using).all().delete()
+    fields = ['id', *FIELD_WEIGHTS]
+    count = 0
+    rows = []
+    for book in Book.objects.using(using).only(*fields).iterator(chunk_size=batch_size):
+        rows.extend(BookSearchToken(book_id=book.pk, token=t, weight=w) for t, w in book_tokens(book).items())
+        count += 1
+        if len(rows) >= batch_size * 10:
+            BookSearchToken.objects.using(using).bulk_create(rows, batch_size=batch_size)
+            rows = []
+    if rows:
+        BookSearchToken.objects.using(using).bulk_create(rows, batch_size=batch_size)
+    return count
+
+
+# ---- DRF ----
+class BookSearchFilter(filters.BaseFilterBackend):
+    """Drop-in replacement for SearchFilter backed by search_books()."""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        q = request.query_params.get(self.search_param, '')
+        return search_books(queryset, q)
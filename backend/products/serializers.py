@@ -1,4 +1,8 @@
-﻿from rest_framework import serializers
+﻿from collections import defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
 from .models import Book, Category
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -13,3 +17,90 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ['id', 'title', 'slug', 'description', 'author', 'price', 'stock', 'categories', 'cover']
+
+
+# ---- Fast read path for list endpoints ----
+# values() columns needed by serialize_book_rows(); output keys follow BookSerializer.Meta.fields
+BOOK_ROW_FIELDS = ['id', 'title', 'slug', 'description', 'author', 'price', 'stock', 'cover']
+
+_price_field = BookSerializer().fields['price']
+
+
+def _cover_url_function(request):
+    """
+    Return name -> URL matching what ImageField.to_representation produces.
+    For the default FileSystemStorage the absolute media prefix is computed
+    once instead of per row.
+    """
+    storage = Book._meta.get_field('cover').storage
+
+    def slow_url(name):
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    # storage may be the lazy default_storage; __class__ is the wrapped class
+    if getattr(storage.__class__, 'url', None) is not FileSystemStorage.url:
+        return slow_url
+
+    base = storage.base_url
+    if request is not None:
+        base = request.build_absolute_uri(base)
+
+    def fast_url(name):
+        if '/./' in name or '/../' in name:
+            return slow_url(name)
+        return base + filepath_to_uri(name).lstrip('/')
+
+    return fast_url
+
+
+def serialize_book_rows(rows, request=None):
+    """
+    Serialize ``values(*BOOK_ROW_FIELDS)`` rows exactly like
+    ``BookSerializer(many=True)``, without building model instances or nested
+    serializers. Categories for all rows are fetched in one query.
+    """
+    ids = [row['id'] for row in rows]
+    categories = defaultdict(list)
+    if ids:
+        links = (Book.categories.through.objects.filter(book_id__in=ids).order_by('category_id')
+                 .values_list('book_id', 'category_id', 'category__name', 'category__slug'))
+        for book_id, category_id, name, slug in links:
+            categories[book_id].append({'id': category_id, 'name': name, 'slug': slug})
+
+    cover_url = _cover_url_function(request)
+    price = _price_field.to_representation
+    return [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'slug': row['slug'],
+            'description': row['description'],
+            'author': row['author'],
+            'price': price(row['price']),
+            'stock': row['stock'],
+            'categories': categories.get(row['id'], []),
+            'cover': cover_url(row['cover']) if row['cover'] else None,
+        }
+        for row in rows
+    ]
+
+
+# ---- Cart ----
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    slug = serializers.SlugField()
+    quantity = serializers.IntegerField(required=False, min_value=0, max_value=999)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add':
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Must be at least 1 when adding.'})
+        elif attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return attrs
+
+
+class CartOperationsSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
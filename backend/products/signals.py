@@ -0,0 +1,87 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete
+from .cache import bump_catalog_version, reset_request_state
+from .cart import cart_switched, merge_anonymous_cart
+from .models import Book, Category
+from .search import FIELD_WEIGHTS, index_book
+
+
+@receiver(post_save, sender=Book)
+def reindex_book(sender, instance, update_fields=None, using='default', raw=False, **kwargs):
+    """Keep the built-in search index in step with the book (rows cascade on delete)."""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index_book(instance, using=using)
+
+
+@receiver(post_delete, sender=Book)
+def drop_from_autocomplete(sender, instance, **kwargs):
+    autocomplete.book_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, using='default', **kwargs):
+    # after commit, so a concurrent request can't cache pre-commit data under the new version
+    transaction.on_commit(bump_catalog_version, using=using)
+
+
+def _touch(books):
+    # update() so the books' own post_save handlers don't run again
+    books.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Book.categories.through)
+def book_categories_changed(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    """A book's categories are part of its representation: touch updated_at and bump the catalog."""
+    books = Book.objects.using(using)
+    if reverse and action == 'pre_clear':
+        _touch(books.filter(categories=instance))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            _touch(books.filter(pk=instance.pk))
+        elif pk_set:
+            _touch(books.filter(pk__in=pk_set))
+        transaction.on_commit(bump_catalog_version, using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, using='default', raw=False, **kwargs):
+    """Renaming or deleting a category changes every book listed under it."""
+    if not raw:
+        _touch(Book.objects.using(using).filter(categories=instance))
+
+
+@receiver(request_started)
+def read_catalog_version_once(sender, **kwargs):
+    # the first catalog_version() of the request reads the row; the rest reuse it
+    reset_request_state(in_request=True)
+
+
+@receiver(request_finished)
+def forget_catalog_version(sender, **kwargs):
+    reset_request_state()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carts survive login: the anonymous cart is folded into the user's."""
+    if request is not None:
+        merge_anonymous_cart(request, user)
+
+
+@receiver(user_logged_out)
+def switch_cart_on_logout(sender, request, user, **kwargs):
+    if request is not None:
+        cart_switched(request)
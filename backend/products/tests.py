@@ -1,3 +1,475 @@
-from django.test import TestCase
+import datetime
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model, login
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from bookbazaar.querybudget import assert_max_queries
+from orders import inventory
+from orders.models import Order
+from . import autocomplete, counting, search
+from .facets import apply_facets
+from .pricing import from_paise, price_cart, to_paise
+from .cache import _book_lru
+from .cart import (DatabaseCartStore, HashCartStore, LocalHashClient, SessionCartStore, _LineBook, _LocalPipeline,
+                   purge_carts)
+from .models import Book, Cart, CatalogVersion, Category
+from .pagination import KeysetPaginator
+from .serializers import BOOK_ROW_FIELDS, BookSerializer, serialize_book_rows
+from .views import _books_with_categories
+
+
+def edit_elsewhere(book, **fields):
+    """
+    Change ``book`` the way another process's save would reach this one:
+    only through the database (the row, then the version bump its on-commit
+    handler writes). Nothing in this process's memory is touched.
+    """
+    Book.objects.filter(pk=book.pk).update(updated_at=timezone.now(), **fields)
+    CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, modified=timezone.now())
+
+
+@override_settings(ANALYTICS_SINK='off')
+class CatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dune', slug='dune', author='Frank Herbert', price=399, stock=5)
+
+    def setUp(self):
+        cache.clear()
+        _book_lru.clear()
+
+
+class ConditionalRequestTests(CatalogTestCase):
+    def test_list_etag_changes_after_edit_in_another_process(self):
+        url = reverse('products:product-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        edit_elsewhere(self.book, title='Dune Messiah')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Dune Messiah')
+
+    def test_api_list_etag_changes_after_edit_in_another_process(self):
+        url = reverse('products_api:api-book-list')
+        etag = self.client.get(url)['ETag']
+
+        edit_elsewhere(self.book, title='Dune Messiah')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Dune Messiah')
+
+    def test_detail_sees_edit_in_another_process(self):
+        url = reverse('products_api:api-book-detail', args=['dune'])
+        etag = self.client.get(url)['ETag']
+
+        edit_elsewhere(self.book, title='Dune Messiah')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Dune Messiah')
+
+    def test_stock_changes_move_the_api_etags(self):
+        urls = [reverse('products_api:api-book-list'), reverse('products_api:api-book-detail', args=['dune'])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+
+        order = Order.objects.create(status=Order.RESERVED, total=1197)
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(order, [(self.book.pk, 3)])
+
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stock'], 2)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.release(order)
+        response = self.client.get(urls[1], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stock'], 5)
+
+
+class AutocompleteTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete._index = None
+
+    def titles(self, prefix):
+        return [r['title'] for r in autocomplete.get_index().query(prefix)]
+
+    def test_picks_up_changes_made_in_another_process(self):
+        gone = Book.objects.create(title='Dracula', slug='dracula', price=199)
+        self.assertEqual(self.titles('d'), ['Dune', 'Dracula'])
+
+        edit_elsewhere(self.book, title='Children of Dune')
+        Book.objects.bulk_create([Book(title='Dubliners', slug='dubliners', price=99, updated_at=timezone.now())])
+        with connection.cursor() as cursor:
+            # a plain DELETE: no post_delete signal reaches this process
+            cursor.execute('DELETE FROM products_booksearchtoken WHERE book_id = %s', [gone.pk])
+            cursor.execute('DELETE FROM products_book WHERE id = %s', [gone.pk])
+
+        self.assertEqual(self.titles('d'), ['Dubliners'])
+        self.assertEqual(self.titles('children'), ['Children of Dune'])
+
+
+class QueryBudgetTests(CatalogTestCase):
+    """The catalog views run a fixed number of queries however many books a page shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        categories = [Category.objects.create(name=f'Genre {i}', slug=f'genre-{i}') for i in range(3)]
+        for i in range(30):
+            book = Book.objects.create(title=f'Book {i}', slug=f'book-{i}', author=f'Author {i}', price=100 + i, stock=3)
+            book.categories.set(categories[:1 + i % 3])
+
+    def test_product_list(self):
+        with assert_max_queries(10):
+            self.assertEqual(self.client.get(reverse('products:product-list')).status_code, 200)
+        with assert_max_queries(10):
+            self.client.get(reverse('products:product-list'), {'q': 'book', 'category': 'genre-1'})
+
+    def test_product_detail(self):
+        with assert_max_queries(3):
+            self.assertEqual(self.client.get(reverse('products:product-detail', args=['book-7'])).status_code, 200)
+
+    def test_api_list_and_detail(self):
+        with assert_max_queries(8):
+            response = self.client.get(reverse('products_api:api-book-list'), {'page_size': 30})
+        self.assertEqual(len(response.json()['results']), 30)
+        with assert_max_queries(4):
+            self.assertEqual(self.client.get(reverse('products_api:api-book-detail', args=['book-7'])).status_code, 200)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    """Walking the cursors visits every book exactly once, in order, both ways."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(12):
+            # repeated prices and some missing dates, so the tiebreaks matter
+            Book.objects.create(title=f'Book {i}', slug=f'book-{i}', price=100 + i % 3, stock=1)
+        Book.objects.filter(slug__in=['book-2', 'book-5', 'book-9']).update(created_at=None)
+
+    def walk_api(self, url, direction='next'):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([book['id'] for book in data['results']])
+            url = data[direction]
+        return pages
+
+    def test_api_walk_has_no_duplicates_or_gaps(self):
+        expected = list(Book.objects.order_by('price', 'id').values_list('id', flat=True))
+        pages = self.walk_api(reverse('products_api:api-book-list') + '?ordering=price&page_size=4')
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        last = reverse('products_api:api-book-list') + '?ordering=price&page_size=4'
+        for _ in range(3):
+            last = self.client.get(last).json()['next']
+        self.assertEqual(self.walk_api(last, 'previous'), pages[::-1])
+
+    def test_nulls_and_descending_order(self):
+        qs = Book.objects.order_by('-created_at')
+        paginator = KeysetPaginator(qs, 5)
+        seen, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            seen += [book.pk for book in page]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        expected = qs.order_by(F('created_at').desc(nulls_last=True), '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(seen[-3:], sorted(Book.objects.filter(created_at=None).values_list('id', flat=True))[::-1])
+
+    def test_bad_cursor_shows_the_first_page(self):
+        first = self.client.get(reverse('products_api:api-book-list'), {'page_size': 4}).json()['results']
+        response = self.client.get(reverse('products_api:api-book-list'), {'page_size': 4, 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], first)
+        self.assertEqual(self.client.get(reverse('products:product-list'), {'cursor': 'garbage'}).status_code, 200)
+
+
+class ResultCountTests(CatalogTestCase):
+    """Counts are exact up to the threshold and the planner's estimate above it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Book.objects.bulk_create([Book(title=f'Book {i}', slug=f'book-{i}', price=100) for i in range(9)])
+
+    def count(self, threshold, estimate=None):
+        with override_settings(RESULT_COUNT_EXACT_THRESHOLD=threshold), \
+                mock.patch.object(counting, 'planner_estimate', return_value=estimate):
+            result = counting.count_results(Book.objects.all(), strategy='estimate')
+        return result.value, result.exact
+
+    def test_exact_at_or_below_the_threshold(self):
+        self.assertEqual(self.count(10, estimate=500), (10, True))
+        self.assertEqual(counting.count_results(Book.objects.all()).value, 10)
+
+    def test_estimated_above_the_threshold(self):
+        self.assertEqual(self.count(9, estimate=500), (500, False))
+        cache.clear()
+        # an estimate below what the bounded count already saw is raised to it
+        self.assertEqual(self.count(9, estimate=3), (10, False))
+        cache.clear()
+        # no planner estimate (SQLite): a plain COUNT
+        self.assertEqual(self.count(9), (10, True))
+
+    def test_counts_are_cached_per_query(self):
+        self.count(9, estimate=500)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(9, estimate=1), (500, False))
+
+    @override_settings(RESULT_COUNT_STRATEGY='estimate', RESULT_COUNT_EXACT_THRESHOLD=4)
+    def test_api_reports_whether_the_count_is_exact(self):
+        with mock.patch.object(counting, 'planner_estimate', return_value=2000):
+            data = self.client.get(reverse('products_api:api-book-list')).json()
+            self.assertEqual((data['count'], data['count_exact']), (2000, False))
+            data = self.client.get(reverse('products_api:api-book-list'), {'search': 'dune'}).json()
+            self.assertEqual((data['count'], data['count_exact']), (1, True))
+
+
+class BookRowSerializationTests(CatalogTestCase):
+    """The list API's values() fast path renders byte for byte what BookSerializer does."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        sf = Category.objects.create(name='SF', slug='sf')
+        classics = Category.objects.create(name='Clàssics', slug='c')
+        cls.book.categories.set([classics, sf])
+        cls.book.cover = 'covers/dune cover.jpg'
+        cls.book.save()
+        Book.objects.create(title='Émile', slug='emile', price=Decimal('12.50'), description='', author='',
+                            cover='covers/sub/../odd ü.png').categories.set([classics])
+        Book.objects.create(title='Free', slug='free', price=0, stock=0)
+
+    def assert_same(self, request):
+        books = _books_with_categories().order_by('id')
+        expected = JSONRenderer().render(BookSerializer(books, many=True, context={'request': request}).data)
+        rows = Book.objects.order_by('id').values(*BOOK_ROW_FIELDS)
+        self.assertEqual(JSONRenderer().render(serialize_book_rows(rows, request)), expected)
+
+    def test_matches_book_serializer(self):
+        self.assert_same(RequestFactory().get('/api/books/api/'))
+        self.assert_same(None)
+
+
+class FacetTests(CatalogTestCase):
+    """Each facet's counts apply every selection except its own."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()    # Dune: 399, no category
+        sf, classics, _ = [Category.objects.create(name=name, slug=name.lower()) for name in ('SF', 'Classics', 'Poetry')]
+        for slug, price, categories in (('a', 150, [sf]), ('b', 300, [sf, classics]), ('c', 700, [classics]),
+                                        ('d', 1200, [])):
+            Book.objects.create(title=slug.upper(), slug=slug, price=price).categories.set(categories)
+
+    def facets(self, query):
+        books, facets = apply_facets(Book.objects.all(), QueryDict(query))
+        categories = {f['slug']: (f['count'], f['selected']) for f in facets['categories']}
+        prices = {f['key']: (f['count'], f['selected']) for f in facets['price']}
+        return sorted(books.values_list('slug', flat=True)), categories, prices
+
+    def test_no_selection(self):
+        books, categories, prices = self.facets('')
+        self.assertEqual(books, ['a', 'b', 'c', 'd', 'dune'])
+        self.assertEqual(categories, {'sf': (2, False), 'classics': (2, False)})
+        self.assertEqual(prices, {'under-200': (1, False), '200-500': (2, False), '500-1000': (1, False),
+                                  '1000-plus': (1, False)})
+
+    def test_counts_with_filters_applied(self):
+        books, categories, prices = self.facets('category=sf&price=200-500&price=500-1000')
+        self.assertEqual(books, ['b'])
+        # categories count within the price selection: b (300), c (700) and dune (399)
+        self.assertEqual(categories, {'sf': (1, True), 'classics': (2, False)})
+        # prices count within the category selection: a (150) and b (300)
+        self.assertEqual(prices, {'under-200': (1, False), '200-500': (1, True), '500-1000': (0, True),
+                                  '1000-plus': (0, False)})
+
+    def test_selected_empty_category_stays_visible(self):
+        books, categories, _ = self.facets('category=poetry&category=classics&price=nonsense')
+        self.assertEqual(books, ['b', 'c'])
+        self.assertEqual(categories, {'sf': (2, False), 'classics': (2, True), 'poetry': (0, True)})
+
+    def test_api_reports_facets_for_a_search(self):
+        data = self.client.get(reverse('products_api:api-book-list'), {'search': 'dune', 'price': '200-500'}).json()
+        self.assertEqual([book['slug'] for book in data['results']], ['dune'])
+        self.assertEqual([(f['key'], f['count']) for f in data['facets']['price'] if f['count']], [('200-500', 1)])
+
+
+class MySQLSearchTests(TestCase):
+    """Words too short for MySQL's full-text index are not required (they would match nothing)."""
+
+    def boolean_query(self, q):
+        qs = search._mysql_search(Book.objects.all(), search.query_terms(q))
+        sql, params = qs.query.sql_with_params()
+        return params[0] if 'AGAINST' in sql else None
+
+    def test_short_terms_are_dropped(self):
+        self.assertEqual(self.boolean_query('dune of arrakis'), '+dune +arrakis*')
+        self.assertEqual(self.boolean_query('dune me'), '+dune*')
+
+    @override_settings(SEARCH_MYSQL_MIN_TOKEN_SIZE=4)
+    def test_only_short_terms_filter_nothing_out(self):
+        self.assertIsNone(self.boolean_query('the sea'))
+
+
+def quantities(cart):
+    return {slug: line['quantity'] for slug, line in cart.lines().items()}
+
+
+class CartStoreTests(CatalogTestCase):
+    """The database and session stores keep the same lines the same way."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.emma = Book.objects.create(title='Emma', slug='emma', price=250, stock=5)
+
+    def session(self):
+        return import_module(settings.SESSION_ENGINE).SessionStore()
+
+    def exercise(self, cart, reload):
+        cart.add(self.book, 2)
+        cart.add(self.book)
+        cart.add(self.emma)
+        self.assertEqual(quantities(reload()), {'dune': 3, 'emma': 1})
+        cart.set_quantity('emma', 4)
+        cart.set_quantity('missing', 4)
+        self.assertEqual(quantities(reload()), {'dune': 3, 'emma': 4})
+        cart.apply([{'op': 'remove', 'slug': 'dune'}, {'op': 'add', 'slug': 'dune', 'quantity': 1},
+                    {'op': 'set', 'slug': 'emma', 'quantity': 0}], {'dune': self.book})
+        self.assertEqual(reload().lines(), {'dune': {'id': self.book.pk, 'title': 'Dune', 'price': 399.0, 'quantity': 1}})
+        cart.clear()
+        self.assertEqual(quantities(reload()), {})
+
+    def test_database_store(self):
+        keys = []
+        cart = DatabaseCartStore(None, on_new_key=keys.append)
+        self.assertEqual(cart.lines(), {})
+        cart.add(self.book)
+        self.assertEqual(len(keys), 1)
+        cart.clear()
+        self.exercise(cart, lambda: DatabaseCartStore(keys[0]))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_session_store(self):
+        session = self.session()
+        self.exercise(SessionCartStore(session), lambda: SessionCartStore(session))
+
+    def test_login_merges_the_anonymous_cart(self):
+        user = get_user_model().objects.create_user('reader', password='pw')
+        DatabaseCartStore(f'user:{user.pk}').add(self.book)
+        anonymous = DatabaseCartStore(None)
+        anonymous.add(self.book, 2)
+        anonymous.add(self.emma)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.CART_COOKIE_NAME] = anonymous.key
+        request.session, request.user = self.session(), AnonymousUser()
+        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+
+        self.assertEqual(quantities(request.cart), {'dune': 3, 'emma': 1})
+        self.assertEqual(list(Cart.objects.values_list('key', flat=True)), [f'user:{user.pk}'])
+
+    def test_idle_anonymous_carts_are_purged(self):
+        long_ago = timezone.now() - datetime.timedelta(days=60)
+        idle, active, user_cart = DatabaseCartStore(None), DatabaseCartStore(None), DatabaseCartStore('user:1')
+        for cart in (idle, active, user_cart):
+            cart.add(self.book)
+        Cart.objects.update(updated_at=long_ago)
+        active.add(self.emma)   # a write refreshes the cart's stamp
+
+        self.assertEqual(purge_carts(), 1)
+        self.assertEqual(set(Cart.objects.values_list('key', flat=True)), {active.key, 'user:1'})
+        self.assertEqual(quantities(DatabaseCartStore(idle.key)), {})
+
+
+class HashCartBatchTests(TestCase):
+    """A batch of cart operations on the kv store is written all at once or not at all."""
+
+    books = {slug: _LineBook(n, slug, slug.title(), 100) for n, slug in enumerate(['dune', 'emma', 'ulysses'])}
+
+    def setUp(self):
+        self.cart = HashCartStore('k', client=LocalHashClient())
+        self.cart.apply([{'op': 'add', 'slug': 'dune', 'quantity': 2}, {'op': 'add', 'slug': 'emma', 'quantity': 1}],
+                        self.books)
+
+    def quantities(self):
+        return {slug: line['quantity'] for slug, line in HashCartStore('k', client=self.cart.client).lines().items()}
+
+    def test_operations_apply_in_order(self):
+        self.cart.apply([
+            {'op': 'add', 'slug': 'dune', 'quantity': 1},
+            {'op': 'remove', 'slug': 'emma'},
+            {'op': 'add', 'slug': 'ulysses', 'quantity': 1},
+            {'op': 'set', 'slug': 'ulysses', 'quantity': 4},
+            {'op': 'set', 'slug': 'emma', 'quantity': 3},
+        ], self.books)
+        self.assertEqual(self.quantities(), {'dune': 3, 'ulysses': 4})
+
+    def test_failed_write_changes_nothing(self):
+        with mock.patch.object(_LocalPipeline, 'execute', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.cart.apply([
+                    {'op': 'remove', 'slug': 'dune'},
+                    {'op': 'add', 'slug': 'ulysses', 'quantity': 1},
+                    {'op': 'set', 'slug': 'emma', 'quantity': 5},
+                ], self.books)
+        self.assertEqual(self.quantities(), {'dune': 2, 'emma': 1})
+
+
+class PricingTests(CatalogTestCase):
+    """Carts are priced in integer paise against the books' current price and stock."""
+
+    def setUp(self):
+        super().setUp()
+        self.cart = HashCartStore('k', client=LocalHashClient())
+
+    def test_paise_round_half_up(self):
+        self.assertEqual([to_paise(v) for v in ('0.005', '19.995', '10.004', Decimal('399'))], [1, 2000, 1000, 39900])
+        self.assertEqual(from_paise(1999), Decimal('19.99'))
+        self.cart.add(Book.objects.create(title='Emma', slug='emma', price=Decimal('33.33'), stock=5), 3)
+        priced = price_cart(self.cart)
+        self.assertEqual((priced.total_paise, priced.total), (9999, Decimal('99.99')))
+
+    def test_reprices_after_a_price_edit(self):
+        self.cart.add(self.book, 2)
+        self.assertEqual(price_cart(self.cart).total_paise, 79800)
+
+        self.book.price = Decimal('450.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        line, = price_cart(self.cart)
+        self.assertEqual((line.unit_paise, line.subtotal_paise, line.price_changed), (45050, 90100, True))
+
+    def test_stock_changes_reach_a_cached_price(self):
+        self.cart.add(self.book, 3)
+        self.assertEqual(price_cart(self.cart).out_of_stock, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(Order.objects.create(status=Order.RESERVED), [(self.book.pk, 4)])
+        self.assertEqual([line.slug for line in price_cart(self.cart).out_of_stock], ['dune'])
@@ -1,9 +1,10 @@
 ﻿from django.urls import path
-from .views import BookListAPIView, BookDetailAPIView, product_list, product_detail
+from .views import BookListAPIView, BookDetailAPIView, book_autocomplete, product_list, product_detail
 
 urlpatterns = [
     # API endpoints (if included under /api/books/)
     path('api/', BookListAPIView.as_view(), name='api-book-list'),
+    path('api/autocomplete/', book_autocomplete, name='api-book-autocomplete'),
     path('api/<slug:slug>/', BookDetailAPIView.as_view(), name='api-book-detail'),
 
     # Frontend pages (mounted under /books/)
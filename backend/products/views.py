@@ -1,118 +1,204 @@
-﻿# Combined API (DRF) + page views + session-based cart views
-from rest_framework import generics, filters
+﻿# Combined API (DRF) + page views + cart views
+from rest_framework import generics, filters, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
-from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Book
-from .serializers import BookSerializer
+from django.views.decorators.http import condition, require_POST
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
+from bookbazaar import metrics
+from bookbazaar.querybudget import query_budget
+from .autocomplete import get_index as autocomplete_index
+from .cart import UnknownBooks, apply_operations, get_cart, summarize
+from .cache import get_cached_book, list_page_cache_key, list_page_cache_ttl, normalize_list_params
+from .conditional import (api_detail_etag, api_list_etag, book_modified, catalog_modified,
+                          product_detail_etag, product_list_etag)
+from .counting import count_results
+from .facets import apply_facets
+from .models import Book, Category
+from .pagination import KeysetPagination, KeysetPaginator, ordering_fields
+from .pricing import price_cart
+from .search import BookSearchFilter, search_books
+from .serializers import (BOOK_ROW_FIELDS, BookSerializer, CartOperationSerializer, CartOperationsSerializer,
+                          serialize_book_rows)
+
+def _books_with_categories():
+    # one query for all categories of the page instead of one per book
+    return Book.objects.prefetch_related(Prefetch('categories', queryset=Category.objects.order_by('id')))
 
 # ---- DRF API views ----
+class BookPagination(KeysetPagination):
+    include_count = True
+
+@method_decorator(condition(etag_func=api_list_etag, last_modified_func=catalog_modified), name='get')
 class BookListAPIView(generics.ListAPIView):
-    queryset = Book.objects.all()
+    queryset = _books_with_categories()
     serializer_class = BookSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'author', 'description']
+    filter_backends = [BookSearchFilter, filters.OrderingFilter]
     ordering_fields = ['price', 'created_at']
+    pagination_class = BookPagination
+    query_budget = 8
+
+    def list(self, request, *args, **kwargs):
+        # fast path: values() rows serialized in one pass (same output as BookSerializer)
+        queryset, facets = apply_facets(self.filter_queryset(self.get_queryset()), request.query_params)
+        extra = [f for f in ordering_fields(queryset) if f not in BOOK_ROW_FIELDS]
+        rows = self.paginate_queryset(queryset.prefetch_related(None).values(*BOOK_ROW_FIELDS, *extra))
+        response = self.get_paginated_response(serialize_book_rows(rows, request))
+        response.data['facets'] = facets
+        return response
 
+@method_decorator(condition(etag_func=api_detail_etag, last_modified_func=book_modified), name='get')
 class BookDetailAPIView(generics.RetrieveAPIView):
-    queryset = Book.objects.all()
+    queryset = _books_with_categories()
     serializer_class = BookSerializer
     lookup_field = 'slug'
+    query_budget = 4
+
+    def get_object(self):
+        book = get_cached_book(self.kwargs[self.lookup_field])
+        if book is None:
+            raise Http404
+        self.check_object_permissions(self.request, book)
+        return book
+
+# catalog version, plus 3 more when this process builds its index (first request)
+@query_budget(4)
+def book_autocomplete(request):
+    q = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+    results = autocomplete_index().query(q, limit) if q.strip() else []
+    return JsonResponse({'query': q, 'results': results})
 
 # ---- Server-rendered page views ----
-def product_list(request):
-    q = request.GET.get('q', '').strip()
+def _product_list_context(params):
+    q = params.get('q', '')
     books_qs = Book.objects.all()
     if q:
-        books_qs = books_qs.filter(Q(title__icontains=q) | Q(author__icontains=q) | Q(description__icontains=q))
+        books_qs = search_books(books_qs, q)
+    books_qs, facets = apply_facets(books_qs, params)
 
-    order = request.GET.get('order', '')
+    order = params.get('order', '')
     if order == 'price_asc':
         books_qs = books_qs.order_by('price')
     elif order == 'price_desc':
         books_qs = books_qs.order_by('-price')
+    elif order == 'newest':
+        books_qs = books_qs.order_by('-created_at')
 
-    page = request.GET.get('page', 1)
-    paginator = Paginator(books_qs, 9)
-    try:
-        books = paginator.get_page(page)
-    except:
-        books = paginator.get_page(1)
+    # keyset pagination: an id tiebreak is added to the ordering above
+    paginator = KeysetPaginator(books_qs, 9)
+    books = paginator.get_page(params.get('cursor'))
 
-    context = {
+    return {
         'books': books,
-        'q': q,
-        'paginator': paginator,
+        'params': params,
+        'facets': facets,
+        'result_count': count_results(books_qs),
+    }
+
+@query_budget(10)
+@condition(etag_func=product_list_etag, last_modified_func=catalog_modified)
+def product_list(request):
+    params = normalize_list_params(request.GET)
+    # the results fragment only depends on the list params and the catalog,
+    # so it is cached under the catalog version until the catalog changes
+    key = list_page_cache_key(params)
+    results_html = cache.get(key)
+    if results_html is None:
+        metrics.incr('catalog.list_cache.miss')
+        results_html = render_to_string('products/_product_results.html', _product_list_context(params), request=request)
+        cache.set(key, results_html, list_page_cache_ttl())
+    else:
+        metrics.incr('catalog.list_cache.hit')
+
+    context = {
+        'q': params.get('q', ''),
+        'order': params.get('order', ''),
+        'results_html': mark_safe(results_html),
     }
-    return render(request, 'products/product_list.html', context)
+    response = render(request, 'products/product_list.html', context)
+    # the page is the same for every visitor (the cart badge is filled in client-side)
+    max_age = getattr(settings, 'CATALOG_PAGE_MAX_AGE', 0)
+    if max_age:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
 
+@query_budget(3)
+@condition(etag_func=product_detail_etag, last_modified_func=book_modified)
 def product_detail(request, slug):
-    book = get_object_or_404(Book, slug=slug)
+    book = get_cached_book(slug)
+    if book is None:
+        raise Http404('No Book matches the given query.')
     return render(request, 'products/product_detail.html', {'book': book})
 
-# ---- Session-based cart helpers ----
-def _get_cart(session):
-    return session.get('cart', {})
+# ---- Cart views ----
+class CartAPIView(APIView):
+    """
+    GET: the priced cart (products.pricing). POST {"operations": [{"op":
+    "add"|"set"|"remove", "slug": ..., "quantity": n}, ...]}: apply all
+    operations (all or nothing) and return the updated priced cart.
+    """
+    query_budget = 12
 
-def _save_cart(session, cart):
-    session['cart'] = cart
-    session.modified = True
+    def get(self, request):
+        return Response(price_cart(get_cart(request)).as_dict())
+
+    def post(self, request):
+        serializer = CartOperationsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = get_cart(request)
+        try:
+            apply_operations(cart, serializer.validated_data['operations'])
+        except UnknownBooks as exc:
+            return Response({'detail': str(exc), 'unknown': exc.slugs}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(price_cart(cart).as_dict())
+
+@query_budget(4)
+def cart_summary(request):
+    """Line count and quantity; also (re)sets the summary cookie via CartMiddleware."""
+    lines, quantity = summarize(get_cart(request).lines())
+    return JsonResponse({'lines': lines, 'count': quantity})
+
+def _cart_form(request, op, default_next):
+    """The form views below: one operation through the same path as CartAPIView, then redirect."""
+    data = {'op': op, 'slug': request.POST.get('slug', '')}
+    if request.POST.get('quantity'):
+        data['quantity'] = request.POST['quantity']
+    elif op == 'set':
+        data['quantity'] = 0
+    serializer = CartOperationSerializer(data=data)
+    if not serializer.is_valid():
+        return HttpResponseBadRequest('Invalid cart update.')
+    try:
+        apply_operations(get_cart(request), [serializer.validated_data])
+    except UnknownBooks:
+        raise Http404('No Book matches the given query.')
+    return redirect(request.POST.get('next', default_next))
 
-# ---- Cart views ----
 @require_POST
 def add_to_cart(request):
-    slug = request.POST.get('slug')
-    qty = int(request.POST.get('quantity', 1))
-    book = get_object_or_404(Book, slug=slug)
-
-    cart = _get_cart(request.session)
-    item = cart.get(slug)
-    if item:
-        item['quantity'] = item.get('quantity', 0) + qty
-    else:
-        cart[slug] = {
-            'id': book.id,
-            'title': book.title,
-            'price': float(book.price),
-            'quantity': qty
-        }
-    _save_cart(request.session, cart)
     # default redirect to product list (namespaced)
-    return redirect(request.POST.get('next', reverse('products:product-list')))
+    return _cart_form(request, 'add', reverse('products:product-list'))
 
 @require_POST
 def update_cart(request):
-    slug = request.POST.get('slug')
-    qty = int(request.POST.get('quantity', 0))
-    cart = _get_cart(request.session)
-    if slug in cart:
-        if qty > 0:
-            cart[slug]['quantity'] = qty
-        else:
-            cart.pop(slug, None)
-    _save_cart(request.session, cart)
-    # default redirect to cart (namespaced)
-    return redirect(request.POST.get('next', reverse('product_cart:cart')))
+    return _cart_form(request, 'set', reverse('product_cart:cart'))
 
 @require_POST
 def remove_from_cart(request):
-    slug = request.POST.get('slug')
-    cart = _get_cart(request.session)
-    if slug in cart:
-        cart.pop(slug, None)
-    _save_cart(request.session, cart)
-    return redirect(request.POST.get('next', reverse('product_cart:cart')))
+    return _cart_form(request, 'remove', reverse('product_cart:cart'))
 
 def cart_view(request):
-    cart = _get_cart(request.session)
-    items = []
-    total = 0.0
-    for slug, data in cart.items():
-        qty = int(data.get('quantity', 0))
-        price = float(data.get('price', 0.0))
-        subtotal = qty * price
-        items.append({'slug': slug, 'title': data.get('title'), 'price': price, 'quantity': qty, 'subtotal': subtotal})
-        total += subtotal
-    return render(request, 'cart.html', {'items': items, 'total': total})
+    cart = price_cart(get_cart(request))
+    return render(request, 'cart.html', {'items': cart.lines, 'total': cart.total, 'cart': cart})